@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark KafkaToolProtocol.encode_offset_commit_request_kafka against
+the previous encoder, which joined a list of packed fragments.
+
+Usage: python benchmarks/encode_offset_commit_request.py [--topics N]
+    [--partitions N] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import struct
+import timeit
+
+from kafka.common import OffsetCommitRequest
+from kafka.protocol import KafkaProtocol
+from kafka.util import group_by_topic_and_partition
+from kafka.util import write_short_string
+
+from kafka_utils.util.protocol import KafkaToolProtocol
+
+
+def legacy_encode_offset_commit_request_kafka(client_id, correlation_id,
+                                              group, payloads):
+    grouped_payloads = group_by_topic_and_partition(payloads)
+
+    message = []
+    message.append(KafkaProtocol._encode_message_header(
+        client_id, correlation_id,
+        KafkaProtocol.OFFSET_COMMIT_KEY,
+        version=2))
+    message.append(write_short_string(group))
+    message.append(struct.pack('>i', -1))   # ConsumerGroupGenerationId
+    message.append(write_short_string(''))  # ConsumerId
+    message.append(struct.pack('>q', -1))   # Retention time
+    message.append(struct.pack('>i', len(grouped_payloads)))
+
+    for topic, topic_payloads in grouped_payloads.items():
+        message.append(write_short_string(topic))
+        message.append(struct.pack('>i', len(topic_payloads)))
+
+        for partition, payload in topic_payloads.items():
+            message.append(struct.pack('>iq', partition, payload.offset))
+            message.append(write_short_string(payload.metadata))
+
+    msg = b''.join(message)
+    return struct.pack('>i%ds' % len(msg), len(msg), msg)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--partitions', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    payloads = [
+        OffsetCommitRequest(
+            'topic_{0}'.format(topic).encode('utf-8'),
+            partition,
+            123456789,
+            None,
+        )
+        for topic in range(args.topics)
+        for partition in range(args.partitions)
+    ]
+    encoders = [
+        ('legacy', legacy_encode_offset_commit_request_kafka),
+        ('preallocated', KafkaToolProtocol.encode_offset_commit_request_kafka),
+    ]
+
+    assert bytes(encoders[0][1](b'client', 1, b'group', payloads)) == \
+        bytes(encoders[1][1](b'client', 1, b'group', payloads))
+
+    print('{0} partitions, best of {1} runs'.format(len(payloads), args.repeat))
+    for name, encoder in encoders:
+        best = min(timeit.repeat(
+            lambda: encoder(b'client', 1, b'group', payloads),
+            repeat=args.repeat,
+            number=1,
+        ))
+        print('{0:>15}: {1:.2f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark KafkaGroupReader.parse_consumer_offset_message against the
+previous parser, which copied key and value into bytearrays, over a
+synthetic __consumer_offsets log.
+
+Usage: python benchmarks/parse_consumer_offset_message.py [--groups N]
+    [--topics N] [--partitions N] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import struct
+import timeit
+
+from kafka.common import KafkaMessage
+from kafka.util import read_short_string
+from kafka.util import relative_unpack
+
+from kafka_utils.kafka_consumer_manager.util import InvalidMessageException
+from kafka_utils.kafka_consumer_manager.util import KafkaGroupReader
+
+
+def legacy_parse_consumer_offset_message(message):
+    key = bytearray(message.key)
+    ((key_schema,), cur) = relative_unpack(b'>h', key, 0)
+    if key_schema not in [0, 1]:
+        raise InvalidMessageException()
+    (group, cur) = read_short_string(key, cur)
+    (topic, cur) = read_short_string(key, cur)
+    ((partition,), cur) = relative_unpack(b'>l', key, cur)
+    if message.value:
+        value = bytearray(message.value)
+        ((value_schema,), cur) = relative_unpack(b'>h', value, 0)
+        if value_schema not in [0, 1]:
+            raise InvalidMessageException()
+        ((offset,), cur) = relative_unpack(b'>q', value, cur)
+    else:
+        offset = None
+    return str(group), str(topic), partition, offset
+
+
+def offset_commit_message(offset, group, topic, partition, value_offset):
+    key = b''.join([
+        struct.pack(b'>h', 1),
+        struct.pack(b'>h', len(group)), group,
+        struct.pack(b'>h', len(topic)), topic,
+        struct.pack(b'>l', partition),
+    ])
+    value = b''.join([
+        struct.pack(b'>hq', 1, value_offset),
+        struct.pack(b'>h', 0),  # Metadata
+        struct.pack(b'>qq', 1500000000000, 1500086400000),  # Timestamps
+    ])
+    return KafkaMessage(b'__consumer_offsets', 0, offset, key, value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--topics', type=int, default=10)
+    parser.add_argument('--partitions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    messages = [
+        offset_commit_message(
+            offset,
+            'consumer_group_{0}'.format(offset % args.groups).encode('utf-8'),
+            'topic_{0}'.format(offset % args.topics).encode('utf-8'),
+            offset % args.partitions,
+            offset,
+        )
+        for offset in range(args.groups * args.topics * args.partitions)
+    ]
+    reader = KafkaGroupReader(None)
+    parsers = [
+        ('legacy', legacy_parse_consumer_offset_message),
+        ('struct', reader.parse_consumer_offset_message),
+    ]
+
+    assert [parsers[0][1](message) for message in messages] == \
+        [parsers[1][1](message) for message in messages]
+
+    print('{0} messages, best of {1} runs'.format(len(messages), args.repeat))
+    for name, parser in parsers:
+        best = min(timeit.repeat(
+            lambda: [parser(message) for message in messages],
+            repeat=args.repeat,
+            number=1,
+        ))
+        print('{0:>15}: {1:.2f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,7 @@ from collections import OrderedDict
 import kafka_utils.kafka_cluster_manager.cluster_info.stats as stats
 from kafka_utils.kafka_cluster_manager.cluster_info.cluster_topology \
     import ClusterTopology
+from kafka_utils.util.reassignment import format_progress
 from kafka_utils.util.validation import assignment_to_plan
 _log = logging.getLogger('kafka-cluster-manager')
 
@@ -432,6 +433,31 @@ def display_assignment_changes(plan_details, to_log=True):
         _log_or_display(to_log, row)
 
 
+def display_reassignment_status(status):
+    """Display the progress of a partitions reassignment and its
+    stragglers.
+
+    :param status: ReassignmentStatus
+    """
+    print(format_progress(status))
+    if status.stragglers:
+        print('')
+        display_table(
+            ['Topic', 'Partition', 'Size', 'Replicas', 'ISR', 'Missing'],
+            [
+                [
+                    progress.topic,
+                    progress.partition,
+                    progress.size,
+                    progress.replicas,
+                    progress.isr,
+                    progress.missing,
+                ]
+                for progress in status.stragglers
+            ],
+        )
+
+
 def _log_or_display(to_log, msg):
     """Log or display the information."""
     if to_log:
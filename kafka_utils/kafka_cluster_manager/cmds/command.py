@@ -19,6 +19,9 @@ from collections import defaultdict
 
 from kafka_utils.kafka_cluster_manager. \
     cluster_info.cluster_topology import ClusterTopology
+from kafka_utils.util.reassignment import format_progress
+from kafka_utils.util.reassignment import ReassignmentExecutor
+from kafka_utils.util.reassignment import ReassignmentMonitor
 from kafka_utils.util.validation import assignment_to_plan
 from kafka_utils.util.zookeeper import ZK
 
@@ -34,6 +37,7 @@ class ClusterManagerCmd(object):
         self.cluster_config = None
         self.args = None
         self.zk = None
+        self.partition_measurer = None
 
     def build_subparser(self, subparsers):
         """Build the command subparser.
@@ -76,6 +80,7 @@ class ClusterManagerCmd(object):
                 assignment,
                 args,
             )
+            self.partition_measurer = pm
             ct = ClusterTopology(
                 assignment,
                 brokers,
@@ -86,8 +91,9 @@ class ClusterManagerCmd(object):
                 self.log.info("The cluster is empty. No actions to perform.")
                 return
 
-            # Exit if there is an on-going reassignment
-            if self.is_reassignment_pending():
+            # Exit if there is an on-going reassignment. A checkpointed
+            # execution waits for it to complete and then resumes.
+            if self.is_reassignment_pending() and not self.args.checkpoint_file:
                 self.log.error('Previous reassignment pending.')
                 sys.exit(1)
 
@@ -99,7 +105,20 @@ class ClusterManagerCmd(object):
     def execute_plan(self, plan, allow_rf_change=False):
         """Save proposed-plan and execute the same if requested."""
         if self.should_execute():
-            result = self.zk.execute_plan(plan, allow_rf_change=allow_rf_change)
+            limits = (self.args.batch_max_movements, self.args.batch_max_size)
+            if self.args.checkpoint_file or any(limit is not None for limit in limits):
+                executor = ReassignmentExecutor(
+                    self.zk,
+                    max_movements=self.args.batch_max_movements,
+                    checkpoint_file=self.args.checkpoint_file,
+                    get_size=self.partition_measurer.get_size,
+                    max_batch_size=self.args.batch_max_size,
+                    max_broker_size=self.args.batch_max_broker_size,
+                    throughput=self.args.replication_throughput,
+                )
+                result = executor.execute(plan, allow_rf_change=allow_rf_change)
+            else:
+                result = self.zk.execute_plan(plan, allow_rf_change=allow_rf_change)
             if not result:
                 self.log.error('Plan execution unsuccessful.')
                 sys.exit(1)
@@ -107,9 +126,17 @@ class ClusterManagerCmd(object):
                 self.log.info(
                     'Plan sent to zookeeper for reassignment successfully.',
                 )
+                if self.args.wait:
+                    self.wait_for_reassignment()
         else:
             self.log.info('Proposed plan won\'t be executed.')
 
+    def wait_for_reassignment(self):
+        """Block until no reassignment is pending, logging its progress."""
+        monitor = ReassignmentMonitor(self.zk, self.partition_measurer.get_size)
+        for status in monitor.watch():
+            self.log.info('Reassignment progress: %s', format_progress(status))
+
     def should_execute(self):
         """Confirm if proposed-plan should be executed."""
         return self.args.apply and (self.args.no_confirm or self.confirm_execution())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import print_function
+
+import logging
+
+from .command import ClusterManagerCmd
+from kafka_utils.kafka_cluster_manager.cluster_info.display import \
+    display_reassignment_status
+from kafka_utils.util import positive_int
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.reassignment import DEFAULT_MAX_STRAGGLERS
+from kafka_utils.util.reassignment import DEFAULT_POLL_INTERVAL
+from kafka_utils.util.reassignment import ReassignmentMonitor
+from kafka_utils.util.zookeeper import ZK
+
+
+class ReassignmentStatusCmd(ClusterManagerCmd):
+
+    def __init__(self):
+        super(ReassignmentStatusCmd, self).__init__()
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def build_subparser(self, subparsers):
+        subparser = subparsers.add_parser(
+            'reassignment-status',
+            description='Show the progress of the on-going partitions '
+            'reassignment.',
+            help='This command is used to track the partitions in the '
+            'reassignment queue. It reports the percentage completed, the '
+            'throughput of the completed partitions, the estimated time to '
+            'completion and the partitions whose replicas are furthest from '
+            'the ISR. Use --wait to keep reporting until completion. This '
+            'command will not mutate the cluster\'s state.',
+        )
+        subparser.add_argument(
+            '--poll-interval',
+            type=positive_nonzero_int,
+            default=DEFAULT_POLL_INTERVAL,
+            help='Maximum number of seconds between two reports with --wait. '
+            'Default: %(default)s',
+        )
+        subparser.add_argument(
+            '--stragglers',
+            type=positive_int,
+            default=DEFAULT_MAX_STRAGGLERS,
+            help='Maximum number of in-flight partitions displayed. '
+            'Default: %(default)s',
+        )
+        return subparser
+
+    def run(
+            self,
+            cluster_config,
+            rg_parser,
+            partition_measurer,
+            cluster_balancer,
+            args,
+    ):
+        """The status is reported while a reassignment is pending, so the
+        cluster topology is not needed and run_command is not used.
+        """
+        self.cluster_config = cluster_config
+        self.args = args
+        with ZK(self.cluster_config) as self.zk:
+            self.partition_measurer = partition_measurer(
+                self.cluster_config,
+                self.zk.get_brokers(),
+                self.zk.get_cluster_assignment(),
+                args,
+            )
+            monitor = ReassignmentMonitor(
+                self.zk,
+                self.partition_measurer.get_size,
+            )
+            if args.wait:
+                statuses = monitor.watch(args.poll_interval, args.stragglers)
+            else:
+                statuses = [monitor.poll(args.stragglers)]
+            for status in statuses:
+                display_reassignment_status(status)
+                print('')
@@ -38,6 +38,8 @@ from kafka_utils.kafka_cluster_manager.cluster_info.replication_group_parser \
 from kafka_utils.kafka_cluster_manager.cluster_info.replication_group_parser \
     import ReplicationGroupParser
 from kafka_utils.kafka_cluster_manager.cmds.decommission import DecommissionCmd
+from kafka_utils.kafka_cluster_manager.cmds.reassignment_status \
+    import ReassignmentStatusCmd
 from kafka_utils.kafka_cluster_manager.cmds.rebalance import RebalanceCmd
 from kafka_utils.kafka_cluster_manager.cmds.replace import ReplaceBrokerCmd
 from kafka_utils.kafka_cluster_manager.cmds.set_replication_factor import SetReplicationFactorCmd
@@ -45,6 +47,9 @@ from kafka_utils.kafka_cluster_manager.cmds.stats import StatsCmd
 from kafka_utils.kafka_cluster_manager.cmds.store_assignments \
     import StoreAssignmentsCmd
 from kafka_utils.util import config
+from kafka_utils.util import positive_nonzero_float
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.zookeeper import session_registry
 
 
 _log = logging.getLogger()
@@ -117,6 +122,52 @@ def parse_args():
         help='Proposed-plan will be executed without confirmation.'
              ' --apply flag also required.',
     )
+    parser.add_argument(
+        '--wait',
+        action='store_true',
+        help='Wait for the reassignment to complete, reporting its progress. '
+        'Applies to --apply and to reassignment-status.',
+    )
+    parser.add_argument(
+        '--batch-max-movements',
+        type=positive_nonzero_int,
+        help='Execute the proposed-plan in batches of at most this many '
+        'replica movements. Each batch is submitted only after the previous '
+        'one completed. --apply flag also required. Default: submit the '
+        'whole plan at once.',
+    )
+    parser.add_argument(
+        '--batch-max-size',
+        type=positive_nonzero_float,
+        help='Execute the proposed-plan in batches copying at most this total '
+        'partition size. Partitions are scheduled largest first. The size '
+        'unit depends on the selected PartitionMeasurer implementation. '
+        '--apply flag also required.',
+    )
+    parser.add_argument(
+        '--batch-max-broker-size',
+        type=positive_nonzero_float,
+        help='Maximum partition size copied to or from a single broker in a '
+        'batch. Spreads the movements of a batch across the brokers. Requires '
+        '--batch-max-size.',
+    )
+    parser.add_argument(
+        '--replication-throughput',
+        type=positive_nonzero_float,
+        help='Replication throughput of a broker, in PartitionMeasurer size '
+        'units per second. Used to report the estimated completion time of '
+        'a batched execution, requires --batch-max-movements, '
+        '--batch-max-size or --checkpoint-file.',
+    )
+    parser.add_argument(
+        '--checkpoint-file',
+        metavar='<checkpoint-file-path>',
+        type=str,
+        help='Record the completed partitions of a batched execution in this '
+        'file. Re-running the same plan with the same file resumes the '
+        'execution, waiting for a batch left in progress to complete. '
+        'Implies batched execution.',
+    )
     parser.add_argument(
         '--write-to-file',
         dest='proposed_plan_file',
@@ -190,8 +241,20 @@ def parse_args():
     StoreAssignmentsCmd().add_subparser(subparsers)
     ReplaceBrokerCmd().add_subparser(subparsers)
     SetReplicationFactorCmd().add_subparser(subparsers)
+    ReassignmentStatusCmd().add_subparser(subparsers)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.batch_max_broker_size and not args.batch_max_size:
+        parser.error('--batch-max-broker-size requires --batch-max-size.')
+    batched = any(
+        (args.batch_max_movements, args.batch_max_size, args.checkpoint_file),
+    )
+    if args.replication_throughput and not batched:
+        parser.error(
+            '--replication-throughput requires --batch-max-movements, '
+            '--batch-max-size or --checkpoint-file.'
+        )
+    return args
 
 
 def configure_logging(log_conf=None):
@@ -240,10 +303,12 @@ def run():
     else:
         cluster_balancer = PartitionCountBalancer
 
-    args.command(
-        cluster_config,
-        rg_parser,
-        partition_measurer,
-        cluster_balancer,
-        args,
-    )
+    # Share a single zookeeper session across the whole command
+    with session_registry.hold():
+        args.command(
+            cluster_config,
+            rg_parser,
+            partition_measurer,
+            cluster_balancer,
+            args,
+        )
@@ -21,6 +21,7 @@ import sys
 from kazoo.exceptions import NoNodeError
 
 from .offset_manager import OffsetManagerBase
+from kafka_utils.kafka_consumer_manager.util import copy_offsets_kafka
 from kafka_utils.kafka_consumer_manager.util import create_offsets
 from kafka_utils.kafka_consumer_manager.util import fetch_offsets
 from kafka_utils.kafka_consumer_manager.util import preprocess_topics
@@ -57,6 +58,13 @@ class CopyGroup(OffsetManagerBase):
             "specified, offsets from all partitions of the topic shall "
             "be copied.",
         )
+        parser_copy_group.add_argument(
+            '--storage', choices=['zookeeper', 'kafka'],
+            help="String describing where the offsets are stored. With kafka "
+            "the offsets are copied with one batched commit request. "
+            "Default: %(default)s",
+            default='zookeeper',
+        )
         parser_copy_group.set_defaults(command=cls.run)
 
     @classmethod
@@ -76,7 +84,26 @@ class CopyGroup(OffsetManagerBase):
             args.partitions,
             cluster_config,
             client,
+            storage=args.storage,
         )
+        if args.storage == 'kafka':
+            preprocess_topics(
+                args.source_groupid,
+                source_topics.keys(),
+                args.dest_groupid,
+                cls.get_topics_from_consumer_group_id(
+                    cluster_config,
+                    args.dest_groupid,
+                    storage='kafka',
+                ),
+            )
+            copy_offsets_kafka(
+                client,
+                args.source_groupid,
+                args.dest_groupid,
+                source_topics,
+            )
+            return
         with ZK(cluster_config) as zk:
             try:
                 topics_dest_group = zk.get_children(
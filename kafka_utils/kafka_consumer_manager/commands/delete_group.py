@@ -38,9 +38,9 @@ class DeleteGroup(OffsetWriter):
             "-h", "--help", action="help",
             help="Show this help message and exit."
         )
-        parser_delete_group.add_argument(
-            'groupid',
-            help="Consumer Group IDs whose metadata shall be deleted."
+        cls.add_groups_arguments(
+            parser_delete_group,
+            "Consumer Group IDs whose metadata shall be deleted.",
         )
         parser_delete_group.add_argument(
             '--storage', choices=['zookeeper', 'kafka'],
@@ -54,6 +54,20 @@ class DeleteGroup(OffsetWriter):
         client = KafkaToolClient(cluster_config.broker_list)
         client.load_metadata_for_topics()
 
+        if args.groupid is None:
+            def delete_group(client, group, topics_dict):
+                if args.storage == 'kafka':
+                    return cls.delete_group_kafka(client, group, topics_dict)
+                cls.delete_group_zk(cluster_config, group)
+            cls.run_bulk(
+                args,
+                cluster_config,
+                client,
+                delete_group,
+                storage=args.storage,
+            )
+            return
+
         topics_dict = cls.preprocess_args(
             args.groupid, None, None, cluster_config, client
         )
@@ -77,7 +91,7 @@ class DeleteGroup(OffsetWriter):
     @classmethod
     def delete_group_kafka(cls, client, group, topics):
         new_offsets = nullify_offsets(topics)
-        set_consumer_offsets(
+        return set_consumer_offsets(
             client,
             group,
             new_offsets,
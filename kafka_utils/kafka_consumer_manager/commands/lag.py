@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+
+from .offset_manager import OffsetManagerBase
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.monitoring import DEFAULT_OFFSETS_WORKERS
+from kafka_utils.util.monitoring import get_groups_offsets_metadata
+from kafka_utils.util.monitoring import watermark_cache
+
+
+ROW_FORMAT = '{group:<40} {topic:<40} {partitions:>10} {lag:>15} {max_lag:>15}'
+
+
+class Lag(OffsetManagerBase):
+
+    @classmethod
+    def setup_subparser(cls, subparsers):
+        parser_lag = subparsers.add_parser(
+            "lag",
+            description="Get the lag of many consumer groups at once, per "
+            "group and topic.",
+            add_help=False
+        )
+        parser_lag.add_argument(
+            "-h", "--help", action="help",
+            help="Show this help message and exit."
+        )
+        parser_lag.add_argument(
+            'groupids', nargs='*',
+            help="Consumer Group IDs whose lag shall be fetched."
+        )
+        parser_lag.add_argument(
+            '--all-groups', action='store_true',
+            help="Fetch the lag of all the consumer groups of the cluster."
+        )
+        parser_lag.add_argument(
+            '--storage', choices=['zookeeper', 'kafka', 'dual'],
+            help="String describing where to fetch the committed offsets.",
+            default='dual'
+        )
+        parser_lag.add_argument(
+            '--workers', type=positive_nonzero_int,
+            default=DEFAULT_OFFSETS_WORKERS,
+            help="Number of consumer groups whose offsets are fetched "
+            "concurrently. Default: %(default)s",
+        )
+        parser_lag.set_defaults(command=cls.run)
+
+    @classmethod
+    def run(cls, args, cluster_config):
+        if bool(args.groupids) == args.all_groups:
+            print(
+                "Error: Either consumer group ids or --all-groups must be "
+                "specified.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        groups_topics = cls.get_groups_topics(
+            cluster_config,
+            args.groupids or None,
+            args.storage,
+        )
+
+        # Setup the Kafka client
+        client = KafkaToolClient(cluster_config.broker_list)
+        print(ROW_FORMAT.format(
+            group='Group',
+            topic='Topic',
+            partitions='Partitions',
+            lag='Lag',
+            max_lag='Max lag',
+        ))
+        try:
+            for group, offsets in get_groups_offsets_metadata(
+                client,
+                sorted(groups_topics.iteritems()),
+                offset_storage=args.storage,
+                watermark_cache=watermark_cache,
+                metadata_token=client.metadata_token,
+                workers=args.workers,
+            ):
+                cls.print_group_lag(group, offsets)
+        finally:
+            client.close()
+
+    @classmethod
+    def print_group_lag(cls, group, offsets):
+        for topic, partitions in sorted(offsets.iteritems()):
+            lags = [
+                max(partition.highmark - partition.current, 0)
+                for partition in partitions
+            ]
+            print(ROW_FORMAT.format(
+                group=group,
+                topic=topic,
+                partitions=len(partitions),
+                lag=sum(lags),
+                max_lag=max(lags) if lags else 0,
+            ))
+        # Stream the report while the next groups are fetched
+        sys.stdout.flush()
@@ -20,7 +20,11 @@ import sys
 from kazoo.exceptions import NoNodeError
 
 from .offset_manager import OffsetManagerBase
+from kafka_utils.kafka_consumer_manager.util import groups_index
 from kafka_utils.kafka_consumer_manager.util import KafkaGroupReader
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.monitoring import DEFAULT_OFFSETS_WORKERS
+from kafka_utils.util.monitoring import watermark_cache
 from kafka_utils.util.zookeeper import ZK
 
 
@@ -39,6 +43,12 @@ class ListGroups(OffsetManagerBase):
             help="String describing where to fetch the committed offsets.",
             default='dual'
         )
+        parser_list_groups.add_argument(
+            '--workers', type=positive_nonzero_int,
+            default=DEFAULT_OFFSETS_WORKERS,
+            help="Number of consumers reading the offsets topic concurrently, "
+            "each from a shard of its partitions. Default: %(default)s",
+        )
         parser_list_groups.set_defaults(command=cls.run)
 
     @classmethod
@@ -54,9 +64,14 @@ class ListGroups(OffsetManagerBase):
                 )
 
     @classmethod
-    def get_kafka_groups(cls, cluster_config):
+    def get_kafka_groups(cls, cluster_config, workers=1):
         '''Get the group_id of groups committed into Kafka.'''
-        kafka_group_reader = KafkaGroupReader(cluster_config)
+        kafka_group_reader = KafkaGroupReader(
+            cluster_config,
+            watermark_cache,
+            groups_index,
+            workers=workers,
+        )
         try:
             return kafka_group_reader.read_groups().keys()
         except:
@@ -89,7 +104,7 @@ class ListGroups(OffsetManagerBase):
                 groups.update(zk_groups)
 
         if args.storage in ('dual', 'kafka'):
-            kafka_groups = cls.get_kafka_groups(cluster_config)
+            kafka_groups = cls.get_kafka_groups(cluster_config, args.workers)
             if kafka_groups:
                 groups.update(kafka_groups)
 
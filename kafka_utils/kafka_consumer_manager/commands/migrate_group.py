@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+from bisect import bisect_right
+from collections import defaultdict
+
+from kafka.common import KafkaError
+
+from .offset_manager import OffsetManagerBase
+from .offset_set_timestamp import OffsetSetTimestamp
+from kafka_utils.util.client import imap_with_client_copies
+from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.config import get_cluster_config
+from kafka_utils.util.error import ConfigurationError
+from kafka_utils.util.error import KafkaToolError
+from kafka_utils.util.error import OffsetTranslationError
+from kafka_utils.util.offsets import get_current_consumer_offsets
+from kafka_utils.util.offsets import get_offsets_for_times
+from kafka_utils.util.offsets import get_topics_watermarks
+from kafka_utils.util.offsets import set_consumer_offsets
+
+
+ROW_FORMAT = '{group:<40} {topic:<40} {partition:>9} {source:>15} {dest:>15}'
+
+
+class MigrateGroup(OffsetManagerBase):
+
+    @classmethod
+    def setup_subparser(cls, subparsers):
+        parser_migrate_group = subparsers.add_parser(
+            "migrate_group",
+            description="Translate the offsets of consumer groups to another "
+            "cluster, whose topics are mirrored from this cluster, and commit "
+            "them there. Offsets are translated either by time or with an "
+            "offset mapping table.",
+            add_help=False
+        )
+        parser_migrate_group.add_argument(
+            "-h", "--help", action="help",
+            help="Show this help message and exit."
+        )
+        cls.add_groups_arguments(
+            parser_migrate_group,
+            "Consumer Group ID whose offsets shall be migrated.",
+        )
+        parser_migrate_group.add_argument(
+            '--dest-cluster-name', required=True,
+            help="Name of the cluster the groups are migrated to.",
+        )
+        parser_migrate_group.add_argument(
+            '--dest-cluster-type',
+            help="Type of the cluster the groups are migrated to. Default: "
+            "the type of the source cluster.",
+        )
+        translation = parser_migrate_group.add_mutually_exclusive_group(
+            required=True,
+        )
+        translation.add_argument(
+            '--timestamp', type=OffsetSetTimestamp.timestamp,
+            help="Milliseconds since epoch or UTC datetime in the format "
+            "YYYY-MM-DDTHH:MM:SS. The groups are moved to the offsets of "
+            "the destination cluster at that time, which must be older than "
+            "their current position. The offsets have a log segment "
+            "granularity.",
+        )
+        translation.add_argument(
+            '--offset-map',
+            help="File mapping source offsets to destination offsets, with "
+            "one line topic,partition,source_offset,dest_offset per "
+            "checkpoint. A group is moved to the destination offset of the "
+            "latest checkpoint at or before its current offset.",
+        )
+        parser_migrate_group.add_argument(
+            "--topic",
+            help="Kafka topic whose offsets shall be migrated. If no topic is "
+            "specified, offsets from all topics that the consumer is "
+            "subscribed to, shall be migrated."
+        )
+        parser_migrate_group.add_argument(
+            "--partitions", nargs='+', type=int,
+            help="List of partitions within the topic. If no partitions are "
+            "specified, offsets from all partitions of the topic shall "
+            "be migrated."
+        )
+        parser_migrate_group.add_argument(
+            '--source-storage', choices=['zookeeper', 'kafka'],
+            default='zookeeper',
+            help="String describing where to fetch the committed offsets. "
+            "Default: %(default)s",
+        )
+        parser_migrate_group.add_argument(
+            '--dest-storage', choices=['zookeeper', 'kafka', 'dual'],
+            default='zookeeper',
+            help="String describing where to store the committed offsets. "
+            "Default: %(default)s",
+        )
+        parser_migrate_group.add_argument(
+            '--dry-run', action='store_true',
+            help="Print the translated offsets without committing them.",
+        )
+        parser_migrate_group.set_defaults(command=cls.run)
+
+    @classmethod
+    def run(cls, args, cluster_config):
+        dest_cluster_config = cls.get_dest_cluster_config(args, cluster_config)
+        if args.offset_map:
+            try:
+                offset_map = cls.read_offset_map(args.offset_map)
+            except ValueError as e:
+                print("Error: {error}".format(error=e), file=sys.stderr)
+                sys.exit(1)
+
+        # Setup the Kafka clients, one per cluster
+        source_client = KafkaToolClient(cluster_config.broker_list)
+        dest_client = KafkaToolClient(dest_cluster_config.broker_list)
+        try:
+            if args.groupid:
+                groups_topics = [(args.groupid, cls.preprocess_args(
+                    args.groupid,
+                    args.topic,
+                    args.partitions,
+                    cluster_config,
+                    source_client,
+                    storage=args.source_storage,
+                ))]
+            else:
+                groups_topics = cls.get_bulk_groups_topics(
+                    cluster_config,
+                    source_client,
+                    args.groups_file,
+                    args.groups_regex,
+                    topic=args.topic,
+                    partitions=args.partitions,
+                    storage=args.source_storage,
+                )
+            if not groups_topics:
+                print("Error: No consumer group selected.", file=sys.stderr)
+                sys.exit(1)
+
+            # The offsets of the destination cluster are fetched once for
+            # all the groups
+            topics = defaultdict(set)
+            for _, group_topics in groups_topics:
+                for topic, partitions in group_topics.iteritems():
+                    topics[topic].update(partitions)
+            topics = dict(
+                (topic, sorted(partitions))
+                for topic, partitions in topics.iteritems()
+            )
+            if args.offset_map:
+                translate = cls.offset_map_translator(offset_map)
+            else:
+                translate = cls.timestamp_translator(
+                    get_offsets_for_times(
+                        source_client,
+                        topics,
+                        args.timestamp,
+                        raise_on_error=False,
+                    ),
+                    get_offsets_for_times(
+                        dest_client,
+                        topics,
+                        args.timestamp,
+                        raise_on_error=False,
+                    ),
+                )
+            dest_watermarks = get_topics_watermarks(
+                dest_client,
+                topics,
+                raise_on_error=False,
+            )
+
+            results = cls.migrate_groups(
+                source_client,
+                dest_client,
+                groups_topics,
+                translate,
+                dest_watermarks,
+                args.source_storage,
+                None if args.dry_run else args.dest_storage,
+                args.workers,
+            )
+            failed = cls.print_results(results, args.dry_run)
+        finally:
+            source_client.close()
+            dest_client.close()
+
+        if failed:
+            print(
+                "Error: {failed} out of {total} consumer groups failed.".format(
+                    failed=failed,
+                    total=len(groups_topics),
+                ),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    @classmethod
+    def get_dest_cluster_config(cls, args, cluster_config):
+        try:
+            dest_cluster_config = get_cluster_config(
+                args.dest_cluster_type or args.cluster_type,
+                args.dest_cluster_name,
+                args.discovery_base_path,
+            )
+        except ConfigurationError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        if dest_cluster_config == cluster_config:
+            print(
+                "Error: The destination cluster is the source cluster.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        return dest_cluster_config
+
+    @classmethod
+    def migrate_groups(
+        cls,
+        source_client,
+        dest_client,
+        groups_topics,
+        translate,
+        dest_watermarks,
+        source_storage,
+        dest_storage,
+        workers,
+    ):
+        """Translate and commit the offsets of many groups. The source
+        offsets are fetched, then committed, by workers groups at a time.
+
+        :param groups_topics: list of tuples (group, dict topic: partitions)
+        :param translate: translator returned by offset_map_translator or
+          timestamp_translator
+        :param dest_watermarks: dict topic: partition: PartitionOffsets of
+          the destination cluster
+        :param dest_storage: where to commit the offsets, None to only
+          translate them
+        :returns: list of tuples (group, dict topic: partition: (source
+          offset, destination offset), list of errors)
+        """
+        def fetch(client, group_topics):
+            group, topics = group_topics
+            try:
+                return get_current_consumer_offsets(
+                    client,
+                    group,
+                    topics,
+                    raise_on_error=False,
+                    offset_storage=source_storage,
+                    skip_missing=True,
+                )
+            except (KafkaError, KafkaToolError) as e:
+                return e
+
+        translations = []
+        for (group, topics), source_offsets in zip(
+            groups_topics,
+            imap_with_client_copies(source_client, fetch, groups_topics, workers),
+        ):
+            if isinstance(source_offsets, Exception):
+                translations.append((group, {}, [source_offsets]))
+                continue
+            new_offsets, errors = cls.translate_group(
+                topics,
+                source_offsets,
+                translate,
+                dest_watermarks,
+            )
+            translations.append((group, dict(
+                (topic, dict(
+                    (
+                        partition,
+                        (source_offsets[topic][partition], offset),
+                    )
+                    for partition, offset in partitions.iteritems()
+                ))
+                for topic, partitions in new_offsets.iteritems()
+            ), errors))
+        if dest_storage is None:
+            return translations
+
+        def commit(client, translation):
+            group, offsets, errors = translation
+            # Groups with translation errors are not migrated at all
+            if errors:
+                return errors
+            try:
+                return set_consumer_offsets(
+                    client,
+                    group,
+                    dict(
+                        (topic, dict(
+                            (partition, offset)
+                            for partition, (_, offset) in partitions.iteritems()
+                        ))
+                        for topic, partitions in offsets.iteritems()
+                    ),
+                    raise_on_error=False,
+                    offset_storage=dest_storage,
+                )
+            except (KafkaError, KafkaToolError) as e:
+                return [e]
+
+        return [
+            (group, offsets, group_errors)
+            for (group, offsets, _), group_errors in zip(
+                translations,
+                imap_with_client_copies(dest_client, commit, translations, workers),
+            )
+        ]
+
+    @classmethod
+    def translate_group(cls, topics, source_offsets, translate, dest_watermarks):
+        """Translate the offsets of a group to the destination cluster.
+
+        :param topics: dict topic: partitions of the group
+        :param source_offsets: dict topic: partition: offset of the group
+          in the source cluster
+        :param translate: function taking a topic, a partition and a source
+          offset, returning a tuple (destination offset, error message)
+        :param dest_watermarks: dict topic: partition: PartitionOffsets of
+          the destination cluster
+        :returns: tuple (dict topic: partition: destination offset, list of
+          OffsetTranslationError)
+        """
+        new_offsets = {}
+        errors = []
+        for topic, partitions in sorted(topics.iteritems()):
+            for partition in sorted(partitions):
+                source_offset = source_offsets.get(topic, {}).get(partition)
+                watermark = dest_watermarks.get(topic, {}).get(partition)
+                if source_offset is None:
+                    error = "No offset in the source cluster"
+                elif watermark is None:
+                    error = "Partition not found in the destination cluster"
+                else:
+                    offset, error = translate(topic, partition, source_offset)
+                    if error is None and not (
+                        watermark.lowmark <= offset <= watermark.highmark
+                    ):
+                        error = (
+                            "Translated offset {offset} out of the "
+                            "destination range [{lowmark}, {highmark}]".format(
+                                offset=offset,
+                                lowmark=watermark.lowmark,
+                                highmark=watermark.highmark,
+                            )
+                        )
+                if error is None:
+                    new_offsets.setdefault(topic, {})[partition] = offset
+                else:
+                    errors.append(
+                        OffsetTranslationError(topic, partition, error),
+                    )
+        return new_offsets, errors
+
+    @classmethod
+    def read_offset_map(cls, path):
+        """Read an offset mapping table. Empty lines and lines starting with
+        # are ignored.
+
+        :param path: path of a file with one line
+          topic,partition,source_offset,dest_offset per checkpoint
+        :returns: dict (topic, partition): tuple (source offsets, destination
+          offsets), sorted by source offset
+        :raises: ValueError: upon badly formatted lines
+        """
+        checkpoints = defaultdict(list)
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    topic, partition, source_offset, dest_offset = line.split(',')
+                    checkpoints[(topic.strip(), int(partition))].append(
+                        (int(source_offset), int(dest_offset)),
+                    )
+                except ValueError:
+                    raise ValueError(
+                        "Invalid offset mapping at line {line_number} of "
+                        "{path}: {line}".format(
+                            line_number=line_number,
+                            path=path,
+                            line=line,
+                        ),
+                    )
+        return dict(
+            (topic_partition, tuple(zip(*sorted(pairs))))
+            for topic_partition, pairs in checkpoints.iteritems()
+        )
+
+    @classmethod
+    def offset_map_translator(cls, offset_map):
+        """Translate offsets with the latest checkpoint at or before them.
+        Messages between that checkpoint and the source offset are consumed
+        again in the destination cluster, none are skipped.
+
+        :param offset_map: dict returned by read_offset_map
+        """
+        def translate(topic, partition, source_offset):
+            if (topic, partition) not in offset_map:
+                return None, "No offset mapping for the partition"
+            source_offsets, dest_offsets = offset_map[(topic, partition)]
+            i = bisect_right(source_offsets, source_offset)
+            if i == 0:
+                return None, (
+                    "No offset mapping at or before offset {offset}".format(
+                        offset=source_offset,
+                    )
+                )
+            return dest_offsets[i - 1], None
+        return translate
+
+    @classmethod
+    def timestamp_translator(cls, source_time_offsets, dest_time_offsets):
+        """Translate offsets to the destination offsets at a point in time.
+        Groups whose offset is older than that time would skip messages,
+        their offsets are not translated.
+
+        :param source_time_offsets: dict topic: partition: offset at that
+          time in the source cluster
+        :param dest_time_offsets: dict topic: partition: offset at that time
+          in the destination cluster
+        """
+        def translate(topic, partition, source_offset):
+            source_time_offset = source_time_offsets.get(topic, {}).get(partition)
+            dest_time_offset = dest_time_offsets.get(topic, {}).get(partition)
+            if source_time_offset is None or dest_time_offset is None:
+                return None, "Unable to get the offsets at the timestamp"
+            if source_offset < source_time_offset:
+                return None, (
+                    "Offset {offset} is older than the timestamp, at offset "
+                    "{time_offset}".format(
+                        offset=source_offset,
+                        time_offset=source_time_offset,
+                    )
+                )
+            return dest_time_offset, None
+        return translate
+
+    @classmethod
+    def print_results(cls, results, dry_run):
+        """Print the translated offsets and the errors of every group.
+
+        :returns: the number of failed groups
+        """
+        if dry_run:
+            print(ROW_FORMAT.format(
+                group='Group',
+                topic='Topic',
+                partition='Partition',
+                source='Source offset',
+                dest='Dest offset',
+            ))
+        failed = 0
+        for group, offsets, errors in results:
+            if errors:
+                failed += 1
+                print(
+                    "Error: Unable to migrate consumer group {group}:\n"
+                    "{errors}".format(
+                        group=group,
+                        errors='\n'.join(
+                            '  ' + cls.format_error(error) for error in errors
+                        ),
+                    ),
+                    file=sys.stderr,
+                )
+            elif dry_run:
+                for topic, partitions in sorted(offsets.iteritems()):
+                    for partition, (source, dest) in sorted(partitions.iteritems()):
+                        print(ROW_FORMAT.format(
+                            group=group,
+                            topic=topic,
+                            partition=partition,
+                            source=source,
+                            dest=dest,
+                        ))
+            else:
+                print(
+                    "Consumer group {group}: migrated {partitions} "
+                    "partitions.".format(
+                        group=group,
+                        partitions=sum(len(p) for p in offsets.itervalues()),
+                    ),
+                )
+        return failed
@@ -20,6 +20,7 @@ import sys
 
 from .offset_manager import OffsetWriter
 from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.monitoring import watermark_cache
 from kafka_utils.util.offsets import advance_consumer_offsets
 
 
@@ -37,9 +38,9 @@ class OffsetAdvance(OffsetWriter):
             "-h", "--help", action="help",
             help="Show this help message and exit."
         )
-        parser_offset_advance.add_argument(
-            'groupid',
-            help="Consumer Group ID whose consumer offsets shall be advanced."
+        cls.add_groups_arguments(
+            parser_offset_advance,
+            "Consumer Group ID whose consumer offsets shall be advanced.",
         )
         parser_offset_advance.add_argument(
             "--topic",
@@ -69,7 +70,29 @@ class OffsetAdvance(OffsetWriter):
     def run(cls, args, cluster_config):
         # Setup the Kafka client
         client = KafkaToolClient(cluster_config.broker_list)
-        client.load_metadata_for_topics()
+
+        if args.groupid is None:
+            def advance_group(client, group, topics_dict):
+                return advance_consumer_offsets(
+                    client,
+                    group,
+                    topics_dict,
+                    offset_storage=args.storage,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
+            cls.run_bulk(
+                args,
+                cluster_config,
+                client,
+                advance_group,
+                topic=args.topic,
+                partitions=args.partitions,
+                storage=args.storage,
+                force=args.force,
+                prefetch_watermarks=True,
+            )
+            return
 
         topics_dict = cls.preprocess_args(
             args.groupid,
@@ -86,6 +109,8 @@ class OffsetAdvance(OffsetWriter):
                 args.groupid,
                 topics_dict,
                 offset_storage=args.storage,
+                watermark_cache=watermark_cache,
+                metadata_token=client.metadata_token,
             )
         except TypeError:
             print(
@@ -22,6 +22,7 @@ from .offset_manager import OffsetManagerBase
 from kafka_utils.util import print_json
 from kafka_utils.util.client import KafkaToolClient
 from kafka_utils.util.monitoring import get_consumer_offsets_metadata
+from kafka_utils.util.monitoring import watermark_cache
 
 
 class OffsetGet(OffsetManagerBase):
@@ -80,7 +81,6 @@ class OffsetGet(OffsetManagerBase):
     def run(cls, args, cluster_config):
         # Setup the Kafka client
         client = KafkaToolClient(cluster_config.broker_list)
-        client.load_metadata_for_topics()
 
         topics_dict = cls.preprocess_args(
             groupid=args.groupid,
@@ -129,6 +129,8 @@ class OffsetGet(OffsetManagerBase):
         try:
             return get_consumer_offsets_metadata(
                 client, group, topics_dict, False, storage,
+                watermark_cache=watermark_cache,
+                metadata_token=client.metadata_token,
             )
         except:
             print(
@@ -16,15 +16,31 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import re
 import sys
+from collections import defaultdict
 
+from kafka.common import KafkaError
+from kazoo.exceptions import KazooException
 from kazoo.exceptions import NoNodeError
 
+from kafka_utils.kafka_consumer_manager.util import groups_index
 from kafka_utils.kafka_consumer_manager.util import KafkaGroupReader
 from kafka_utils.kafka_consumer_manager.util import prompt_user_input
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.client import imap_with_client_copies
+from kafka_utils.util.error import KafkaToolError
+from kafka_utils.util.error import OffsetCommitError
+from kafka_utils.util.error import OffsetTranslationError
+from kafka_utils.util.monitoring import DEFAULT_OFFSETS_WORKERS
+from kafka_utils.util.monitoring import watermark_cache
 from kafka_utils.util.zookeeper import ZK
 
 
+# Partitions per chunk of the streamed offsets files
+DEFAULT_CHUNK_SIZE = 10000
+
+
 class OffsetManagerBase(object):
 
     @classmethod
@@ -123,13 +139,340 @@ class OffsetManagerBase(object):
     def add_parser(cls, subparsers):
         cls.setup_subparser(subparsers)
 
+    @classmethod
+    def add_groups_arguments(cls, parser, groupid_help):
+        """Add the groupid argument to parser, along with the --groups-file
+        and --groups-regex alternatives to operate on many groups at once.
+        """
+        groups = parser.add_mutually_exclusive_group(required=True)
+        groups.add_argument(
+            'groupid', nargs='?',
+            help=groupid_help,
+        )
+        groups.add_argument(
+            '--groups-file',
+            help="File with the Consumer Group IDs to operate on, one per "
+            "line. Empty lines and lines starting with # are ignored.",
+        )
+        groups.add_argument(
+            '--groups-regex',
+            help="Operate on all the consumer groups whose ID fully matches "
+            "the regex.",
+        )
+        parser.add_argument(
+            '--workers', type=positive_nonzero_int,
+            default=DEFAULT_OFFSETS_WORKERS,
+            help="Number of consumer groups processed concurrently with "
+            "--groups-file or --groups-regex. Default: %(default)s",
+        )
+
+    @classmethod
+    def add_offsets_file_arguments(cls, parser):
+        """Add the --format and --chunk-size arguments of the commands
+        saving or restoring the offsets of a group to a file.
+        """
+        parser.add_argument(
+            '--format', choices=['json', 'jsonl'],
+            help="Format of the offsets file. jsonl files hold one line per "
+            "partition, and are streamed in chunks of --chunk-size "
+            "partitions. Default: jsonl if the file name ends with .jsonl, "
+            "json otherwise.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=positive_nonzero_int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Number of partitions processed at once with the jsonl "
+            "format. Default: %(default)s",
+        )
+
+    @classmethod
+    def get_offsets_file_format(cls, path, file_format=None):
+        """Format of an offsets file, guessed from its name if file_format
+        is None.
+        """
+        if file_format is not None:
+            return file_format
+        return 'jsonl' if path.endswith('.jsonl') else 'json'
+
+    @classmethod
+    def split_topics_partitions(cls, topics_dict, chunk_size):
+        """Split topics_dict in chunks of at most chunk_size partitions.
+        Topics without partitions are in no chunk.
+
+        :param topics_dict: dict topic: list of partitions
+        :returns: generator of dict topic: list of partitions
+        """
+        chunk = {}
+        size = 0
+        for topic, partitions in sorted(topics_dict.iteritems()):
+            partitions = list(partitions)
+            while partitions:
+                count = min(chunk_size - size, len(partitions))
+                chunk[topic] = partitions[:count]
+                partitions = partitions[count:]
+                size += count
+                if size == chunk_size:
+                    yield chunk
+                    chunk = {}
+                    size = 0
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def get_groups_topics(cls, cluster_config, groupids, storage):
+        """Get the topics of the given groups, or of all the groups if
+        groupids is None.
+
+        :returns: dict group: list of topics
+        """
+        groups_topics = defaultdict(set)
+        if storage in ('zookeeper', 'dual'):
+            with ZK(cluster_config) as zk:
+                try:
+                    for group, topics in zk.get_groups_topics(groupids).iteritems():
+                        groups_topics[group].update(topics)
+                except NoNodeError:
+                    print(
+                        "Error: No consumers node found in zookeeper",
+                        file=sys.stderr,
+                    )
+        if storage in ('kafka', 'dual'):
+            kafka_group_reader = KafkaGroupReader(
+                cluster_config,
+                watermark_cache,
+                groups_index,
+            )
+            for group, topics in kafka_group_reader.read_groups().iteritems():
+                if groupids is None or group in groupids:
+                    groups_topics[group].update(topics)
+        return dict(
+            (group, sorted(topics))
+            for group, topics in groups_topics.iteritems()
+            if topics
+        )
+
+    @classmethod
+    def read_groups_file(cls, groups_file):
+        """Read the consumer group ids listed in groups_file, one per line."""
+        with open(groups_file) as f:
+            groups = [line.strip() for line in f]
+        return [group for group in groups if group and not group.startswith('#')]
+
+    @classmethod
+    def get_bulk_groups_topics(
+        cls,
+        cluster_config,
+        client,
+        groups_file,
+        groups_regex,
+        topic=None,
+        partitions=None,
+        storage=None,
+        force=False,
+    ):
+        """Get the topic partitions of the groups listed in groups_file or
+        matching groups_regex. Each offset storage is scanned once for all
+        the groups.
+
+        Groups not subscribed to topic, or to any topic if topic is None, are
+        skipped unless force is True.
+
+        :returns: list of tuples (group, dict topic: partitions) sorted by
+          group
+        """
+        if partitions and not topic:
+            print(
+                "Error: Cannot specify partitions without topic name.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        storage = storage or 'zookeeper'
+        if groups_file:
+            groupids = cls.read_groups_file(groups_file)
+            groups_topics = cls.get_groups_topics(
+                cluster_config,
+                groupids,
+                storage,
+            )
+        else:
+            try:
+                # The regex is not formatted in, it may contain braces
+                pattern = re.compile('(?:' + groups_regex + r')\Z')
+            except re.error as e:
+                print(
+                    "Error: Invalid regex {regex}: {error}.".format(
+                        regex=groups_regex,
+                        error=e,
+                    ),
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            groups_topics = dict(
+                (group, topics)
+                for group, topics in cls.get_groups_topics(
+                    cluster_config,
+                    None,
+                    storage,
+                ).iteritems()
+                if pattern.match(group)
+            )
+            groupids = groups_topics.keys()
+
+        if topic:
+            complete_partitions_list = client.get_partition_ids_for_topic(topic)
+            if not set(partitions or []).issubset(complete_partitions_list):
+                print(
+                    "Error: Some partitions amongst {partitions} are not "
+                    "part of complete partition list {complete_list} for "
+                    "topic: {topic}.".format(
+                        partitions=', '.join(str(p) for p in partitions),
+                        complete_list=', '.join(str(p) for p in complete_partitions_list),
+                        topic=topic,
+                    ),
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+
+        result = []
+        for group in sorted(set(groupids)):
+            topics = groups_topics.get(group, [])
+            if topic:
+                topics = [topic] if (topic in topics or force) else []
+            if not topics and not force:
+                print(
+                    "Warning: Skipping consumer group {group}, it is not "
+                    "subscribed to {topic}.".format(
+                        group=group,
+                        topic=topic or "any topic",
+                    ),
+                    file=sys.stderr,
+                )
+                continue
+            result.append((group, dict(
+                (
+                    group_topic,
+                    partitions or client.get_partition_ids_for_topic(group_topic),
+                )
+                for group_topic in topics
+            )))
+        return result
+
+    @classmethod
+    def confirm_bulk(cls, groups_topics):
+        """Ask the user to confirm a bulk operation on groups_topics."""
+        pass
+
+    @classmethod
+    def run_bulk(
+        cls,
+        args,
+        cluster_config,
+        client,
+        process_group,
+        topic=None,
+        partitions=None,
+        storage=None,
+        force=False,
+        prefetch_watermarks=False,
+    ):
+        """Run process_group on the groups selected by --groups-file or
+        --groups-regex and close the client.
+
+        The groups are processed concurrently by args.workers workers,
+        sharing the metadata of client and the zookeeper session. Exits with
+        an error if any group failed.
+
+        :param process_group: function taking a client, a group and a dict
+          topic: partitions, returning the list of errors of the group.
+        :param prefetch_watermarks: fetch the watermarks of all the topics
+          at once into the watermark cache, before processing the groups.
+        """
+        groups_topics = cls.get_bulk_groups_topics(
+            cluster_config,
+            client,
+            args.groups_file,
+            args.groups_regex,
+            topic=topic,
+            partitions=partitions,
+            storage=storage,
+            force=force,
+        )
+        if not groups_topics:
+            print("Error: No consumer group selected.", file=sys.stderr)
+            sys.exit(1)
+        cls.confirm_bulk(groups_topics)
+
+        if prefetch_watermarks and watermark_cache.ttl:
+            watermark_cache.get_topics_watermarks(
+                client,
+                list(set(
+                    topic for _, topics in groups_topics for topic in topics
+                )),
+                raise_on_error=False,
+            )
+
+        def process(client, group_topics):
+            group, topics = group_topics
+            try:
+                return group, process_group(client, group, topics)
+            except (KafkaError, KafkaToolError, KazooException) as e:
+                return group, [e]
+
+        failed = 0
+        for group, errors in imap_with_client_copies(
+            client,
+            process,
+            groups_topics,
+            args.workers,
+        ):
+            if errors:
+                failed += 1
+                print(
+                    "Error: Unable to process consumer group {group}:\n"
+                    "{errors}".format(
+                        group=group,
+                        errors='\n'.join(
+                            '  ' + cls.format_error(error) for error in errors
+                        ),
+                    ),
+                    file=sys.stderr,
+                )
+            else:
+                print("Consumer group {group}: done.".format(group=group))
+            sys.stdout.flush()
+        client.close()
+
+        if failed:
+            print(
+                "Error: {failed} out of {total} consumer groups failed.".format(
+                    failed=failed,
+                    total=len(groups_topics),
+                ),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    @classmethod
+    def format_error(cls, error):
+        if isinstance(error, (OffsetCommitError, OffsetTranslationError)):
+            return "Topic: {topic} Partition: {partition} Error: {error}".format(
+                topic=error.topic,
+                partition=error.partition,
+                error=error.error,
+            )
+        return repr(error)
+
     @classmethod
     def get_topics_for_group_from_kafka(
             cls,
             cluster_config,
             groupid
     ):
-        kafka_group_reader = KafkaGroupReader(cluster_config)
+        kafka_group_reader = KafkaGroupReader(
+            cluster_config,
+            watermark_cache,
+            groups_index,
+        )
         return kafka_group_reader.read_group(groupid)
 
     @classmethod
@@ -207,6 +550,21 @@ class OffsetWriter(OffsetManagerBase):
 
         return topics_dict
 
+    @classmethod
+    def confirm_bulk(cls, groups_topics):
+        groups_str = ""
+        for group, topics in groups_topics:
+            groups_str += "Group: {group}, Topics: {topics}\n".format(
+                group=group,
+                topics=', '.join(sorted(topics)),
+            )
+        in_str = (
+            "Offsets of the {count} consumer groups listed below shall be "
+            "modified:\n{groups}\nIs this what you really intend? "
+            "(y/n)".format(count=len(groups_topics), groups=groups_str)
+        )
+        prompt_user_input(in_str)
+
     @classmethod
     def get_forced_topic_partitions(cls, groupid, topic, partitions, client):
         assert(topic is not None)
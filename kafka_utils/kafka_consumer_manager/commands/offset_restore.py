@@ -19,14 +19,39 @@ from __future__ import unicode_literals
 import json
 import sys
 from collections import defaultdict
+from collections import namedtuple
 from contextlib import closing
+from multiprocessing.pool import ThreadPool
+from operator import add
+
+from kafka.common import KafkaUnavailableError
 
 from .offset_manager import OffsetManagerBase
 from kafka_utils.util.client import KafkaToolClient
-from kafka_utils.util.monitoring import get_consumer_offsets_metadata
+from kafka_utils.util.offsets import get_topics_watermarks
 from kafka_utils.util.offsets import set_consumer_offsets
 
 
+SUMMARY_ROW_FORMAT = (
+    '{topic:<40} {partitions:>10} {below_lowmark:>14} {above_highmark:>15} '
+    '{invalid:>8}'
+)
+# Invalid partitions printed when a restore is aborted
+MAX_INVALID_PRINTED = 20
+
+TopicRestoreSummary = namedtuple(
+    'TopicRestoreSummary',
+    ['partitions', 'below_lowmark', 'above_highmark', 'invalid'],
+)
+"""Validation of the offsets of a topic to restore.
+
+* **partitions**\\(``int``): number of partitions to restore
+* **below_lowmark**\\(``int``): offsets below the low watermark
+* **above_highmark**\\(``int``): offsets above the high watermark
+* **invalid**\\(``int``): negative offsets and offsets of unknown partitions
+"""
+
+
 class OffsetRestore(OffsetManagerBase):
 
     @classmethod
@@ -49,10 +74,16 @@ class OffsetRestore(OffsetManagerBase):
             help="Json file containing offset information",
         )
         parser_offset_restore.add_argument(
-            '--storage', choices=['zookeeper', 'kafka'],
+            '--storage', choices=['zookeeper', 'kafka', 'dual'],
             help="String describing where to store the committed offsets.",
             default='zookeeper'
         )
+        parser_offset_restore.add_argument(
+            '--clamp', action='store_true',
+            help="Move the offsets outside the range of lowmark and highmark "
+            "to the closest watermark. By default they are restored as is.",
+        )
+        cls.add_offsets_file_arguments(parser_offset_restore)
         parser_offset_restore.set_defaults(command=cls.run)
 
     @classmethod
@@ -79,121 +110,290 @@ class OffsetRestore(OffsetManagerBase):
                 raise
 
     @classmethod
-    def build_new_offsets(cls, client, topics_offset_data, topic_partitions, current_offsets):
-        """Build complete consumer offsets from parsed current consumer-offsets
-        and lowmarks and highmarks from current-offsets for.
+    def parse_jsonl_offsets(cls, lines, chunk_size):
+        """Parse the partition lines of a jsonl offsets file, in chunks of
+        chunk_size partitions.
+
+        :param lines: iterable of lines {"topic": ..., "partition": ..., "offset": ...}
+        :param chunk_size: maximum number of partitions of a chunk
+        :returns: generator of dict topic: partition: offset
         """
-        new_offsets = defaultdict(dict)
+        chunk = defaultdict(dict)
+        size = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            chunk[data['topic']][int(data['partition'])] = data['offset']
+            size += 1
+            if size == chunk_size:
+                yield dict(chunk)
+                chunk = defaultdict(dict)
+                size = 0
+        if size:
+            yield dict(chunk)
+
+    @classmethod
+    def validate_offsets(cls, client, topics_offset_data, clamp=False):
+        """Validate the offsets to restore against the watermarks of their
+        partitions, all fetched at once from the partition leaders.
+
+        Offsets outside the range of lowmark and highmark are kept, or moved
+        to the closest watermark if clamp is True. Negative offsets and
+        offsets of unknown partitions are invalid.
+
+        :param client: Kafka-client
+        :param topics_offset_data: dict topic: partition: offset
+        :param clamp: move the out of range offsets to the closest watermark
+        :returns: tuple (new offsets dict topic: partition: offset, summary
+          dict topic: TopicRestoreSummary, list of invalid (topic, partition,
+          offset))
+        """
+        topics = list(topics_offset_data)
+        # If Kafka is unavailable, let's retry loading client metadata
         try:
-            for topic, partitions in topic_partitions.iteritems():
-                # Validate current offsets in range of low and highmarks
-                # Currently we only validate for positive offsets and warn
-                # if out of range of low and highmarks
-                valid_partitions = set()
-                for topic_partition_offsets in current_offsets[topic]:
-                    partition = topic_partition_offsets.partition
-                    valid_partitions.add(partition)
-                    # Skip the partition not present in list
-                    if partition not in topic_partitions[topic]:
-                        continue
-                    lowmark = topic_partition_offsets.lowmark
-                    highmark = topic_partition_offsets.highmark
-                    new_offset = topics_offset_data[topic][partition]
-                    if new_offset < 0:
-                        print(
-                            "Error: Given offset: {offset} is negative"
-                            .format(offset=new_offset),
-                            file=sys.stderr,
-                        )
-                        sys.exit(1)
-                    if new_offset < lowmark or new_offset > highmark:
-                        print(
-                            "Warning: Given offset {offset} for topic-partition "
-                            "{topic}:{partition} is outside the range of lowmark "
-                            "{lowmark} and highmark {highmark}".format(
-                                offset=new_offset,
-                                topic=topic,
-                                partition=partition,
-                                lowmark=lowmark,
-                                highmark=highmark,
-                            )
-                        )
-                    new_offsets[topic][partition] = new_offset
-                if not set(partitions).issubset(valid_partitions):
-                    print(
-                        "Error: Some invalid partitions {partitions} for topic "
-                        "{topic} found. Valid partition-list {valid_partitions}. "
-                        "Exiting...".format(
-                            partitions=', '.join([str(p) for p in partitions]),
-                            valid_partitions=', '.join([str(p) for p in valid_partitions]),
-                            topic=topic,
-                        ),
-                        file=sys.stderr,
+            client.refresh_metadata(topics, client.metadata_token)
+        except KafkaUnavailableError:
+            client.refresh_metadata(topics, client.metadata_token)
+        # Offsets are validated and clamped against fresh watermarks, never
+        # against the cached ones
+        watermarks = get_topics_watermarks(
+            client,
+            dict(
+                (topic, list(offsets))
+                for topic, offsets in topics_offset_data.iteritems()
+            ),
+            raise_on_error=False,
+        )
+
+        new_offsets = {}
+        summary = {}
+        invalid = []
+        for topic, offsets in topics_offset_data.iteritems():
+            topic_watermarks = watermarks.get(topic, {})
+            topic_new_offsets = new_offsets[topic] = {}
+            below_lowmark = above_highmark = 0
+            for partition, offset in offsets.iteritems():
+                partition_watermarks = topic_watermarks.get(partition)
+                if partition_watermarks is None or offset < 0:
+                    invalid.append((topic, partition, offset))
+                    continue
+                if offset < partition_watermarks.lowmark:
+                    below_lowmark += 1
+                    if clamp:
+                        offset = partition_watermarks.lowmark
+                elif offset > partition_watermarks.highmark:
+                    above_highmark += 1
+                    if clamp:
+                        offset = partition_watermarks.highmark
+                topic_new_offsets[partition] = offset
+            summary[topic] = TopicRestoreSummary(
+                partitions=len(offsets),
+                below_lowmark=below_lowmark,
+                above_highmark=above_highmark,
+                invalid=len(offsets) - len(topic_new_offsets),
+            )
+        return new_offsets, summary, invalid
+
+    @classmethod
+    def print_summary(cls, summary, clamp=False):
+        """Print a table of the validated offsets, one row per topic."""
+        print(SUMMARY_ROW_FORMAT.format(
+            topic='Topic',
+            partitions='Partitions',
+            below_lowmark='Below lowmark',
+            above_highmark='Above highmark',
+            invalid='Invalid',
+        ))
+        for topic, topic_summary in sorted(summary.iteritems()):
+            print(SUMMARY_ROW_FORMAT.format(topic=topic, **topic_summary._asdict()))
+        out_of_range = sum(
+            topic_summary.below_lowmark + topic_summary.above_highmark
+            for topic_summary in summary.itervalues()
+        )
+        if out_of_range:
+            if clamp:
+                print(
+                    "{count} offsets outside the range of lowmark and "
+                    "highmark were moved to the closest watermark".format(
+                        count=out_of_range,
                     )
-                    sys.exit(1)
-        except KeyError as ex:
+                )
+            else:
+                print(
+                    "Warning: {count} offsets are outside the range of "
+                    "lowmark and highmark".format(count=out_of_range)
+                )
+
+    @classmethod
+    def print_invalid(cls, invalid):
+        print(
+            "Error: {count} offsets are negative or of unknown partitions. "
+            "Exiting...".format(count=len(invalid)),
+            file=sys.stderr,
+        )
+        for topic, partition, offset in sorted(invalid)[:MAX_INVALID_PRINTED]:
             print(
-                "Error: Possible invalid topic or partition. Error msg: {ex}. "
-                "Exiting...".format(ex=ex),
+                "\t{topic}:{partition} offset {offset}".format(
+                    topic=topic,
+                    partition=partition,
+                    offset=offset,
+                ),
+                file=sys.stderr,
             )
-            sys.exit(1)
-        return new_offsets
 
     @classmethod
     def run(cls, args, cluster_config):
+        if cls.get_offsets_file_format(args.json_file, args.format) == 'jsonl':
+            with closing(KafkaToolClient(cluster_config.broker_list)) as client:
+                cls.restore_offsets_jsonl(
+                    client,
+                    args.json_file,
+                    args.storage,
+                    args.chunk_size,
+                    args.clamp,
+                )
+            return
         # Fetch offsets from given json-file
         parsed_consumer_offsets = cls.parse_consumer_offsets(args.json_file)
         # Setup the Kafka client
         with closing(KafkaToolClient(cluster_config.broker_list)) as client:
-            client.load_metadata_for_topics()
-
-            cls.restore_offsets(client, parsed_consumer_offsets, args.storage)
+            cls.restore_offsets(
+                client,
+                parsed_consumer_offsets,
+                args.storage,
+                args.clamp,
+            )
 
     @classmethod
-    def restore_offsets(cls, client, parsed_consumer_offsets, storage):
-        """Fetch current offsets from kafka, validate them against given
-        consumer-offsets data and commit the new offsets.
+    def restore_offsets(cls, client, parsed_consumer_offsets, storage, clamp=False):
+        """Validate given consumer-offsets data against the watermarks of
+        their partitions and commit the new offsets.
 
         :param client: Kafka-client
         :param parsed_consumer_offsets: Parsed consumer offset data from json file
         :type parsed_consumer_offsets: dict(group: dict(topic: partition-offsets))
         :param storage: String describing where to store the committed offsets.
+        :param clamp: move the out of range offsets to the closest watermark
+        """
+        new_offsets, summary = cls.commit_offsets(
+            client,
+            parsed_consumer_offsets,
+            storage,
+            clamp,
+        )
+        cls.print_summary(summary, clamp)
+        print("Restored {count} partitions of group {group}".format(
+            count=sum(len(offsets) for offsets in new_offsets.itervalues()),
+            group=parsed_consumer_offsets['groupid'],
+        ))
+
+    @classmethod
+    def commit_offsets(cls, client, parsed_consumer_offsets, storage, clamp=False):
+        """Validate the given consumer-offsets data and commit them. Nothing
+        is committed if any offset is invalid.
+
+        :returns: tuple (dict topic: partition: offset of the committed
+          offsets, dict topic: TopicRestoreSummary)
         """
-        # Fetch current offsets
         try:
             consumer_group = parsed_consumer_offsets['groupid']
             topics_offset_data = parsed_consumer_offsets['offsets']
-            topic_partitions = dict(
-                (topic, [partition for partition in offset_data.keys()])
-                for topic, offset_data in topics_offset_data.iteritems()
-            )
-        except IndexError:
+        except KeyError:
             print(
                 "Error: Given parsed consumer-offset data {consumer_offsets} "
                 "could not be parsed".format(consumer_offsets=parsed_consumer_offsets),
                 file=sys.stderr,
             )
             raise
-        current_offsets = get_consumer_offsets_metadata(
-            client,
-            consumer_group,
-            topic_partitions,
-            offset_storage=storage,
-        )
-        # Build new offsets
-        new_offsets = cls.build_new_offsets(
+        new_offsets, summary, invalid = cls.validate_offsets(
             client,
             topics_offset_data,
-            topic_partitions,
-            current_offsets,
+            clamp,
         )
+        if invalid:
+            cls.print_summary(summary, clamp)
+            cls.print_invalid(invalid)
+            sys.exit(1)
 
         # Commit offsets
-        consumer_group = parsed_consumer_offsets['groupid']
         set_consumer_offsets(
             client,
             consumer_group,
             new_offsets,
             offset_storage=storage,
         )
-        print("Restored to new offsets {offsets}".format(offsets=dict(new_offsets)))
+        return new_offsets, summary
+
+    @classmethod
+    def restore_offsets_jsonl(
+        cls,
+        client,
+        json_file,
+        storage,
+        chunk_size,
+        clamp=False,
+    ):
+        """Stream the offsets of a jsonl file written by offset_save. The
+        offsets are validated and committed in chunks of chunk_size
+        partitions, while the next chunk is read from the file. An invalid
+        chunk stops the restore, after the previous chunks are committed.
+
+        :param client: Kafka-client
+        :param json_file: path of the jsonl offsets file
+        :param storage: String describing where to store the committed offsets.
+        :param chunk_size: number of partitions committed at once
+        :param clamp: move the out of range offsets to the closest watermark
+        """
+        with open(json_file, 'r') as consumer_offsets_jsonl:
+            try:
+                consumer_group = json.loads(consumer_offsets_jsonl.readline())['groupid']
+            except (ValueError, KeyError):
+                cls.print_jsonl_parse_error(json_file)
+                raise
+            chunks = cls.parse_jsonl_offsets(consumer_offsets_jsonl, chunk_size)
+            pool = ThreadPool(1)
+            summary = {}
+            restored = 0
+            try:
+                next_chunk = pool.apply_async(next, (chunks, None))
+                while True:
+                    try:
+                        topics_offset_data = next_chunk.get()
+                    except (ValueError, KeyError):
+                        cls.print_jsonl_parse_error(json_file)
+                        raise
+                    if topics_offset_data is None:
+                        break
+                    # Parse the next chunk while this one is committed
+                    next_chunk = pool.apply_async(next, (chunks, None))
+                    new_offsets, chunk_summary = cls.commit_offsets(
+                        client,
+                        {'groupid': consumer_group, 'offsets': topics_offset_data},
+                        storage,
+                        clamp,
+                    )
+                    for topic, topic_summary in chunk_summary.iteritems():
+                        if topic in summary:
+                            topic_summary = TopicRestoreSummary(
+                                *map(add, summary[topic], topic_summary)
+                            )
+                        summary[topic] = topic_summary
+                    restored += sum(len(offsets) for offsets in new_offsets.itervalues())
+                    print("Restored {count} partitions".format(count=restored))
+            finally:
+                pool.terminate()
+                pool.join()
+        cls.print_summary(summary, clamp)
+        print("Restored {count} partitions of group {group}".format(
+            count=restored,
+            group=consumer_group,
+        ))
+
+    @classmethod
+    def print_jsonl_parse_error(cls, json_file):
+        print(
+            "Error: Given consumer-data jsonl data-file {file} could not be "
+            "parsed".format(file=json_file),
+            file=sys.stderr,
+        )
@@ -20,6 +20,7 @@ import sys
 
 from .offset_manager import OffsetWriter
 from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.monitoring import watermark_cache
 from kafka_utils.util.offsets import rewind_consumer_offsets
 
 
@@ -37,9 +38,9 @@ class OffsetRewind(OffsetWriter):
             "-h", "--help", action="help",
             help="Show this help message and exit."
         )
-        parser_offset_rewind.add_argument(
-            'groupid',
-            help="Consumer Group ID whose consumer offsets shall be rewinded."
+        cls.add_groups_arguments(
+            parser_offset_rewind,
+            "Consumer Group ID whose consumer offsets shall be rewinded.",
         )
         parser_offset_rewind.add_argument(
             "--topic",
@@ -69,7 +70,29 @@ class OffsetRewind(OffsetWriter):
     def run(cls, args, cluster_config):
         # Setup the Kafka client
         client = KafkaToolClient(cluster_config.broker_list)
-        client.load_metadata_for_topics()
+
+        if args.groupid is None:
+            def rewind_group(client, group, topics_dict):
+                return rewind_consumer_offsets(
+                    client,
+                    group,
+                    topics_dict,
+                    args.storage,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
+            cls.run_bulk(
+                args,
+                cluster_config,
+                client,
+                rewind_group,
+                topic=args.topic,
+                partitions=args.partitions,
+                storage=args.storage,
+                force=args.force,
+                prefetch_watermarks=True,
+            )
+            return
 
         topics_dict = cls.preprocess_args(
             args.groupid,
@@ -85,6 +108,8 @@ class OffsetRewind(OffsetWriter):
                 args.groupid,
                 topics_dict,
                 args.storage,
+                watermark_cache=watermark_cache,
+                metadata_token=client.metadata_token,
             )
         except TypeError:
             print(
@@ -17,6 +17,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
+import os
 import sys
 from collections import defaultdict
 
@@ -25,6 +26,7 @@ from kafka.common import KafkaUnavailableError
 from .offset_manager import OffsetManagerBase
 from kafka_utils.util.client import KafkaToolClient
 from kafka_utils.util.monitoring import get_consumer_offsets_metadata
+from kafka_utils.util.monitoring import watermark_cache
 
 
 class OffsetSave(OffsetManagerBase):
@@ -43,9 +45,9 @@ class OffsetSave(OffsetManagerBase):
             action="help",
             help="Show this help message and exit.",
         )
-        parser_offset_save.add_argument(
-            'groupid',
-            help="Consumer Group ID whose offsets shall be fetched.",
+        cls.add_groups_arguments(
+            parser_offset_save,
+            "Consumer Group ID whose offsets shall be fetched.",
         )
         parser_offset_save.add_argument(
             "--topic",
@@ -64,20 +66,70 @@ class OffsetSave(OffsetManagerBase):
         parser_offset_save.add_argument(
             "json_file",
             type=str,
-            help="Export data in json format in the given file.",
+            help="Export data in json format in the given file. With "
+            "--groups-file or --groups-regex, directory where the offsets of "
+            "every group are exported to <groupid>.json, with the '/' and "
+            "'%' characters and a leading '.' of the group id escaped as "
+            "%XX.",
         )
         parser_offset_save.add_argument(
             '--storage', choices=['zookeeper', 'kafka', 'dual'],
             help="String describing where to fetch the committed offsets.",
             default='dual'
         )
+        cls.add_offsets_file_arguments(parser_offset_save)
         parser_offset_save.set_defaults(command=cls.run)
 
     @classmethod
     def run(cls, args, cluster_config):
         # Setup the Kafka client
         client = KafkaToolClient(cluster_config.broker_list)
-        client.load_metadata_for_topics()
+
+        if args.groupid is None:
+            if not os.path.isdir(args.json_file):
+                os.makedirs(args.json_file)
+            file_format = args.format or 'json'
+
+            def save_group(client, group, topics_dict):
+                json_file = os.path.join(
+                    args.json_file,
+                    cls.get_group_file_name(group, file_format),
+                )
+                if file_format == 'jsonl':
+                    cls.save_offsets_jsonl(
+                        client,
+                        group,
+                        topics_dict,
+                        json_file,
+                        args.storage,
+                        args.chunk_size,
+                    )
+                    return
+                consumer_offsets_metadata = get_consumer_offsets_metadata(
+                    client,
+                    group,
+                    topics_dict,
+                    offset_storage=args.storage,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
+                cls.save_offsets(
+                    consumer_offsets_metadata,
+                    topics_dict,
+                    json_file,
+                    group,
+                )
+            cls.run_bulk(
+                args,
+                cluster_config,
+                client,
+                save_group,
+                topic=args.topic,
+                partitions=args.partitions,
+                storage=args.storage,
+                prefetch_watermarks=True,
+            )
+            return
 
         topics_dict = cls.preprocess_args(
             groupid=args.groupid,
@@ -86,12 +138,32 @@ class OffsetSave(OffsetManagerBase):
             cluster_config=cluster_config,
             client=client,
         )
+        if cls.get_offsets_file_format(args.json_file, args.format) == 'jsonl':
+            try:
+                cls.save_offsets_jsonl(
+                    client,
+                    args.groupid,
+                    topics_dict,
+                    args.json_file,
+                    args.storage,
+                    args.chunk_size,
+                )
+            except KafkaUnavailableError:
+                print(
+                    "Error: Encountered error with Kafka, please try again later.",
+                    file=sys.stderr,
+                )
+                raise
+            client.close()
+            return
         try:
             consumer_offsets_metadata = get_consumer_offsets_metadata(
                 client,
                 args.groupid,
                 topics_dict,
                 offset_storage=args.storage,
+                watermark_cache=watermark_cache,
+                metadata_token=client.metadata_token,
             )
         except KafkaUnavailableError:
             print(
@@ -100,14 +172,7 @@ class OffsetSave(OffsetManagerBase):
             )
             raise
 
-        # Warn the user if a topic being subscribed to does not exist in Kafka.
-        for topic in topics_dict:
-            if topic not in consumer_offsets_metadata:
-                print(
-                    "Warning: Topic {topic} does not exist in Kafka"
-                    .format(topic=topic),
-                    file=sys.stderr,
-                )
+        cls.warn_missing_topics(topics_dict, consumer_offsets_metadata)
 
         cls.save_offsets(
             consumer_offsets_metadata,
@@ -143,6 +208,22 @@ class OffsetSave(OffsetManagerBase):
 
         cls.write_offsets_to_file(json_file, consumer_offsets_data)
 
+    @classmethod
+    def get_group_file_name(cls, group, file_format):
+        """Return the name of the file where the offsets of group are saved
+        in bulk mode.
+
+        The characters of the group id that would make the file escape the
+        directory are escaped as %XX, the group id being stored in the file.
+        """
+        name = ''.join(
+            '%{:02X}'.format(ord(char)) if char in '%/\0' else char
+            for char in group
+        )
+        if name.startswith('.'):
+            name = '%2E' + name[1:]
+        return '{name}.{ext}'.format(name=name, ext=file_format)
+
     @classmethod
     def write_offsets_to_file(cls, json_file_name, consumer_offsets_data):
         """Save built consumer-offsets data to given json file."""
@@ -154,3 +235,66 @@ class OffsetSave(OffsetManagerBase):
                 print("Error: Invalid json data {data}".format(data=consumer_offsets_data))
                 raise
             print("Consumer offset data saved in json-file {file}".format(file=json_file_name))
+
+    @classmethod
+    def warn_missing_topics(cls, topics_dict, consumer_offsets_metadata):
+        """Warn the user if a topic being subscribed to does not exist in
+        Kafka.
+        """
+        for topic in topics_dict:
+            if topic not in consumer_offsets_metadata:
+                print(
+                    "Warning: Topic {topic} does not exist in Kafka"
+                    .format(topic=topic),
+                    file=sys.stderr,
+                )
+
+    @classmethod
+    def save_offsets_jsonl(
+        cls,
+        client,
+        groupid,
+        topics_dict,
+        json_file_name,
+        storage,
+        chunk_size,
+    ):
+        """Stream the offsets of a group to a jsonl file. The first line
+        holds the group id, then every line holds the offset of a partition.
+        Offsets are fetched and written in chunks of chunk_size partitions,
+        so that memory stays flat for groups with many partitions.
+
+        :param client: Kafka-client
+        :param groupid: Current consumer-group.
+        :param topics_dict: Dictionary of topic-partitions.
+        :param json_file_name: Filename to store consumer-offsets.
+        :param storage: String describing where to fetch the committed offsets.
+        :param chunk_size: number of partitions fetched at once
+        """
+        # Topics without partitions don't exist in Kafka, and are in no chunk
+        cls.warn_missing_topics(
+            sorted(topic for topic, partitions in topics_dict.iteritems() if not partitions),
+            {},
+        )
+        with open(json_file_name, "w") as json_file:
+            json_file.write(json.dumps({'groupid': groupid}) + '\n')
+            for topics_chunk in cls.split_topics_partitions(topics_dict, chunk_size):
+                consumer_offsets_metadata = get_consumer_offsets_metadata(
+                    client,
+                    groupid,
+                    topics_chunk,
+                    offset_storage=storage,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
+                cls.warn_missing_topics(topics_chunk, consumer_offsets_metadata)
+                json_file.writelines(
+                    json.dumps({
+                        'topic': topic,
+                        'partition': partition_offset.partition,
+                        'offset': partition_offset.current,
+                    }) + '\n'
+                    for topic, topic_offsets in sorted(consumer_offsets_metadata.iteritems())
+                    for partition_offset in topic_offsets
+                )
+        print("Consumer offset data saved in json-file {file}".format(file=json_file_name))
@@ -52,9 +52,9 @@ class OffsetSet(OffsetWriter):
             "-h", "--help", action="help",
             help="Show this help message and exit.",
         )
-        parser_offset_set.add_argument(
-            'groupid',
-            help="Consumer Group ID whose consumer offsets shall be modified.",
+        cls.add_groups_arguments(
+            parser_offset_set,
+            "Consumer Group ID whose consumer offsets shall be modified.",
         )
 
         parser_offset_set.add_argument(
@@ -65,7 +65,7 @@ class OffsetSet(OffsetWriter):
             "new offset.",
         )
         parser_offset_set.add_argument(
-            '--storage', choices=['zookeeper', 'kafka'],
+            '--storage', choices=['zookeeper', 'kafka', 'dual'],
             help="String describing where to store the committed offsets.",
         )
         parser_offset_set.add_argument(
@@ -83,6 +83,24 @@ class OffsetSet(OffsetWriter):
         client = KafkaToolClient(cluster_config.broker_list)
         client.load_metadata_for_topics()
 
+        if args.groupid is None:
+            def set_group(client, group, topics_dict):
+                return set_consumer_offsets(
+                    client,
+                    group,
+                    cls.new_offsets_dict,
+                    offset_storage=args.storage,
+                )
+            cls.run_bulk(
+                args,
+                cluster_config,
+                client,
+                set_group,
+                storage=args.storage,
+                force=args.force,
+            )
+            return
+
         # Let's verify that the consumer does exist in Zookeeper
         if not args.force:
             cls.get_topics_from_consumer_group_id(
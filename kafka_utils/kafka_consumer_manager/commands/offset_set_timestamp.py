@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import calendar
+import sys
+from datetime import datetime
+
+from .offset_manager import OffsetWriter
+from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.offsets import get_offsets_for_times
+from kafka_utils.util.offsets import set_consumer_offsets
+
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class OffsetSetTimestamp(OffsetWriter):
+
+    @classmethod
+    def timestamp(cls, string):
+        """Parse a timestamp in milliseconds since epoch or an UTC datetime
+        in the format YYYY-MM-DDTHH:MM:SS into milliseconds since epoch.
+        """
+        try:
+            timestamp = int(string)
+        except ValueError:
+            try:
+                date = datetime.strptime(string, DATETIME_FORMAT)
+            except ValueError:
+                raise argparse.ArgumentTypeError(
+                    "{string} is neither a timestamp in milliseconds nor a "
+                    "datetime in the format YYYY-MM-DDTHH:MM:SS".format(
+                        string=string,
+                    )
+                )
+            timestamp = calendar.timegm(date.timetuple()) * 1000
+        if timestamp < 0:
+            raise argparse.ArgumentTypeError(
+                "{string} is before epoch".format(string=string),
+            )
+        return timestamp
+
+    @classmethod
+    def setup_subparser(cls, subparsers):
+        parser_offset_set_timestamp = subparsers.add_parser(
+            "offset_set_timestamp",
+            description="Modify consumer offsets for the specified consumer "
+            "group to the offsets at the specified time. The offsets have a "
+            "log segment granularity: consumers can re-read up to a log "
+            "segment of messages older than the specified time.",
+            add_help=False
+        )
+        parser_offset_set_timestamp.add_argument(
+            "-h", "--help", action="help",
+            help="Show this help message and exit."
+        )
+        parser_offset_set_timestamp.add_argument(
+            'groupid',
+            help="Consumer Group ID whose consumer offsets shall be modified."
+        )
+        parser_offset_set_timestamp.add_argument(
+            'timestamp', type=cls.timestamp,
+            help="Milliseconds since epoch or UTC datetime in the format "
+            "YYYY-MM-DDTHH:MM:SS to move the consumer offsets to."
+        )
+        parser_offset_set_timestamp.add_argument(
+            "--topic",
+            help="Kafka topic whose offsets shall be manipulated. If no topic is "
+            "specified, offsets from all topics that the consumer is "
+            "subscribed to, shall be modified."
+        )
+        parser_offset_set_timestamp.add_argument(
+            "--partitions", nargs='+', type=int,
+            help="List of partitions within the topic. If no partitions are "
+            "specified, offsets from all partitions of the topic shall "
+            "be modified."
+        )
+        parser_offset_set_timestamp.add_argument(
+            '--storage', choices=['zookeeper', 'kafka', 'dual'],
+            help="String describing where to store the committed offsets."
+        )
+        parser_offset_set_timestamp.add_argument(
+            '--force',
+            action='store_true',
+            help="Force the offset of the group to be committed even if "
+            "it does not already exist."
+        )
+        parser_offset_set_timestamp.set_defaults(command=OffsetSetTimestamp.run)
+
+    @classmethod
+    def run(cls, args, cluster_config):
+        # Setup the Kafka client
+        client = KafkaToolClient(cluster_config.broker_list)
+
+        topics_dict = cls.preprocess_args(
+            args.groupid,
+            args.topic,
+            args.partitions,
+            cluster_config,
+            client,
+            storage=args.storage,
+            force=args.force,
+        )
+        new_offsets = get_offsets_for_times(client, topics_dict, args.timestamp)
+        results = set_consumer_offsets(
+            client,
+            args.groupid,
+            new_offsets,
+            offset_storage=args.storage,
+        )
+
+        client.close()
+
+        if results:
+            final_error_str = ("Error: Unable to commit consumer offsets for:\n")
+            for result in results:
+                error_str = (
+                    "  Topic: {topic} Partition: {partition} Error: {error}\n".format(
+                        topic=result.topic,
+                        partition=result.partition,
+                        error=result.error
+                    )
+                )
+                final_error_str += error_str
+            print(final_error_str, file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import time
+
+from .offset_manager import OffsetManagerBase
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.monitoring import DEFAULT_OFFSETS_WORKERS
+from kafka_utils.util.monitoring import get_groups_offsets_metadata
+from kafka_utils.util.monitoring import watermark_cache
+from kafka_utils.util.snapshot import append_snapshot
+from kafka_utils.util.snapshot import OffsetsSnapshot
+
+
+class OffsetSnapshot(OffsetManagerBase):
+
+    @classmethod
+    def setup_subparser(cls, subparsers):
+        parser_offset_snapshot = subparsers.add_parser(
+            "offset_snapshot",
+            description="Append the current, high and low offsets of many "
+            "consumer groups to a snapshot file. Snapshots taken at "
+            "different times are compared with offset_snapshot_diff.",
+            add_help=False
+        )
+        parser_offset_snapshot.add_argument(
+            "-h", "--help", action="help",
+            help="Show this help message and exit."
+        )
+        parser_offset_snapshot.add_argument(
+            'snapshot_file',
+            help="Path of the snapshot file. It is created if it doesn't "
+            "exist.",
+        )
+        parser_offset_snapshot.add_argument(
+            'groupids', nargs='*',
+            help="Consumer Group IDs whose offsets shall be saved."
+        )
+        parser_offset_snapshot.add_argument(
+            '--all-groups', action='store_true',
+            help="Save the offsets of all the consumer groups of the cluster."
+        )
+        parser_offset_snapshot.add_argument(
+            '--storage', choices=['zookeeper', 'kafka', 'dual'],
+            help="String describing where to fetch the committed offsets.",
+            default='dual'
+        )
+        parser_offset_snapshot.add_argument(
+            '--workers', type=positive_nonzero_int,
+            default=DEFAULT_OFFSETS_WORKERS,
+            help="Number of consumer groups whose offsets are fetched "
+            "concurrently. Default: %(default)s",
+        )
+        parser_offset_snapshot.set_defaults(command=cls.run)
+
+    @classmethod
+    def run(cls, args, cluster_config):
+        if bool(args.groupids) == args.all_groups:
+            print(
+                "Error: Either consumer group ids or --all-groups must be "
+                "specified.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        groups_topics = cls.get_groups_topics(
+            cluster_config,
+            args.groupids or None,
+            args.storage,
+        )
+
+        # Setup the Kafka client
+        client = KafkaToolClient(cluster_config.broker_list)
+        timestamp = int(time.time() * 1000)
+        try:
+            snapshot = OffsetsSnapshot.from_groups_offsets(
+                timestamp,
+                get_groups_offsets_metadata(
+                    client,
+                    sorted(groups_topics.iteritems()),
+                    offset_storage=args.storage,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                    workers=args.workers,
+                ),
+            )
+        finally:
+            client.close()
+
+        append_snapshot(args.snapshot_file, snapshot)
+        print(
+            "Saved the offsets of {partitions} partitions of {groups} groups "
+            "to {snapshot_file}".format(
+                partitions=len(snapshot),
+                groups=len(set(snapshot.group_ids)),
+                snapshot_file=args.snapshot_file,
+            ),
+        )
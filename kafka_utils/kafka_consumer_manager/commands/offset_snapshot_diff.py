@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+
+from .offset_manager import OffsetManagerBase
+from .offset_set_timestamp import OffsetSetTimestamp
+from kafka_utils.util import print_json
+from kafka_utils.util.snapshot import diff_snapshots
+from kafka_utils.util.snapshot import read_snapshot
+from kafka_utils.util.snapshot import read_snapshot_headers
+
+
+ROW_FORMAT = (
+    '{group:<40} {topic:<40} {partition:>9} {consumed:>12} {produced:>12} '
+    '{lag:>12} {lag_change:>12}'
+)
+
+
+class OffsetSnapshotDiff(OffsetManagerBase):
+
+    @classmethod
+    def setup_subparser(cls, subparsers):
+        parser_snapshot_diff = subparsers.add_parser(
+            "offset_snapshot_diff",
+            description="Compare two snapshots of a file written by "
+            "offset_snapshot. By default the last two snapshots are compared.",
+            add_help=False
+        )
+        parser_snapshot_diff.add_argument(
+            "-h", "--help", action="help",
+            help="Show this help message and exit."
+        )
+        parser_snapshot_diff.add_argument(
+            'snapshot_file',
+            help="Path of the snapshot file.",
+        )
+        parser_snapshot_diff.add_argument(
+            '--from', dest='from_time', type=OffsetSetTimestamp.timestamp,
+            help="Compare from the latest snapshot taken at or before this "
+            "time, in milliseconds since epoch or as an UTC datetime "
+            "YYYY-MM-DDTHH:MM:SS.",
+        )
+        parser_snapshot_diff.add_argument(
+            '--to', dest='to_time', type=OffsetSetTimestamp.timestamp,
+            help="Compare to the latest snapshot taken at or before this "
+            "time. Default: the last snapshot.",
+        )
+        parser_snapshot_diff.add_argument(
+            '--list', action='store_true',
+            help="List the snapshots of the file instead.",
+        )
+        parser_snapshot_diff.add_argument(
+            "-j", "--json", action="store_true",
+            help="Export data in json format."
+        )
+        parser_snapshot_diff.set_defaults(command=cls.run)
+
+    @classmethod
+    def run(cls, args, cluster_config):
+        headers = read_snapshot_headers(args.snapshot_file)
+        if args.list:
+            for header in headers:
+                print("{timestamp} {rows} partitions".format(
+                    timestamp=header.timestamp,
+                    rows=header.rows,
+                ))
+            return
+
+        old_header, new_header = cls.select_headers(
+            headers,
+            args.from_time,
+            args.to_time,
+        )
+        if old_header is None or new_header is None:
+            print(
+                "Error: Not enough snapshots to compare in {snapshot_file}."
+                .format(snapshot_file=args.snapshot_file),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        diffs = diff_snapshots(
+            read_snapshot(args.snapshot_file, old_header),
+            read_snapshot(args.snapshot_file, new_header),
+        )
+        if args.json:
+            print_json([diff._asdict() for diff in diffs])
+        else:
+            print("Snapshots {old} to {new}".format(
+                old=old_header.timestamp,
+                new=new_header.timestamp,
+            ))
+            print(ROW_FORMAT.format(
+                group='Group',
+                topic='Topic',
+                partition='Partition',
+                consumed='Consumed',
+                produced='Produced',
+                lag='Lag',
+                lag_change='Lag change',
+            ))
+            for diff in diffs:
+                print(ROW_FORMAT.format(**diff._asdict()))
+
+    @classmethod
+    def select_headers(cls, headers, from_time, to_time):
+        """Select the headers of the snapshots to compare.
+
+        :param headers: list of SnapshotHeader, in file order
+        :param from_time: timestamp in ms or None for the snapshot before the
+          last selected one
+        :param to_time: timestamp in ms or None for the last snapshot
+        :returns: tuple (old header, new header), None if there is none
+        """
+        if to_time is not None:
+            headers = [h for h in headers if h.timestamp <= to_time]
+        new_header = headers[-1] if headers else None
+        if from_time is not None:
+            old_headers = [h for h in headers if h.timestamp <= from_time]
+        else:
+            old_headers = headers[:-1]
+        old_header = old_headers[-1] if old_headers else None
+        return old_header, new_header
@@ -21,10 +21,13 @@ import sys
 from kazoo.exceptions import NoNodeError
 
 from .offset_manager import OffsetManagerBase
+from kafka_utils.kafka_consumer_manager.util import copy_offsets_kafka
 from kafka_utils.kafka_consumer_manager.util import create_offsets
 from kafka_utils.kafka_consumer_manager.util import fetch_offsets
 from kafka_utils.kafka_consumer_manager.util import preprocess_topics
 from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.offsets import nullify_offsets
+from kafka_utils.util.offsets import set_consumer_offsets
 from kafka_utils.util.zookeeper import ZK
 
 
@@ -35,7 +38,8 @@ class RenameGroup(OffsetManagerBase):
         parser_rename_group = subparsers.add_parser(
             "rename_group",
             description="Rename specified consumer group ID to a new name. "
-            "This tool shall migrate all offset metadata in Zookeeper.",
+            "This tool shall migrate all offset metadata in Zookeeper, or "
+            "the offsets committed into Kafka with --storage kafka.",
             add_help=False
         )
         parser_rename_group.add_argument(
@@ -50,6 +54,13 @@ class RenameGroup(OffsetManagerBase):
             'new_groupid',
             help="New name for the consumer group ID."
         )
+        parser_rename_group.add_argument(
+            '--storage', choices=['zookeeper', 'kafka'],
+            help="String describing where the offsets are stored. With kafka "
+            "the offsets of the old group are copied and then set to -1 with "
+            "batched commit requests. Default: %(default)s",
+            default='zookeeper',
+        )
         parser_rename_group.set_defaults(command=cls.run)
 
     @classmethod
@@ -70,7 +81,32 @@ class RenameGroup(OffsetManagerBase):
             partitions=None,
             cluster_config=cluster_config,
             client=client,
+            storage=args.storage,
         )
+        if args.storage == 'kafka':
+            preprocess_topics(
+                args.old_groupid,
+                topics_dict.keys(),
+                args.new_groupid,
+                cls.get_topics_from_consumer_group_id(
+                    cluster_config,
+                    args.new_groupid,
+                    storage='kafka',
+                ),
+            )
+            copy_offsets_kafka(
+                client,
+                args.old_groupid,
+                args.new_groupid,
+                topics_dict,
+            )
+            set_consumer_offsets(
+                client,
+                args.old_groupid,
+                nullify_offsets(topics_dict),
+                offset_storage='kafka',
+            )
+            return
         with ZK(cluster_config) as zk:
             try:
                 topics = zk.get_children(
@@ -95,7 +131,7 @@ class RenameGroup(OffsetManagerBase):
                 old_base_path = "/consumers/{groupid}".format(
                     groupid=args.old_groupid,
                 )
-                zk.delete(old_base_path, recursive=True)
+                zk.delete_tree(old_base_path)
             except:
                 print(
                     "Error: Unable to migrate all metadata in Zookeeper. "
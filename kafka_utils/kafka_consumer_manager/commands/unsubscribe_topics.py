@@ -20,6 +20,8 @@ import sys
 from kazoo.exceptions import NoNodeError
 
 from .offset_manager import OffsetWriter
+from kafka_utils.util import positive_nonzero_int
+from kafka_utils.util.client import imap_with_client_copies
 from kafka_utils.util.client import KafkaToolClient
 from kafka_utils.util.offsets import get_current_consumer_offsets
 from kafka_utils.util.offsets import nullify_offsets
@@ -27,6 +29,10 @@ from kafka_utils.util.offsets import set_consumer_offsets
 from kafka_utils.util.zookeeper import ZK
 
 
+COMMIT_CHUNK_SIZE = 1000
+COMMIT_WORKERS = 4
+
+
 class UnsubscribeTopics(OffsetWriter):
 
     @classmethod
@@ -63,6 +69,18 @@ class UnsubscribeTopics(OffsetWriter):
             help="String describing where to store the committed offsets.",
             default='zookeeper',
         )
+        parser_unsubscribe_topics.add_argument(
+            '--chunk-size', type=positive_nonzero_int,
+            default=COMMIT_CHUNK_SIZE,
+            help="Maximum number of partitions per offset commit request "
+            "with kafka storage. Default: %(default)s",
+        )
+        parser_unsubscribe_topics.add_argument(
+            '--workers', type=positive_nonzero_int,
+            default=COMMIT_WORKERS,
+            help="Number of offset commit requests sent concurrently with "
+            "kafka storage. Default: %(default)s",
+        )
         parser_unsubscribe_topics.set_defaults(command=cls.run)
 
     @classmethod
@@ -78,7 +96,11 @@ class UnsubscribeTopics(OffsetWriter):
             if args.storage == 'zookeeper':
                 unsubscriber = ZookeeperUnsubscriber(zk)
             elif args.storage == 'kafka':
-                unsubscriber = KafkaUnsubscriber(client)
+                unsubscriber = KafkaUnsubscriber(
+                    client,
+                    args.chunk_size,
+                    args.workers,
+                )
             else:
                 print(
                     "Invalid storage option: {}".format(args.storage),
@@ -114,8 +136,7 @@ class TopicUnsubscriber(object):
         elif topic:
             self.delete_topic(group, topic)
         else:
-            for topic, partitions in topics_dict.iteritems():
-                self.delete_topic(group, topic)
+            self.delete_topics(group, list(topics_dict))
 
     def unsubscribe_partitions(self, group, topic, partitions):
         raise NotImplementedError()
@@ -123,6 +144,10 @@ class TopicUnsubscriber(object):
     def delete_topic(self, group, topic):
         raise NotImplementedError()
 
+    def delete_topics(self, group, topics):
+        for topic in topics:
+            self.delete_topic(group, topic)
+
 
 class ZookeeperUnsubscriber(TopicUnsubscriber):
     """Class used to unsubscribe consumer groups using
@@ -134,12 +159,14 @@ class ZookeeperUnsubscriber(TopicUnsubscriber):
 
     def unsubscribe_partitions(self, group, topic, partitions):
         try:
-            self.zk.delete_topic_partitions(group, topic, partitions)
+            missing = self.zk.delete_topic_partitions(group, topic, partitions)
         except NoNodeError:
+            missing = partitions
+        if missing:
             print(
                 "WARNING: No node found for topic {}, partition {}".format(
                     topic,
-                    partitions,
+                    missing,
                 ),
                 file=sys.stderr,
             )
@@ -149,14 +176,28 @@ class ZookeeperUnsubscriber(TopicUnsubscriber):
     def delete_topic(self, group, topic):
         self.zk.delete_topic(group, topic)
 
+    def delete_topics(self, group, topics):
+        self.zk.delete_topics(group, topics)
+
 
 class KafkaUnsubscriber(TopicUnsubscriber):
     """Class used to unsubscribe consumer groups using
     offset storage in Kafka.
+
+    The nullified offsets of all the topics are committed together, in
+    requests of at most chunk_size partitions sent by workers concurrent
+    clients.
     """
 
-    def __init__(self, client):
+    def __init__(
+        self,
+        client,
+        chunk_size=COMMIT_CHUNK_SIZE,
+        workers=COMMIT_WORKERS,
+    ):
         self.client = client
+        self.chunk_size = chunk_size
+        self.workers = workers
 
     def unsubscribe_partitions(self, group, topic, partitions):
         offsets = {
@@ -165,23 +206,57 @@ class KafkaUnsubscriber(TopicUnsubscriber):
                 for partition in partitions
             }
         }
-        set_consumer_offsets(
-            self.client,
-            group,
-            nullify_offsets(offsets),
-            offset_storage='kafka',
-        )
+        self.commit_offsets(group, nullify_offsets(offsets))
 
     def delete_topic(self, group, topic):
+        self.delete_topics(group, [topic])
+
+    def delete_topics(self, group, topics):
         offsets = get_current_consumer_offsets(
             self.client,
             group,
-            [topic],
+            topics,
             offset_storage='kafka',
         )
-        set_consumer_offsets(
+        self.commit_offsets(group, nullify_offsets(offsets))
+
+    def commit_offsets(self, group, offsets):
+        """Commit the offsets in chunks of at most chunk_size partitions,
+        workers chunks at a time.
+
+        :param group: kafka group_id
+        :param offsets: dict {<topic>: {<partition>: <offset>}}
+        """
+        chunks = [
+            dict(
+                (topic, dict(
+                    (partition, offsets[topic][partition])
+                    for partition in partitions
+                ))
+                for topic, partitions in chunk.iteritems()
+            )
+            for chunk in OffsetWriter.split_topics_partitions(
+                offsets,
+                self.chunk_size,
+            )
+        ]
+        if len(chunks) <= 1 or self.workers == 1:
+            for chunk in chunks:
+                self.commit_chunk(self.client, group, chunk)
+            return
+
+        for _ in imap_with_client_copies(
             self.client,
+            lambda client, chunk: self.commit_chunk(client, group, chunk),
+            chunks,
+            self.workers,
+        ):
+            pass
+
+    def commit_chunk(self, client, group, chunk):
+        set_consumer_offsets(
+            client,
             group,
-            nullify_offsets(offsets),
+            chunk,
             offset_storage='kafka',
         )
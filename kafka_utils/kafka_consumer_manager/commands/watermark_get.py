@@ -25,6 +25,7 @@ from kafka_utils.util.error import UnknownPartitions
 from kafka_utils.util.error import UnknownTopic
 from kafka_utils.util.monitoring import get_watermark_for_regex
 from kafka_utils.util.monitoring import get_watermark_for_topic
+from kafka_utils.util.monitoring import watermark_cache
 
 
 class WatermarkGet(OffsetManagerBase):
@@ -57,7 +58,6 @@ class WatermarkGet(OffsetManagerBase):
     def run(cls, args, cluster_config):
         # Setup the Kafka client
         client = KafkaToolClient(cluster_config.broker_list)
-        client.load_metadata_for_topics()
         watermarks = {}
 
         if args.exact:
@@ -83,9 +83,19 @@ class WatermarkGet(OffsetManagerBase):
     def get_watermarks(cls, client, topic, exact=False):
         try:
             if not exact:
-                return get_watermark_for_regex(client, topic)
+                return get_watermark_for_regex(
+                    client,
+                    topic,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
             else:
-                return get_watermark_for_topic(client, topic)
+                return get_watermark_for_topic(
+                    client,
+                    topic,
+                    watermark_cache=watermark_cache,
+                    metadata_token=client.metadata_token,
+                )
         except (UnknownPartitions, UnknownTopic, FailedPayloadsError) as e:
             print(
                 "Error: Encountered error with Kafka, please try again later: ",
@@ -22,19 +22,29 @@ import sys
 
 from .commands.copy_group import CopyGroup
 from .commands.delete_group import DeleteGroup
+from .commands.lag import Lag
 from .commands.list_groups import ListGroups
 from .commands.list_topics import ListTopics
+from .commands.migrate_group import MigrateGroup
 from .commands.offset_advance import OffsetAdvance
 from .commands.offset_get import OffsetGet
 from .commands.offset_restore import OffsetRestore
 from .commands.offset_rewind import OffsetRewind
 from .commands.offset_save import OffsetSave
 from .commands.offset_set import OffsetSet
+from .commands.offset_set_timestamp import OffsetSetTimestamp
+from .commands.offset_snapshot import OffsetSnapshot
+from .commands.offset_snapshot_diff import OffsetSnapshotDiff
 from .commands.rename_group import RenameGroup
 from .commands.unsubscribe_topics import UnsubscribeTopics
 from .commands.watermark_get import WatermarkGet
+from .util import groups_index
+from kafka_utils.util import positive_float
 from kafka_utils.util.config import get_cluster_config
 from kafka_utils.util.error import ConfigurationError
+from kafka_utils.util.monitoring import DEFAULT_WATERMARK_TTL
+from kafka_utils.util.monitoring import watermark_cache
+from kafka_utils.util.zookeeper import session_registry
 
 
 def parse_args():
@@ -57,11 +67,26 @@ def parse_args():
         type=str,
         help='Path of the directory containing the <cluster_type>.yaml config',
     )
+    parser.add_argument(
+        '--watermark-ttl',
+        type=positive_float,
+        default=DEFAULT_WATERMARK_TTL,
+        help='Seconds the topic watermarks fetched from kafka are reused for '
+        'by the command. 0 disables the cache. Default: %(default)s',
+    )
+    parser.add_argument(
+        '--groups-index-dir',
+        help='Directory of the persistent index of the consumer groups '
+        'committed into kafka. Commands reading the groups from kafka only '
+        'read the offsets committed since the index was last updated. '
+        'Default: disabled',
+    )
     subparsers = parser.add_subparsers()
 
     OffsetGet.add_parser(subparsers)
     OffsetSave.add_parser(subparsers)
     OffsetSet.add_parser(subparsers)
+    OffsetSetTimestamp.add_parser(subparsers)
     OffsetAdvance.add_parser(subparsers)
     OffsetRewind.add_parser(subparsers)
     WatermarkGet.add_parser(subparsers)
@@ -72,6 +97,10 @@ def parse_args():
     DeleteGroup.add_parser(subparsers)
     RenameGroup.add_parser(subparsers)
     OffsetRestore.add_parser(subparsers)
+    Lag.add_parser(subparsers)
+    OffsetSnapshot.add_parser(subparsers)
+    OffsetSnapshotDiff.add_parser(subparsers)
+    MigrateGroup.add_parser(subparsers)
     return parser.parse_args()
 
 
@@ -87,4 +116,8 @@ def run():
     except ConfigurationError as e:
         print(e, file=sys.stderr)
         sys.exit(1)
-    args.command(args, conf)
+    watermark_cache.ttl = args.watermark_ttl
+    groups_index.directory = args.groups_index_dir
+    # Share a single zookeeper session across the whole command
+    with session_registry.hold():
+        args.command(args, conf)
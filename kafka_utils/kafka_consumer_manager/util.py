@@ -16,9 +16,13 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import logging
+import os
+import struct
 import sys
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 
 from kafka.common import ConsumerTimeout
 from kafka.common import FailedPayloadsError
@@ -26,15 +30,24 @@ from kafka.common import KafkaUnavailableError
 from kafka.common import LeaderNotAvailableError
 from kafka.common import NotLeaderForPartitionError
 from kafka.consumer import KafkaConsumer
-from kafka.util import read_short_string
-from kafka.util import relative_unpack
 from kazoo.exceptions import NodeExistsError
 
+from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.offsets import get_current_consumer_offsets
+from kafka_utils.util.offsets import get_offsets_for_times
 from kafka_utils.util.offsets import get_topics_watermarks
+from kafka_utils.util.offsets import set_consumer_offsets
 
 
 CONSUMER_OFFSET_TOPIC = '__consumer_offsets'
 CONSUMER_OFFSET_TOPIC_PARTITIONS = 50  # Kafka default
+# Fetch size of the consumers reading a shard of CONSUMER_OFFSET_TOPIC
+SHARD_FETCH_MESSAGE_MAX_BYTES = 8 * 1024 * 1024
+
+# Offset commit messages of CONSUMER_OFFSET_TOPIC
+_SHORT = struct.Struct(b'>h')
+_PARTITION = struct.Struct(b'>l')
+_VALUE_HEADER = struct.Struct(b'>hq')  # Schema, offset
 
 
 def preprocess_topics(source_groupid, source_topics, dest_groupid, topics_dest_group):
@@ -72,7 +85,8 @@ def preprocess_topics(source_groupid, source_topics, dest_groupid, topics_dest_g
 
 def create_offsets(zk, consumer_group, offsets):
     """Create path with offset value for each topic-partition of given consumer
-    group.
+    group. The nodes are created with zookeeper transactions, see
+    :py:meth:`~kafka_utils.util.zookeeper.ZK.create_group_offsets`.
 
     :param zk: Zookeeper client
     :param consumer_group: Consumer group id for given offsets
@@ -80,45 +94,56 @@ def create_offsets(zk, consumer_group, offsets):
     :param offsets: Offsets of all topic-partitions
     :type offsets: dict(topic, dict(partition, offset))
     """
-    # Create new offsets
-    for topic, partition_offsets in offsets.iteritems():
-        for partition, offset in partition_offsets.iteritems():
-            new_path = "/consumers/{groupid}/offsets/{topic}/{partition}".format(
-                groupid=consumer_group,
-                topic=topic,
-                partition=partition,
-            )
-            try:
-                zk.create(new_path, value=bytes(offset), makepath=True)
-            except NodeExistsError:
-                print(
-                    "Error: Path {path} already exists. Please re-run the "
-                    "command.".format(path=new_path),
-                    file=sys.stderr,
-                )
-                raise
+    try:
+        zk.create_group_offsets(consumer_group, offsets)
+    except NodeExistsError:
+        print(
+            "Error: Offsets of consumer group {groupid} already exist. Please "
+            "re-run the command.".format(groupid=consumer_group),
+            file=sys.stderr,
+        )
+        raise
 
 
 def fetch_offsets(zk, consumer_group, topics):
-    """Fetch offsets for given topics of given consumer group.
+    """Fetch offsets for given topics of given consumer group, pipelining the
+    zookeeper requests.
 
     :param zk: Zookeeper client
     :param consumer_group: Consumer group id for given offsets
     :type consumer_group: int
     :rtype: dict(topic, dict(partition, offset))
     """
-    source_offsets = defaultdict(dict)
-    for topic, partitions in topics.iteritems():
-        for partition in partitions:
-            offset, _ = zk.get(
-                "/consumers/{groupid}/offsets/{topic}/{partition}".format(
-                    groupid=consumer_group,
-                    topic=topic,
-                    partition=partition,
-                )
-            )
-            source_offsets[topic][partition] = offset
-    return source_offsets
+    return zk.get_group_partitions_offsets(consumer_group, topics)
+
+
+def copy_offsets_kafka(kafka_client, source_groupid, dest_groupid, topics):
+    """Copy the offsets committed into kafka by a group to another group.
+    The offsets are fetched and committed with one request per group
+    coordinator. The partitions with no offset committed by the source group
+    are not copied.
+
+    :param kafka_client: KafkaToolClient
+    :param source_groupid: Consumer group id to copy the offsets from
+    :param dest_groupid: Consumer group id to copy the offsets to
+    :param topics: dict topic: list of partitions
+    :returns: dict topic: partition: offset of the copied offsets
+    """
+    offsets = get_current_consumer_offsets(
+        kafka_client,
+        source_groupid,
+        topics,
+        offset_storage='kafka',
+        skip_missing=True,
+    )
+    if offsets:
+        set_consumer_offsets(
+            kafka_client,
+            dest_groupid,
+            offsets,
+            offset_storage='kafka',
+        )
+    return offsets
 
 
 def prompt_user_input(in_str):
@@ -139,51 +164,263 @@ def prompt_user_input(in_str):
 # hashCode returns the hash of the string according to the Java default string
 # hashing algorithm. The algorithm is implemented in the inner function
 # java_string_hashcode.
-def get_group_partition(group):
+def get_group_partition(group, partitions_count=CONSUMER_OFFSET_TOPIC_PARTITIONS):
     """Given a group name, return the partition number of the consumer offset
-    topic containing the data associated to that group."""
+    topic containing the data associated to that group.
+
+    :param group: consumer group id
+    :param partitions_count: number of partitions of the consumer offset
+      topic, see :py:func:`get_offsets_topic_partitions_count`.
+    """
     def java_string_hashcode(s):
         h = 0
         for c in s:
             h = (31 * h + ord(c)) & 0xFFFFFFFF
         return ((h + 0x80000000) & 0xFFFFFFFF) - 0x80000000
-    return abs(java_string_hashcode(group)) % CONSUMER_OFFSET_TOPIC_PARTITIONS
+    return abs(java_string_hashcode(group)) % partitions_count
+
+
+# Partition count of CONSUMER_OFFSET_TOPIC per cluster, keyed by broker list
+_offsets_topic_partitions_counts = {}
+
+
+def get_offsets_topic_partitions_count(kafka_client):
+    """Get the number of partitions of CONSUMER_OFFSET_TOPIC from the client
+    metadata. Brokers configure it with offsets.topic.num.partitions.
+
+    The count is cached per cluster: it can't change once the topic is
+    created. Kafka default is returned if the topic doesn't exist yet.
+
+    :param kafka_client: KafkaToolClient with loaded metadata
+    """
+    cluster = tuple(sorted(kafka_client.hosts))
+    if cluster not in _offsets_topic_partitions_counts:
+        partitions = kafka_client.get_partition_ids_for_topic(
+            CONSUMER_OFFSET_TOPIC,
+        )
+        if not partitions:
+            return CONSUMER_OFFSET_TOPIC_PARTITIONS
+        _offsets_topic_partitions_counts[cluster] = len(partitions)
+    return _offsets_topic_partitions_counts[cluster]
 
 
 class InvalidMessageException(Exception):
     pass
 
 
+class GroupsIndex(object):
+    """Persistent index of the consumer groups committed into
+    __consumer_offsets.
+
+    The index maps every group to its topics, and records for every
+    partition of __consumer_offsets the offset the groups were read up to.
+    KafkaGroupReader resumes reading from these offsets, so that only the
+    messages committed since the previous run are read.
+
+    The index of each cluster is a json file in directory.
+
+    :param directory: directory of the index files. None disables the index.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def _path(self, cluster_config):
+        return os.path.join(
+            self.directory,
+            '{cluster_type}.{cluster_name}.json'.format(
+                cluster_type=cluster_config.type,
+                cluster_name=cluster_config.name,
+            ),
+        )
+
+    def load(self, cluster_config):
+        """Load the index of a cluster.
+
+        :returns: tuple (dict group: set of topics, dict partition: offset).
+          Both are empty if the cluster is not indexed yet.
+        """
+        path = self._path(cluster_config)
+        if not os.path.exists(path):
+            return {}, {}
+        with open(path) as index_file:
+            data = json.load(index_file)
+        if data.get('version') != 1:
+            return {}, {}
+        groups = dict(
+            (group.encode('utf-8'), set(topic.encode('utf-8') for topic in topics))
+            for group, topics in data['groups'].iteritems()
+        )
+        positions = dict(
+            (int(partition), offset)
+            for partition, offset in data['positions'].iteritems()
+        )
+        return groups, positions
+
+    def save(self, cluster_config, groups, positions):
+        """Save the index of a cluster.
+
+        :param groups: dict group: set of topics
+        :param positions: dict partition: offset the groups were read up to
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        data = {
+            'version': 1,
+            'groups': dict(
+                (group, sorted(topics))
+                for group, topics in groups.iteritems()
+                if topics
+            ),
+            'positions': dict(
+                (str(partition), offset)
+                for partition, offset in positions.iteritems()
+            ),
+        }
+        # Write and rename so that a crash never leaves a truncated file
+        path = self._path(cluster_config)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump(data, index_file)
+        os.rename(tmp_path, path)
+
+
+groups_index = GroupsIndex()
+"""Groups index shared by the kafka-consumer-manager commands."""
+
+
 class KafkaGroupReader:
+    """Reader of the consumer groups committed into CONSUMER_OFFSET_TOPIC.
 
-    def __init__(self, kafka_config):
+    :param kafka_config: cluster configuration
+    :param watermark_cache: WatermarkCache used to fetch the watermarks
+    :param groups_index: GroupsIndex to resume reading from
+    :param workers: number of consumers reading the partitions concurrently,
+      each from a shard of the partitions.
+    """
+
+    def __init__(
+        self,
+        kafka_config,
+        watermark_cache=None,
+        groups_index=None,
+        workers=1,
+    ):
         self.log = logging.getLogger(__name__)
         self.kafka_config = kafka_config
+        self.watermark_cache = watermark_cache
+        self.groups_index = groups_index
+        self.workers = workers
         self.kafka_groups = defaultdict(set)
+        self.deleted_groups = set()
+        self.positions = {}
         self.finished_partitions = set()
         self.retry_max = 3
+        self.client = None
+
+    def read_group(self, group_id, since=None):
+        """Get the topics of a group, reading only the partition of
+        CONSUMER_OFFSET_TOPIC the group commits to.
 
-    def read_group(self, group_id):
-        partition = get_group_partition(group_id)
-        return self.read_groups(partition).get(group_id, [])
+        :param group_id: consumer group id
+        :param since: milliseconds since epoch. If set, the partition is read
+          from the offsets committed around that time, at log segment
+          granularity. Topics the group didn't commit since then are missed.
+        :returns: set of topics
+        """
+        partition = get_group_partition(
+            group_id,
+            get_offsets_topic_partitions_count(self.get_client()),
+        )
+        return self.read_groups(partition, since=since).get(group_id, [])
+
+    def read_groups(self, partition=None, since=None):
+        """Get the topics of the groups committed into CONSUMER_OFFSET_TOPIC.
 
-    def read_groups(self, partition=None):
+        :param partition: read only this partition
+        :param since: milliseconds since epoch. If set, the partitions are
+          read from the offsets committed around that time and the groups
+          index is not used.
+        :returns: dict group: set of topics
+        """
         self.log.info("Kafka consumer running")
-        if partition:
+        if partition is not None:
             topic_partition = {CONSUMER_OFFSET_TOPIC: [partition]}
         else:
             topic_partition = CONSUMER_OFFSET_TOPIC
 
-        self.consumer = KafkaConsumer(
-            topic_partition,
+        try:
+            self.watermarks = self.get_current_watermarks(partition)
+            indexed = since is None and self.groups_index is not None and self.groups_index.directory
+            if indexed:
+                self.resume_from_index()
+            elif since is not None:
+                self.seek_to_time(since)
+            if self.workers > 1:
+                self.read_shards()
+            else:
+                self.consumer = self.create_consumer(topic_partition)
+                self.log.info("Consumer ready")
+                if indexed or since is not None:
+                    self.consumer.set_topic_partitions(self.get_start_offsets(
+                        p for p in self.watermarks if p not in self.finished_partitions
+                    ))
+                self.consume(track_positions=indexed)
+        finally:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+        if indexed:
+            self.groups_index.save(
+                self.kafka_config,
+                self.kafka_groups,
+                self.positions,
+            )
+        return self.kafka_groups
+
+    def get_client(self):
+        """KafkaToolClient used for the offset requests, the consumer client
+        doesn't pipeline them."""
+        if self.client is None:
+            self.client = KafkaToolClient(self.kafka_config.broker_list)
+        return self.client
+
+    def seek_to_time(self, since):
+        """Start reading the partitions from their offsets at time since."""
+        offsets = get_offsets_for_times(
+            self.get_client(),
+            {CONSUMER_OFFSET_TOPIC: list(self.watermarks)},
+            since,
+            raise_on_error=False,
+        )
+        self.positions = offsets.get(CONSUMER_OFFSET_TOPIC, {})
+        self.mark_finished_partitions()
+
+    def mark_finished_partitions(self):
+        """Mark as finished the partitions positioned at their high
+        watermark, they have nothing left to read."""
+        for partition, watermark in self.watermarks.iteritems():
+            if self.positions.get(partition, watermark.lowmark) >= watermark.highmark:
+                self.finished_partitions.add(partition)
+
+    def create_consumer(self, *topics, **configs):
+        return KafkaConsumer(
+            *topics,
             group_id='offset_monitoring_consumer',
             bootstrap_servers=self.kafka_config.broker_list,
             auto_offset_reset='smallest',
             auto_commit_enable=False,
             consumer_timeout_ms=3000,
+            **configs
         )
-        self.log.info("Consumer ready")
-        self.watermarks = self.get_current_watermarks(partition)
+
+    def consume(self, track_positions=False):
+        """Process the messages of the consumer until every partition is
+        read up to its high watermark.
+
+        :param track_positions: record in positions the offset each
+          partition was read up to.
+        """
         self.retry = 0
         while not self.finished():
             try:
@@ -192,6 +429,8 @@ class KafkaGroupReader:
                 if message.offset >= max_offset - 1:
                     self.finished_partitions.add(message.partition)
                 self.process_consumer_offset_message(message)
+                if track_positions:
+                    self.positions[message.partition] = message.offset + 1
             except ConsumerTimeout:
                 break
             except (
@@ -202,25 +441,115 @@ class KafkaGroupReader:
             ) as e:
                 self.retry += 1
                 self.log.warning("Got %s, retrying", e.__class__.__name__)
-        return self.kafka_groups
+
+    def get_start_offsets(self, partitions):
+        """Offsets to start consuming partitions from: the offset they were
+        read up to, or their low watermark.
+
+        :returns: dict (topic, partition): offset
+        """
+        return dict(
+            (
+                (CONSUMER_OFFSET_TOPIC, partition),
+                self.positions.get(partition, self.watermarks[partition].lowmark),
+            )
+            for partition in partitions
+        )
+
+    def read_shards(self):
+        """Read the partitions not finished yet with a pool of workers. Every
+        worker reads a shard of the partitions with its own consumer, then the
+        groups of the shards are merged.
+
+        The groups of a partition are independent from the other partitions,
+        so merging the shards gives the same groups as a sequential read.
+        """
+        partitions = sorted(
+            p for p in self.watermarks if p not in self.finished_partitions
+        )
+        shards = [
+            partitions[i::self.workers]
+            for i in range(min(self.workers, len(partitions)))
+        ]
+        if not shards:
+            return
+        pool = ThreadPool(len(shards))
+        try:
+            shard_readers = pool.map(self.read_shard, shards)
+        finally:
+            pool.terminate()
+            pool.join()
+        for shard_reader in shard_readers:
+            for group in shard_reader.deleted_groups:
+                self.kafka_groups.pop(group, None)
+            for group, topics in shard_reader.kafka_groups.iteritems():
+                self.kafka_groups[group].update(topics)
+            self.finished_partitions.update(shard_reader.finished_partitions)
+            self.positions.update(shard_reader.positions)
+
+    def read_shard(self, partitions):
+        """Read partitions from their start offsets to their high watermark.
+
+        :returns: the KafkaGroupReader of the shard
+        """
+        shard_reader = KafkaGroupReader(self.kafka_config)
+        shard_reader.watermarks = dict(
+            (partition, self.watermarks[partition]) for partition in partitions
+        )
+        shard_reader.consumer = self.create_consumer(
+            fetch_message_max_bytes=SHARD_FETCH_MESSAGE_MAX_BYTES,
+        )
+        shard_reader.consumer.set_topic_partitions(
+            self.get_start_offsets(partitions),
+        )
+        shard_reader.consume(track_positions=True)
+        return shard_reader
+
+    def resume_from_index(self):
+        """Restore the groups of the index and the offsets it was built up
+        to. Partitions already read up to the high watermark are finished.
+
+        The index is rebuilt from scratch if any indexed offset is out of the
+        watermarks, for example because the topic was re-created.
+        """
+        groups, positions = self.groups_index.load(self.kafka_config)
+        watermarks = self.watermarks
+        if any(
+            not watermarks[partition].lowmark <= offset <= watermarks[partition].highmark
+            for partition, offset in positions.iteritems()
+            if partition in watermarks
+        ):
+            self.log.warning(
+                "Groups index out of the %s watermarks, rebuilding it",
+                CONSUMER_OFFSET_TOPIC,
+            )
+            groups, positions = {}, {}
+        self.kafka_groups = defaultdict(set, groups)
+        self.positions = positions
+        self.mark_finished_partitions()
 
     def parse_consumer_offset_message(self, message):
-        key = bytearray(message.key)
-        ((key_schema,), cur) = relative_unpack(b'>h', key, 0)
-        if key_schema not in [0, 1]:
+        # The fields are unpacked in place, without copying key and value.
+        # Group and topic names are interned: they repeat in every commit.
+        key = message.key
+        (key_schema,) = _SHORT.unpack_from(key, 0)
+        if key_schema not in (0, 1):
             raise InvalidMessageException()   # This is not an offset commit message
-        (group, cur) = read_short_string(key, cur)
-        (topic, cur) = read_short_string(key, cur)
-        ((partition,), cur) = relative_unpack(b'>l', key, cur)
+        (length,) = _SHORT.unpack_from(key, 2)
+        cur = 4 + length
+        group = intern(bytes(key[4:cur]))
+        (length,) = _SHORT.unpack_from(key, cur)
+        cur += 2
+        topic = intern(bytes(key[cur:cur + length]))
+        (partition,) = _PARTITION.unpack_from(key, cur + length)
         if message.value:
-            value = bytearray(message.value)
-            ((value_schema,), cur) = relative_unpack(b'>h', value, 0)
-            if value_schema not in [0, 1]:
+            # Only the offset is needed, the rest of the value is not decoded
+            value_schema, offset = _VALUE_HEADER.unpack_from(message.value, 0)
+            if value_schema not in (0, 1):
                 raise InvalidMessageException()  # Unrecognized message value
-            ((offset,), cur) = relative_unpack(b'>q', value, cur)
         else:
             offset = None  # Offset was deleted
-        return str(group), str(topic), partition, offset
+        return group, topic, partition, offset
 
     def process_consumer_offset_message(self, message):
         try:
@@ -232,13 +561,20 @@ class KafkaGroupReader:
             self.kafka_groups[group].add(topic)
         else:  # No offset means group deletion
             self.kafka_groups.pop(group, None)
+            self.deleted_groups.add(group)
 
     def get_current_watermarks(self, partition=None):
-        self.consumer._client.load_metadata_for_topics()
-        offsets = get_topics_watermarks(
-            self.consumer._client,
-            [CONSUMER_OFFSET_TOPIC],
-        )
+        client = self.get_client()
+        if self.watermark_cache is not None:
+            offsets = self.watermark_cache.get_topics_watermarks(
+                client,
+                [CONSUMER_OFFSET_TOPIC],
+            )
+        else:
+            offsets = get_topics_watermarks(
+                client,
+                [CONSUMER_OFFSET_TOPIC],
+            )
         return {part: offset for part, offset
                 in offsets[CONSUMER_OFFSET_TOPIC].iteritems()
                 if offset.highmark > offset.lowmark and
@@ -96,6 +96,18 @@ def positive_float(string):
     return value
 
 
+def positive_nonzero_float(string):
+    """Convert string to positive float greater than zero."""
+    error_msg = 'Positive non-zero float required, {string} given.'.format(string=string)
+    try:
+        value = float(string)
+    except ValueError:
+        raise ArgumentTypeError(error_msg)
+    if value <= 0:
+        raise ArgumentTypeError(error_msg)
+    return value
+
+
 def groupsortby(data, key):
     """Sort and group by the same key."""
     return groupby(sorted(data, key=key), key)
@@ -17,15 +17,42 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import functools
+import logging
+import select
+import threading
+from collections import defaultdict
+from collections import deque
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 from kafka import KafkaClient
+from kafka.common import ConnectionError
 from kafka.common import ConsumerCoordinatorNotAvailableCode
+from kafka.common import FailedPayloadsError
+from kafka.common import KafkaUnavailableError
+from kafka.common import LeaderNotAvailableError
+from kafka.common import NotLeaderForPartitionError
+from kafka.common import UnknownTopicOrPartitionError
+from kafka.protocol import KafkaProtocol
+from kafka.util import kafka_bytestring
 from retrying import retry
 
 from kafka_utils.util.protocol import KafkaToolProtocol
 
 RETRY_ATTEMPTS = 5
 WAIT_BEFORE_RETRYING = 2 * 1000
+OFFSET_REQUEST_RETRIES = 1
+
+log = logging.getLogger(__name__)
+
+MetadataToken = namedtuple('MetadataToken', ['generation', 'topics'])
+"""Tuple returned by a metadata refresh of a KafkaToolClient.
+
+  * **generation**\\(:py:class:`int`): metadata generation of the client after
+    the refresh. Any later metadata reset changes the generation.
+  * **topics**\\(:py:class:`frozenset`): refreshed topics, None for all the
+    topics of the cluster.
+"""
 
 
 def _retry_if_kafka_consumer_coordination_error(exception):
@@ -44,6 +71,107 @@ class KafkaToolClient(KafkaClient):
     commit requests to Kafka.
     '''
 
+    # Updated by every metadata reset and load, starting from the bootstrap
+    # of all the topics in the KafkaClient constructor.
+    metadata_generation = 0
+    metadata_token = None
+    # (client, pool) sending the kafka storage requests of dual storage
+    # calls, see get_storage_worker
+    _storage_worker = None
+
+    def copy(self):
+        # The storage worker belongs to this client only
+        storage_worker = self._storage_worker
+        self._storage_worker = None
+        try:
+            return super(KafkaToolClient, self).copy()
+        finally:
+            self._storage_worker = storage_worker
+
+    def close(self):
+        if self._storage_worker is not None:
+            storage_client, pool = self._storage_worker
+            self._storage_worker = None
+            pool.terminate()
+            pool.join()
+            storage_client.close()
+        super(KafkaToolClient, self).close()
+
+    def get_storage_worker(self):
+        """Get a copy of the client, with its own connections, and a single
+        thread pool to use it concurrently with this client. Both are created
+        at the first call, reused by the next ones and closed with the client.
+
+        :returns: tuple (KafkaToolClient, ThreadPool)
+        """
+        if self._storage_worker is None:
+            storage_client = self.copy()
+            storage_client.reinit()
+            self._storage_worker = storage_client, ThreadPool(1)
+        return self._storage_worker
+
+    def reset_topic_metadata(self, *topics):
+        self.metadata_generation += 1
+        super(KafkaToolClient, self).reset_topic_metadata(*topics)
+
+    def reset_all_metadata(self):
+        self.metadata_generation += 1
+        super(KafkaToolClient, self).reset_all_metadata()
+
+    def load_metadata_for_topics(self, *topics):
+        super(KafkaToolClient, self).load_metadata_for_topics(*topics)
+        self.metadata_token = MetadataToken(
+            self.metadata_generation,
+            frozenset(kafka_bytestring(topic) for topic in topics) or None,
+        )
+
+    def is_metadata_fresh(self, metadata_token, topics=None):
+        """Check that the metadata of topics hasn't been reset since the
+        refresh that returned metadata_token.
+
+        :param metadata_token: MetadataToken returned by refresh_metadata
+        :param topics: topic names, all the topics if None
+        """
+        if metadata_token is None or \
+                metadata_token.generation != self.metadata_generation:
+            return False
+        if metadata_token.topics is None:
+            return True
+        return topics is not None and metadata_token.topics.issuperset(
+            kafka_bytestring(topic) for topic in topics
+        )
+
+    def refresh_metadata(self, topics=None, metadata_token=None):
+        """Refresh the metadata of the given topics only.
+
+        The metadata request is limited to the topics, as long as they were
+        all known by the client. Otherwise the metadata of all the topics is
+        loaded, because requesting an unknown topic raises an error, or even
+        creates the topic on clusters with topic auto-creation.
+
+        :param topics: topic names, all the topics if None
+        :param metadata_token: MetadataToken returned by a previous refresh.
+          The refresh is skipped if the metadata of the topics is still fresh.
+        :returns: MetadataToken of the refreshed metadata
+        """
+        if topics is not None:
+            topics = list(topics)
+            if not topics:
+                return self.metadata_token
+        if self.is_metadata_fresh(metadata_token, topics):
+            return metadata_token
+        if topics is None or not all(
+            self.has_metadata_for_topic(topic) for topic in topics
+        ):
+            self.load_metadata_for_topics()
+        else:
+            try:
+                self.load_metadata_for_topics(*topics)
+            except (UnknownTopicOrPartitionError, LeaderNotAvailableError):
+                # A topic was deleted since the last refresh
+                self.load_metadata_for_topics()
+        return self.metadata_token
+
     @retry(retry_on_exception=_retry_if_kafka_consumer_coordination_error,
            stop_max_attempt_number=RETRY_ATTEMPTS,
            wait_fixed=WAIT_BEFORE_RETRYING)
@@ -59,3 +187,184 @@ class KafkaToolClient(KafkaClient):
 
         return [resp if not callback else callback(resp) for resp in resps
                 if not fail_on_error or not self._raise_on_response_error(resp)]
+
+    def send_offset_requests_pipelined(
+        self,
+        payload_lists,
+        retries=OFFSET_REQUEST_RETRIES,
+    ):
+        """Send several lists of OffsetRequest payloads in a single round trip.
+
+        The payloads are grouped by partition leader. Every leader gets one
+        request per list, all written on its connection before any response
+        is read, and all the leaders are served concurrently. A partition
+        can't appear twice in the same request, which is why e.g. highmark
+        and lowmark payloads are given as separate lists.
+
+        A failing leader only fails its own payloads. They are retried up
+        to retries times after refreshing the metadata of their topics,
+        together with the partitions whose leader moved.
+
+        :param payload_lists: list of lists of OffsetRequest
+        :param retries: number of retries of the failed payloads
+        :returns: list of lists of responses, in the order of payload_lists.
+          A response is an OffsetResponse or a FailedPayloadsError if the
+          partition leader could not be reached.
+        """
+        responses = [{} for _ in payload_lists]
+        pending = [list(payloads) for payloads in payload_lists]
+        for attempt in range(retries + 1):
+            if attempt:
+                topics = set(
+                    payload.topic for payloads in pending for payload in payloads
+                )
+                log.warning(
+                    'Retrying offset requests for topics: %s',
+                    ', '.join(topics),
+                )
+                try:
+                    self.load_metadata_for_topics(*topics)
+                except (UnknownTopicOrPartitionError, LeaderNotAvailableError) as e:
+                    log.warning('Metadata refresh failed: %s', e)
+            pending = self._send_offset_requests_pipelined(pending, responses)
+            if not any(pending):
+                break
+        return [
+            [
+                responses[i].get(
+                    (payload.topic, payload.partition),
+                    FailedPayloadsError(payload),
+                )
+                for payload in payloads
+            ]
+            for i, payloads in enumerate(payload_lists)
+        ]
+
+    def _send_offset_requests_pipelined(self, payload_lists, responses):
+        """Send the payloads once, store the responses and return the
+        payloads to retry, in the same format of payload_lists.
+        """
+        failed = [[] for _ in payload_lists]
+
+        def fail_requests(requests):
+            for i, payloads, _ in requests:
+                for payload in payloads:
+                    responses[i][(payload.topic, payload.partition)] = \
+                        FailedPayloadsError(payload)
+                    failed[i].append(payload)
+
+        # Group the payloads by leader, keeping a request per list
+        payloads_by_broker = defaultdict(lambda: [[] for _ in payload_lists])
+        for i, payloads in enumerate(payload_lists):
+            for payload in payloads:
+                try:
+                    leader = self._get_leader_for_partition(
+                        payload.topic,
+                        payload.partition,
+                    )
+                except (
+                    KafkaUnavailableError,
+                    LeaderNotAvailableError,
+                    UnknownTopicOrPartitionError,
+                ):
+                    log.warning(
+                        'No leader available for topic %s partition %d',
+                        payload.topic,
+                        payload.partition,
+                    )
+                    fail_requests([(i, [payload], None)])
+                else:
+                    payloads_by_broker[leader][i].append(payload)
+
+        # Write all the requests of a leader before reading any response.
+        # Kafka answers the requests of a connection in order.
+        connections_by_socket = {}
+        for broker, broker_payloads in payloads_by_broker.iteritems():
+            requests = deque()
+            try:
+                conn = self._get_conn(broker.host.decode('utf-8'), broker.port)
+                for i, payloads in enumerate(broker_payloads):
+                    if not payloads:
+                        continue
+                    request_id = self._next_id()
+                    requests.append((i, payloads, request_id))
+                    conn.send(
+                        request_id,
+                        KafkaProtocol.encode_offset_request(
+                            client_id=self.client_id,
+                            correlation_id=request_id,
+                            payloads=payloads,
+                        ),
+                    )
+            except ConnectionError as e:
+                log.warning('Offset request to %s failed: %s', broker, e)
+                fail_requests(
+                    (i, payloads, None)
+                    for i, payloads in enumerate(broker_payloads)
+                )
+            else:
+                connections_by_socket[conn.get_connected_socket()] = \
+                    (conn, broker, requests)
+
+        while connections_by_socket:
+            rlist, _, _ = select.select(connections_by_socket.keys(), [], [])
+            for sock in rlist:
+                conn, broker, requests = connections_by_socket[sock]
+                i, payloads, request_id = requests[0]
+                try:
+                    response = conn.recv(request_id)
+                except ConnectionError as e:
+                    log.warning('Offset response from %s failed: %s', broker, e)
+                    del connections_by_socket[sock]
+                    fail_requests(requests)
+                    continue
+                requests.popleft()
+                if not requests:
+                    del connections_by_socket[sock]
+                payloads_by_tp = dict(
+                    ((payload.topic, payload.partition), payload)
+                    for payload in payloads
+                )
+                for resp in KafkaProtocol.decode_offset_response(response):
+                    topic_partition = (resp.topic, resp.partition)
+                    responses[i][topic_partition] = resp
+                    if resp.error == NotLeaderForPartitionError.errno:
+                        failed[i].append(payloads_by_tp[topic_partition])
+        return failed
+
+
+def imap_with_client_copies(kafka_client, func, iterable, workers):
+    """Call func(client, item) for every item of iterable, in a pool of
+    workers.
+
+    Kafka clients are not thread safe. Every worker gets its own copy of
+    kafka_client, which keeps the metadata already loaded. The copies are
+    closed when the generator is exhausted or closed.
+
+    :param kafka_client: KafkaToolClient instance
+    :param func: function taking a client and an item of iterable
+    :param iterable: items to process
+    :param workers: number of items processed concurrently
+    :returns: generator of the results of func, in the order of iterable
+    """
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+
+    def call(item):
+        if not hasattr(local, 'client'):
+            local.client = kafka_client.copy()
+            local.client.reinit()
+            with clients_lock:
+                clients.append(local.client)
+        return func(local.client, item)
+
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap(call, iterable):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+        for client in clients:
+            client.close()
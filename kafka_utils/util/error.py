@@ -50,6 +50,11 @@ class UnknownPartitions(KafkaToolError):
     pass
 
 
+class InvalidSnapshotError(KafkaToolError):
+    """Corrupted offsets snapshot file."""
+    pass
+
+
 class OffsetCommitError(KafkaToolError):
     """Error during offset commit."""
 
@@ -66,3 +71,21 @@ class OffsetCommitError(KafkaToolError):
         ]):
             return True
         return False
+
+
+class OffsetTranslationError(KafkaToolError):
+    """Error translating an offset between clusters."""
+
+    def __init__(self, topic, partition, error):
+        self.topic = topic
+        self.partition = partition
+        self.error = error
+
+    def __eq__(self, other):
+        if all([
+            self.topic == other.topic,
+            self.partition == other.partition,
+            self.error == other.error,
+        ]):
+            return True
+        return False
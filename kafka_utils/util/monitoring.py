@@ -14,18 +14,35 @@
 # limitations under the License.
 import logging
 import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import defaultdict
 from collections import namedtuple
+from itertools import izip
+from operator import itemgetter
 
 from kafka.common import ConsumerCoordinatorNotAvailableCode
+from kafka.common import KafkaError
 from kafka.common import KafkaUnavailableError
 
+from kafka_utils.util.client import imap_with_client_copies
 from kafka_utils.util.error import InvalidOffsetStorageError
+from kafka_utils.util.offsets import _verify_topics_and_partitions
 from kafka_utils.util.offsets import get_current_consumer_offsets
 from kafka_utils.util.offsets import get_topics_watermarks
+from kafka_utils.util.offsets import run_on_both_storages
 
 
 log = logging.getLogger(__name__)
 
+DEFAULT_WATERMARK_TTL = 5  # seconds
+DEFAULT_OFFSETS_WORKERS = 8
+# Offset of the partitions missing from a response
+NO_OFFSET = -1
+
 ConsumerPartitionOffsets = namedtuple(
     'ConsumerPartitionOffsets',
     ['topic', 'partition', 'current', 'highmark', 'lowmark']
@@ -40,12 +57,106 @@ ConsumerPartitionOffsets = namedtuple(
 """
 
 
+class WatermarkCache(object):
+    """Cache of topic partition watermarks, valid for ttl seconds.
+
+    Entries are keyed by (cluster, topic, partition). The cluster is
+    identified by the broker list of the kafka client, so that a single cache
+    can be shared by the clients of different clusters. Only the partitions
+    missing or expired are requested to kafka, with a single
+    :py:func:`~kafka_utils.util.offsets.get_topics_watermarks` call.
+
+    :param ttl: seconds the watermarks are valid for. 0 disables the cache.
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, ttl=DEFAULT_WATERMARK_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._watermarks = {}
+        self._lock = threading.Lock()
+
+    def _cluster(self, kafka_client):
+        return tuple(sorted(kafka_client.hosts))
+
+    def get_topics_watermarks(self, kafka_client, topics, raise_on_error=True):
+        """Same as :py:func:`~kafka_utils.util.offsets.get_topics_watermarks`,
+        serving the watermarks fetched less than ttl seconds ago from the
+        cache.
+        """
+        topics = _verify_topics_and_partitions(
+            kafka_client,
+            topics,
+            raise_on_error,
+        )
+        cluster = self._cluster(kafka_client)
+        now = self.clock()
+        watermarks = {}
+        missing = defaultdict(list)
+        with self._lock:
+            for topic, partitions in topics.iteritems():
+                for partition in partitions:
+                    entry = self._watermarks.get((cluster, topic, partition))
+                    if entry and entry[0] > now:
+                        watermarks.setdefault(topic, {})[partition] = entry[1]
+                    else:
+                        missing[topic].append(partition)
+        if not missing:
+            return watermarks
+
+        fetched = get_topics_watermarks(kafka_client, missing, raise_on_error)
+        with self._lock:
+            for topic, partition_watermarks in fetched.iteritems():
+                for partition, offsets in partition_watermarks.iteritems():
+                    if self.ttl:
+                        self._watermarks[(cluster, topic, partition)] = \
+                            (now + self.ttl, offsets)
+                    watermarks.setdefault(topic, {})[partition] = offsets
+        return watermarks
+
+    def invalidate(self, kafka_client=None, topics=None):
+        """Drop cached watermarks.
+
+        :param kafka_client: drop only the watermarks of the cluster of this
+          client. All the watermarks are dropped if None.
+        :param topics: drop only the watermarks of these topics
+        """
+        cluster = self._cluster(kafka_client) if kafka_client else None
+        with self._lock:
+            for key in self._watermarks.keys():
+                if cluster is not None and key[0] != cluster:
+                    continue
+                if topics is None or key[1] in topics:
+                    del self._watermarks[key]
+
+
+watermark_cache = WatermarkCache()
+"""Watermark cache shared by the kafka-consumer-manager commands."""
+
+
+def _get_topics_watermarks(
+    kafka_client,
+    topics,
+    raise_on_error=True,
+    watermark_cache=None,
+):
+    if watermark_cache is not None:
+        return watermark_cache.get_topics_watermarks(
+            kafka_client,
+            topics,
+            raise_on_error,
+        )
+    return get_topics_watermarks(kafka_client, topics, raise_on_error)
+
+
 def get_consumer_offsets_metadata(
     kafka_client,
     group,
     topics,
     raise_on_error=True,
     offset_storage='zookeeper',
+    watermark_cache=None,
+    metadata_token=None,
 ):
     """This method:
         * refreshes metadata for the kafka client
@@ -58,25 +169,28 @@ def get_consumer_offsets_metadata(
     :param raise_on_error: if False the method ignores missing topics and
       missing partitions. It still may fail on the request send.
     :param offset_storage: String, one of {zookeeper, kafka, dual}.
+    :param watermark_cache: WatermarkCache used to fetch the watermarks
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client. The refresh is skipped if still fresh.
     :returns: dict <topic>: [ConsumerPartitionOffsets]
     :raises:
       :py:class:`kafka_utils.util.error.InvalidOffsetStorageError: upon unknown
       offset_storage choice.
     """
-    # Refresh client metadata. We do not use the topic list, because we
-    # don't want to accidentally create the topic if it does not exist.
+    # Refresh client metadata of the topics only. Unknown topics trigger a
+    # full refresh, not to accidentally create them.
     # If Kafka is unavailable, let's retry loading client metadata
     try:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata(topics, metadata_token)
     except KafkaUnavailableError:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata(topics, metadata_token)
 
     group_offsets = get_current_offsets(
         kafka_client, group, topics, raise_on_error, offset_storage
     )
 
-    watermarks = get_topics_watermarks(
-        kafka_client, topics, raise_on_error
+    watermarks = _get_topics_watermarks(
+        kafka_client, topics, raise_on_error, watermark_cache,
     )
 
     result = {}
@@ -93,9 +207,97 @@ def get_consumer_offsets_metadata(
     return result
 
 
+def get_groups_offsets_metadata(
+    kafka_client,
+    groups_topics,
+    raise_on_error=False,
+    offset_storage='zookeeper',
+    watermark_cache=None,
+    workers=DEFAULT_OFFSETS_WORKERS,
+    metadata_token=None,
+):
+    """Same as get_consumer_offsets_metadata for many groups at once.
+
+    The client metadata is refreshed once and the watermarks of every topic
+    are fetched once, for all the groups. The group offsets are fetched
+    concurrently by a pool of workers, each with its own copy of the client.
+    Kafka storage requests are sent to the coordinator of each group.
+
+    Results are yielded in the order of groups_topics as soon as they are
+    available, so that large reports can be streamed.
+
+    :param kafka_client: KafkaToolClient instance
+    :param groups_topics: list of tuples (group id, topics) where topics is a
+      topic list or a dict {<topic>: [partitions]}
+    :param raise_on_error: if False the method ignores missing topics and
+      missing partitions, and a group whose offsets can't be fetched is
+      yielded with no offsets.
+    :param offset_storage: String, one of {zookeeper, kafka, dual}.
+    :param watermark_cache: WatermarkCache used to fetch the watermarks
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client. The refresh is skipped if still fresh.
+    :param workers: number of groups fetched concurrently
+    :returns: generator of tuples (group, dict <topic>: [ConsumerPartitionOffsets])
+    """
+    all_topics = set(
+        topic for _, topics in groups_topics for topic in topics
+    )
+    try:
+        kafka_client.refresh_metadata(all_topics, metadata_token)
+    except KafkaUnavailableError:
+        kafka_client.refresh_metadata(all_topics, metadata_token)
+
+    watermarks = _get_topics_watermarks(
+        kafka_client, list(all_topics), raise_on_error, watermark_cache,
+    )
+
+    def get_group_offsets(client, group_topics):
+        group, topics = group_topics
+        try:
+            return group, get_current_offsets(
+                client, group, topics, raise_on_error, offset_storage,
+            ), None
+        except KafkaError as e:
+            return group, {}, e
+
+    for group, group_offsets, error in imap_with_client_copies(
+        kafka_client,
+        get_group_offsets,
+        groups_topics,
+        workers,
+    ):
+        if error is not None:
+            if raise_on_error:
+                raise error
+            log.error(
+                'Failed to fetch the offsets of group %s: %r',
+                group,
+                error,
+            )
+        yield group, dict(
+            (
+                topic,
+                [
+                    ConsumerPartitionOffsets(
+                        topic=topic,
+                        partition=partition,
+                        current=offset,
+                        highmark=watermarks[topic][partition].highmark,
+                        lowmark=watermarks[topic][partition].lowmark,
+                    )
+                    for partition, offset in partitions.iteritems()
+                    if partition in watermarks.get(topic, {})
+                ],
+            )
+            for topic, partitions in group_offsets.iteritems()
+        )
+
+
 def get_watermark_for_regex(
     kafka_client,
     topic_regex,
+    watermark_cache=None,
+    metadata_token=None,
 ):
     """This method:
         * refreshes metadata for the kafka client
@@ -103,18 +305,20 @@ def get_watermark_for_regex(
 
     :param kafka_client: KafkaToolClient instance
     :param topic: the topic regex
+    :param watermark_cache: WatermarkCache used to fetch the watermarks
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client. The refresh is skipped if still fresh.
     :returns: dict <topic>: [ConsumerPartitionOffsets]
     :raises:
       :py:class:`kafka_utils.util.error.InvalidOffsetStorageError: upon unknown
       offset_storage choice.
     """
-    # Refresh client metadata. We do not use the topic list, because we
-    # don't want to accidentally create the topic if it does not exist.
-    # If Kafka is unavailable, let's retry loading client metadata
+    # Refresh client metadata of all the topics, to match them against the
+    # regex. If Kafka is unavailable, let's retry loading client metadata
     try:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata(metadata_token=metadata_token)
     except KafkaUnavailableError:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata(metadata_token=metadata_token)
 
     topics_to_be_considered = []
     topic_regex = re.compile(topic_regex)
@@ -123,8 +327,10 @@ def get_watermark_for_regex(
         if topic_regex.match(topic):
             topics_to_be_considered.append(topic)
 
-    watermarks = get_topics_watermarks(
-        kafka_client, topics_to_be_considered
+    watermarks = _get_topics_watermarks(
+        kafka_client,
+        topics_to_be_considered,
+        watermark_cache=watermark_cache,
     )
     return watermarks
 
@@ -132,6 +338,8 @@ def get_watermark_for_regex(
 def get_watermark_for_topic(
     kafka_client,
     topic,
+    watermark_cache=None,
+    metadata_token=None,
 ):
     """This method:
         * refreshes metadata for the kafka client
@@ -139,21 +347,26 @@ def get_watermark_for_topic(
 
     :param kafka_client: KafkaToolClient instance
     :param topic: the topic
+    :param watermark_cache: WatermarkCache used to fetch the watermarks
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client. The refresh is skipped if still fresh.
     :returns: dict <topic>: [ConsumerPartitionOffsets]
     :raises:
       :py:class:`kafka_utils.util.error.InvalidOffsetStorageError: upon unknown
       offset_storage choice.
     """
-    # Refresh client metadata. We do not use the topic list, because we
-    # don't want to accidentally create the topic if it does not exist.
+    # Refresh client metadata of the topics only. Unknown topics trigger a
+    # full refresh, not to accidentally create them.
     # If Kafka is unavailable, let's retry loading client metadata
     try:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata([topic], metadata_token)
     except KafkaUnavailableError:
-        kafka_client.load_metadata_for_topics()
+        kafka_client.refresh_metadata([topic], metadata_token)
 
-    watermarks = get_topics_watermarks(
-        kafka_client, [topic]
+    watermarks = _get_topics_watermarks(
+        kafka_client,
+        [topic],
+        watermark_cache=watermark_cache,
     )
     return watermarks
 
@@ -188,35 +401,147 @@ def _get_current_offsets_dual(
 ):
     """Get current consumer offsets from Zookeeper and from Kafka
     and return the higher partition offsets from the responses.
+
+    Both the storages are queried concurrently.
     """
-    zk_offsets = get_current_consumer_offsets(
-        kafka_client, group, topics, False, 'zookeeper',
-    )
-    try:
-        kafka_offsets = get_current_consumer_offsets(
-            kafka_client, group, topics, False, 'kafka',
+    def get_zk_offsets(client):
+        return get_current_consumer_offsets(
+            client, group, topics, False, 'zookeeper',
         )
-    except ConsumerCoordinatorNotAvailableCode:
-        kafka_offsets = {}
+
+    def get_kafka_offsets(client):
+        try:
+            return get_current_consumer_offsets(
+                client, group, topics, False, 'kafka',
+            )
+        except ConsumerCoordinatorNotAvailableCode:
+            return {}
+
+    zk_offsets, kafka_offsets = run_on_both_storages(
+        kafka_client,
+        get_zk_offsets,
+        get_kafka_offsets,
+    )
     return merge_offsets_metadata(topics, zk_offsets, kafka_offsets)
 
 
+class ConsumerOffsetsTable(object):
+    """Consumer offsets of many topic partitions, stored column-wise.
+
+    Row i holds the offset of partition partitions[i] of topic
+    topics[topic_ids[i]]. Rows are grouped by topic id. Tables sharing the
+    same topic_ids and partitions columns are aligned, and they are merged
+    with a single element-wise operation on their offsets columns.
+
+    :param topics: list of topic names, indexed by topic id
+    :param topic_ids: array of topic ids
+    :param partitions: array of partitions
+    :param offsets: list of offsets. Kafka offsets are 64 bits, they don't
+      fit the C long of an array on every platform.
+    """
+
+    def __init__(self, topics, topic_ids, partitions, offsets):
+        self.topics = topics
+        self.topic_ids = topic_ids
+        self.partitions = partitions
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def from_offsets(cls, topics, *offsets_responses):
+        """Build a table for each response, all aligned on the partitions of
+        every response. A partition missing from a response has offset
+        NO_OFFSET in its table.
+
+        :param topics: list of topics in the tables
+        :param offsets_responses: list of dict topic: partition: offset.
+          Other topics are ignored.
+        :returns: list of ConsumerOffsetsTable, one per response
+        """
+        topics = list(topics)
+        topic_ids = array('l')
+        partitions = array('l')
+        columns = [[] for _ in offsets_responses]
+        for topic_id, topic in enumerate(topics):
+            partition_offsets = [
+                response.get(topic, {}) for response in offsets_responses
+            ]
+            topic_partitions = sorted(set().union(*partition_offsets))
+            if not topic_partitions:
+                continue
+            topic_ids.extend([topic_id] * len(topic_partitions))
+            partitions.extend(topic_partitions)
+            get_offsets = itemgetter(*topic_partitions)
+            for column, offsets in izip(columns, partition_offsets):
+                if len(offsets) == len(topic_partitions):
+                    # Every partition is there, gather them in one call
+                    topic_offsets = get_offsets(offsets)
+                    if len(topic_partitions) == 1:
+                        column.append(topic_offsets)
+                    else:
+                        column.extend(topic_offsets)
+                elif not offsets:
+                    column.extend([NO_OFFSET] * len(topic_partitions))
+                else:
+                    column.extend([
+                        offsets.get(partition, NO_OFFSET)
+                        for partition in topic_partitions
+                    ])
+        return [
+            cls(topics, topic_ids, partitions, column)
+            for column in columns
+        ]
+
+    def to_offsets(self):
+        """:returns: dict topic: partition: offset, with all the topics"""
+        result = {}
+        for topic_id, topic in enumerate(self.topics):
+            start = bisect_left(self.topic_ids, topic_id)
+            end = bisect_right(self.topic_ids, topic_id, start)
+            result[topic] = dict(
+                izip(self.partitions[start:end], self.offsets[start:end]),
+            )
+        return result
+
+    @classmethod
+    def merge(cls, *tables):
+        """Merge aligned tables keeping the highest offset of every
+        partition, with an element-wise max of their offsets columns.
+        """
+        # map runs the element-wise max in C, without a Python level loop
+        offsets = reduce(
+            lambda merged, table: map(max, merged, table.offsets),
+            tables[1:],
+            tables[0].offsets,
+        )
+        return cls(
+            tables[0].topics,
+            tables[0].topic_ids,
+            tables[0].partitions,
+            offsets,
+        )
+
+
 def merge_offsets_metadata(topics, *offsets_responses):
-    """Merge the offset metadata dictionaries from multiple responses.
+    """Merge the offset metadata dictionaries from multiple responses,
+    through aligned :py:class:`ConsumerOffsetsTable`.
 
     :param topics: list of topics
     :param offsets_responses: list of dict topic: partition: offset
     :returns: dict topic: partition: offset
     """
-    result = dict()
-    for topic in topics:
-        partition_offsets = [
-            response[topic]
-            for response in offsets_responses
-            if topic in response
-        ]
-        result[topic] = merge_partition_offsets(*partition_offsets)
-    return result
+    offsets_responses = [response for response in offsets_responses if response]
+    if len(offsets_responses) < 2:
+        # Nothing to merge
+        response = offsets_responses[0] if offsets_responses else {}
+        return dict(
+            (topic, dict(response.get(topic, {}))) for topic in topics
+        )
+    return ConsumerOffsetsTable.merge(
+        *ConsumerOffsetsTable.from_offsets(topics, *offsets_responses)
+    ).to_offsets()
 
 
 def merge_partition_offsets(*partition_offsets):
@@ -228,6 +553,5 @@ def merge_partition_offsets(*partition_offsets):
     output = dict()
     for partition_offset in partition_offsets:
         for partition, offset in partition_offset.iteritems():
-            prev_offset = output.get(partition, None)
-            output[partition] = max(prev_offset, offset)
+            output[partition] = max(output.get(partition, NO_OFFSET), offset)
     return output
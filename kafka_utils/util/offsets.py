@@ -12,11 +12,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections import defaultdict
+import logging
 from collections import namedtuple
 
 from kafka.common import BrokerResponseError
 from kafka.common import check_error
+from kafka.common import FailedPayloadsError
 from kafka.common import OffsetCommitRequest
 from kafka.common import OffsetFetchRequest
 from kafka.common import OffsetFetchResponse
@@ -43,9 +44,23 @@ PartitionOffsets = namedtuple(
 * **lowmark**\(``int``): low watermark
 """
 
+log = logging.getLogger(__name__)
+
 HIGH_WATERMARK = "high"
 LOW_WATERMARK = "low"
 
+# Maximum number of partitions in a single offset commit or fetch request
+MAX_PAYLOADS_PER_REQUEST = 1000
+
+OFFSET_COMMIT_APIS = {
+    'zookeeper': 'send_offset_commit_request',
+    'kafka': 'send_offset_commit_request_kafka',
+}
+OFFSET_FETCH_APIS = {
+    'zookeeper': 'send_offset_fetch_request',
+    'kafka': 'send_offset_fetch_request_kafka',
+}
+
 
 def pluck_topic_offset_or_zero_on_unknown(resp):
     try:
@@ -67,6 +82,24 @@ def pluck_topic_offset_or_zero_on_unknown(resp):
     return resp
 
 
+def pluck_topic_offset_or_none_on_unknown(resp):
+    """Same as pluck_topic_offset_or_zero_on_unknown, but the partitions
+    with no committed offset get offset None."""
+    try:
+        check_error(resp)
+    except UnknownTopicOrPartitionError:
+        pass
+    if resp.offset == -1:
+        return OffsetFetchResponse(
+            resp.topic,
+            resp.partition,
+            None,
+            resp.metadata,
+            0,
+        )
+    return resp
+
+
 def _check_fetch_response_error(resp):
     try:
         check_error(resp)
@@ -169,12 +202,99 @@ def _verify_commit_offsets_requests(kafka_client, new_offsets, raise_on_error):
     )
 
 
+def _send_offset_requests(send_api, group, payloads, fail_on_error, callback):
+    """Send the payloads in requests of at most MAX_PAYLOADS_PER_REQUEST
+    partitions, so that a huge group doesn't produce an oversized request.
+
+    :returns: list of the responses of all the requests
+    """
+    resps = []
+    for start in range(0, len(payloads), MAX_PAYLOADS_PER_REQUEST):
+        resps.extend(send_api(
+            group=group,
+            payloads=payloads[start:start + MAX_PAYLOADS_PER_REQUEST],
+            fail_on_error=fail_on_error,
+            callback=callback,
+        ))
+    return resps
+
+
+def run_on_both_storages(kafka_client, zookeeper_call, kafka_call):
+    """Run zookeeper_call and kafka_call concurrently.
+
+    Both calls take a client as only argument. Clients are not thread safe,
+    so kafka_call runs with the storage worker of kafka_client, see
+    :py:meth:`~kafka_utils.util.client.KafkaToolClient.get_storage_worker`.
+    The worker is created once per client, not once per call.
+
+    :param kafka_client: a connected KafkaToolClient
+    :param zookeeper_call: function sending the zookeeper storage requests
+    :param kafka_call: function sending the kafka storage requests
+    :returns: tuple (zookeeper_call result, kafka_call result)
+    """
+    kafka_storage_client, pool = kafka_client.get_storage_worker()
+    kafka_result = pool.apply_async(kafka_call, (kafka_storage_client,))
+    try:
+        zookeeper_result = zookeeper_call(kafka_client)
+    finally:
+        # The storage worker is idle again before the next call
+        kafka_result.wait()
+    return zookeeper_result, kafka_result.get()
+
+
+def _send_to_storage(
+    kafka_client,
+    offset_storage,
+    apis,
+    group,
+    payloads,
+    fail_on_error,
+    callback,
+):
+    """Send the payloads through the API of offset_storage, or of both the
+    storages concurrently if offset_storage is dual.
+
+    :param apis: dict storage: name of the client API
+    :returns: list of responses of each storage
+    """
+    if offset_storage == 'zookeeper' or not offset_storage:
+        storages = ['zookeeper']
+    elif offset_storage == 'kafka':
+        storages = ['kafka']
+    elif offset_storage == 'dual':
+        storages = ['zookeeper', 'kafka']
+    else:
+        raise InvalidOffsetStorageError(offset_storage)
+
+    def send(storage):
+        def send_storage(client):
+            if not payloads:
+                return []
+            return _send_offset_requests(
+                getattr(client, apis[storage]),
+                kafka_bytestring(group),
+                payloads,
+                fail_on_error,
+                callback,
+            )
+        return send_storage
+
+    if len(storages) == 1:
+        return [send(storages[0])(kafka_client)]
+    return list(run_on_both_storages(
+        kafka_client,
+        send('zookeeper'),
+        send('kafka'),
+    ))
+
+
 def get_current_consumer_offsets(
     kafka_client,
     group,
     topics,
     raise_on_error=True,
     offset_storage='zookeeper',
+    skip_missing=False,
 ):
     """ Get current consumer offsets.
 
@@ -191,6 +311,8 @@ def get_current_consumer_offsets(
     :param raise_on_error: if False the method ignores missing topics and
       missing partitions. It still may fail on the request send.
     :param offset_storage: String, one of {zookeeper, kafka}.
+    :param skip_missing: if True the partitions with no offset committed by
+      the group are left out of the result. By default their offset is 0.
     :returns: a dict topic: partition: offset
     :raises:
       :py:class:`kafka_utils.util.error.UnknownTopic`: upon missing
@@ -215,26 +337,29 @@ def get_current_consumer_offsets(
 
     group_offsets = {}
 
-    if offset_storage == 'zookeeper':
-        send_api = kafka_client.send_offset_fetch_request
-    elif offset_storage == 'kafka':
-        send_api = kafka_client.send_offset_fetch_request_kafka
-    else:
+    if offset_storage not in OFFSET_FETCH_APIS:
         raise InvalidOffsetStorageError(offset_storage)
 
-    if group_offset_reqs:
-        # fail_on_error = False does not prevent network errors
-        group_resps = send_api(
-            group=kafka_bytestring(group),
-            payloads=group_offset_reqs,
-            fail_on_error=False,
-            callback=pluck_topic_offset_or_zero_on_unknown,
-        )
-        for resp in group_resps:
-            group_offsets.setdefault(
-                resp.topic,
-                {},
-            )[resp.partition] = resp.offset
+    # fail_on_error = False does not prevent network errors
+    group_resps, = _send_to_storage(
+        kafka_client,
+        offset_storage,
+        OFFSET_FETCH_APIS,
+        group,
+        group_offset_reqs,
+        fail_on_error=False,
+        callback=(
+            pluck_topic_offset_or_none_on_unknown if skip_missing
+            else pluck_topic_offset_or_zero_on_unknown
+        ),
+    )
+    for resp in group_resps:
+        if resp.offset is None:
+            continue
+        group_offsets.setdefault(
+            resp.topic,
+            {},
+        )[resp.partition] = resp.offset
 
     return group_offsets
 
@@ -245,14 +370,16 @@ def get_topics_watermarks(kafka_client, topics, raise_on_error=True):
     NOTE: This method does not refresh client metadata. It is up to the caller
     to use avoid using stale metadata.
 
-    If any partition leader is not available, the request fails for all the
-    other topics. This is the tradeoff of sending all topic requests in batch
-    and save both in performance and Kafka load.
+    The highmark and lowmark requests are grouped by partition leader and
+    sent to all the leaders at once, see
+    :py:meth:`~kafka_utils.util.client.KafkaToolClient.send_offset_requests_pipelined`.
+    If a partition leader is not available, only its partitions fail, after
+    being retried with refreshed metadata.
 
     :param kafka_client: a connected KafkaToolClient
     :param topics: topic list or dict {<topic>: [partitions]}
-    :param raise_on_error: if False the method ignores missing topics
-      and missing partitions. It still may fail on the request send.
+    :param raise_on_error: if False the method ignores missing topics,
+      missing partitions and partitions whose leader is not available.
     :returns: a dict topic: partition: Part
     :raises:
       :py:class:`~kafka_utils.util.error.UnknownTopic`: upon missing
@@ -292,40 +419,144 @@ def get_topics_watermarks(kafka_client, topics, raise_on_error=True):
     if not (len(highmark_offset_reqs) + len(lowmark_offset_reqs)):
         return watermark_offsets
 
-    # fail_on_error = False does not prevent network errors
-    highmark_resps = kafka_client.send_offset_request(
-        highmark_offset_reqs,
-        fail_on_error=False,
-        callback=_check_fetch_response_error,
+    highmark_resps, lowmark_resps = \
+        kafka_client.send_offset_requests_pipelined(
+            [highmark_offset_reqs, lowmark_offset_reqs],
+        )
+
+    # Responses are in the same order of the requests
+    for highmark_resp, lowmark_resp in zip(highmark_resps, lowmark_resps):
+        failed = [
+            resp for resp in (highmark_resp, lowmark_resp)
+            if isinstance(resp, FailedPayloadsError)
+        ]
+        if failed:
+            if raise_on_error:
+                raise failed[0]
+            log.warning(
+                'Skipping watermarks of topic %s partition %d: leader not '
+                'available.',
+                failed[0].payload.topic,
+                failed[0].payload.partition,
+            )
+            continue
+        highmark_resp = _check_fetch_response_error(highmark_resp)
+        lowmark_resp = _check_fetch_response_error(lowmark_resp)
+        watermark_offsets.setdefault(
+            highmark_resp.topic,
+            {},
+        )[highmark_resp.partition] = PartitionOffsets(
+            highmark_resp.topic,
+            highmark_resp.partition,
+            highmark_resp.offsets[0],
+            lowmark_resp.offsets[0],
+        )
+    return watermark_offsets
+
+
+def get_offsets_for_times(
+    kafka_client,
+    topics,
+    timestamp,
+    raise_on_error=True,
+):
+    """ Get the offsets of the topic partitions at a point in time.
+
+    NOTE: This method does not refresh client metadata. It is up to the caller
+    to avoid using stale metadata.
+
+    Kafka answers an OffsetRequest with a time with the base offset of the
+    last log segment older than that time, so the offset can be up to a log
+    segment earlier than timestamp. Partitions without any segment older
+    than timestamp get their low watermark.
+
+    The requests are grouped by partition leader and sent to all the leaders
+    at once, like in :py:func:`get_topics_watermarks`.
+
+    :param kafka_client: a connected KafkaToolClient
+    :param topics: topic list or dict {<topic>: [partitions]}
+    :param timestamp: milliseconds since epoch
+    :param raise_on_error: if False the method ignores missing topics,
+      missing partitions and partitions whose offsets can't be fetched.
+    :returns: a dict topic: partition: offset
+    :raises:
+      :py:class:`~kafka_utils.util.error.UnknownTopic`: upon missing
+      topics and raise_on_error=True
+
+      :py:class:`~kafka_utils.util.error.UnknownPartition`: upon missing
+      partitions and raise_on_error=True
+
+      FailedPayloadsError: upon send request error.
+
+      ValueError: upon negative timestamp.
+    """
+    if timestamp < 0:
+        raise ValueError(
+            "Invalid timestamp: {timestamp}".format(timestamp=timestamp),
+        )
+    topics = _verify_topics_and_partitions(
+        kafka_client,
+        topics,
+        raise_on_error,
     )
-    lowmark_resps = kafka_client.send_offset_request(
-        lowmark_offset_reqs,
-        fail_on_error=False,
-        callback=_check_fetch_response_error,
+    time_offset_reqs = []
+    lowmark_offset_reqs = []
+    for topic, partitions in topics.iteritems():
+        for partition in partitions:
+            time_offset_reqs.append(
+                OffsetRequest(
+                    kafka_bytestring(topic), partition, timestamp, max_offsets=1
+                )
+            )
+            lowmark_offset_reqs.append(
+                OffsetRequest(
+                    kafka_bytestring(topic), partition, -2, max_offsets=1
+                )
+            )
+
+    offsets = {}
+    if not time_offset_reqs:
+        return offsets
+
+    time_resps, lowmark_resps = kafka_client.send_offset_requests_pipelined(
+        [time_offset_reqs, lowmark_offset_reqs],
     )
 
-    # At this point highmark and lowmark should ideally have the same length.
-    assert len(highmark_resps) == len(lowmark_resps)
-    aggregated_offsets = defaultdict(lambda: defaultdict(dict))
-    for resp in highmark_resps:
-        aggregated_offsets[resp.topic][resp.partition]['highmark'] = \
-            resp.offsets[0]
-    for resp in lowmark_resps:
-        aggregated_offsets[resp.topic][resp.partition]['lowmark'] = \
-            resp.offsets[0]
-
-    for topic, partition_watermarks in aggregated_offsets.iteritems():
-        for partition, watermarks in partition_watermarks.iteritems():
-            watermark_offsets.setdefault(
-                topic,
-                {},
-            )[partition] = PartitionOffsets(
-                topic,
-                partition,
-                watermarks['highmark'],
-                watermarks['lowmark'],
+    # Responses are in the same order of the requests
+    for time_resp, lowmark_resp in zip(time_resps, lowmark_resps):
+        failed = [
+            resp for resp in (time_resp, lowmark_resp)
+            if isinstance(resp, FailedPayloadsError)
+        ]
+        if failed:
+            if raise_on_error:
+                raise failed[0]
+            log.warning(
+                'Skipping offsets of topic %s partition %d: leader not '
+                'available.',
+                failed[0].payload.topic,
+                failed[0].payload.partition,
             )
-    return watermark_offsets
+            continue
+        time_resp = _check_fetch_response_error(time_resp)
+        lowmark_resp = _check_fetch_response_error(lowmark_resp)
+        if time_resp.error or lowmark_resp.error:
+            # Committing the error offset (-1) would reset the group
+            log.warning(
+                'Skipping offsets of topic %s partition %d: error code %d.',
+                time_resp.topic,
+                time_resp.partition,
+                time_resp.error or lowmark_resp.error,
+            )
+            continue
+        lowmark = lowmark_resp.offsets[0]
+        # No log segment is older than timestamp
+        offset = time_resp.offsets[0] if time_resp.offsets else lowmark
+        offsets.setdefault(
+            time_resp.topic,
+            {},
+        )[time_resp.partition] = max(offset, lowmark)
+    return offsets
 
 
 def _commit_offsets_to_watermark(
@@ -335,10 +566,22 @@ def _commit_offsets_to_watermark(
     watermark,
     raise_on_error,
     offset_storage,
+    watermark_cache=None,
 ):
     topics = _verify_topics_and_partitions(kafka_client, topics, raise_on_error)
 
-    watermark_offsets = get_topics_watermarks(kafka_client, topics, raise_on_error)
+    if watermark_cache is not None:
+        watermark_offsets = watermark_cache.get_topics_watermarks(
+            kafka_client,
+            topics,
+            raise_on_error,
+        )
+    else:
+        watermark_offsets = get_topics_watermarks(
+            kafka_client,
+            topics,
+            raise_on_error,
+        )
 
     if watermark == HIGH_WATERMARK:
         group_offset_reqs = [
@@ -363,23 +606,26 @@ def _commit_offsets_to_watermark(
             "Unknown watermark: {watermark}".format(watermark=watermark)
         )
 
-    if offset_storage == 'zookeeper' or not offset_storage:
-        send_api = kafka_client.send_offset_commit_request
-    elif offset_storage == 'kafka':
-        send_api = kafka_client.send_offset_commit_request_kafka
-    else:
-        raise InvalidOffsetStorageError(offset_storage)
-
-    status = []
+    statuses = _send_to_storage(
+        kafka_client,
+        offset_storage,
+        OFFSET_COMMIT_APIS,
+        group,
+        group_offset_reqs,
+        fail_on_error=raise_on_error,
+        callback=_check_commit_response_error,
+    )
     if group_offset_reqs:
-        status = send_api(
-            kafka_bytestring(group),
-            group_offset_reqs,
-            raise_on_error,
-            callback=_check_commit_response_error
-        )
-
-    return filter(None, status)
+        # Later reads in the same run must see the current state
+        if watermark_cache is not None:
+            watermark_cache.invalidate(kafka_client, topics)
+
+    return [
+        error
+        for status in statuses
+        for error in status
+        if error is not None
+    ]
 
 
 def advance_consumer_offsets(
@@ -388,12 +634,14 @@ def advance_consumer_offsets(
     topics,
     raise_on_error=True,
     offset_storage='zookeeper',
+    watermark_cache=None,
+    metadata_token=None,
 ):
     """Advance consumer offsets to the latest message in the topic
     partition (the high watermark).
 
-    This method shall refresh the client metadata prior to updating
-    the offsets.
+    This method shall refresh the client metadata of the topics prior to
+    updating the offsets, unless metadata_token shows it is still fresh.
 
     If any partition leader is not available, the request fails for all the
     other topics. This is the tradeoff of sending all topic requests in batch
@@ -404,7 +652,13 @@ def advance_consumer_offsets(
     :param topics: topic list or dict {<topic>: [partitions]}
     :param raise_on_error: if False the method does not raise exceptions
       on missing topics/partitions. It may still fail on the request send.
-    :param offset_storage: String, one of {zookeeper, kafka}.
+    :param offset_storage: String, one of {zookeeper, kafka, dual}. With dual
+      the offsets are committed to both the storages concurrently.
+    :param watermark_cache: optional
+      :py:class:`~kafka_utils.util.monitoring.WatermarkCache` used to fetch
+      the watermarks. The committed topics are invalidated in the cache.
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client, if any.
     :returns: a list of errors for each partition offset update that failed.
     :rtype: list [OffsetCommitError]
     :raises:
@@ -416,12 +670,12 @@ def advance_consumer_offsets(
 
       FailedPayloadsError: upon send request error.
     """
-    kafka_client.load_metadata_for_topics()
+    kafka_client.refresh_metadata(topics, metadata_token)
 
     return _commit_offsets_to_watermark(
         kafka_client, group, topics,
         HIGH_WATERMARK, raise_on_error,
-        offset_storage,
+        offset_storage, watermark_cache,
     )
 
 
@@ -431,12 +685,14 @@ def rewind_consumer_offsets(
     topics,
     raise_on_error=True,
     offset_storage='zookeeper',
+    watermark_cache=None,
+    metadata_token=None,
 ):
     """Rewind consumer offsets to the earliest message in the topic
     partition (the low watermark).
 
-    This method shall refresh the client metadata prior to updating
-    the offsets.
+    This method shall refresh the client metadata of the topics prior to
+    updating the offsets, unless metadata_token shows it is still fresh.
 
     If any partition leader is not available, the request fails for all the
     other topics. This is the tradeoff of sending all topic requests in batch
@@ -447,7 +703,13 @@ def rewind_consumer_offsets(
     :param topics: topic list or dict {<topic>: [partitions]}
     :param raise_on_error: if False the method does not raise exceptions
       on missing topics/partitions. It may still fail on the request send.
-    :param offset_storage: String, one of {zookeeper, kafka}.
+    :param offset_storage: String, one of {zookeeper, kafka, dual}. With dual
+      the offsets are committed to both the storages concurrently.
+    :param watermark_cache: optional
+      :py:class:`~kafka_utils.util.monitoring.WatermarkCache` used to fetch
+      the watermarks. The committed topics are invalidated in the cache.
+    :param metadata_token: MetadataToken returned by the last metadata
+      refresh of kafka_client, if any.
     :returns: a list of errors for each partition offset update that failed.
     :rtype: list [OffsetCommitError]
     :raises:
@@ -459,12 +721,12 @@ def rewind_consumer_offsets(
 
       FailedPayloadsError: upon send request error.
     """
-    kafka_client.load_metadata_for_topics()
+    kafka_client.refresh_metadata(topics, metadata_token)
 
     return _commit_offsets_to_watermark(
         kafka_client, group, topics,
         LOW_WATERMARK, raise_on_error,
-        offset_storage,
+        offset_storage, watermark_cache,
     )
 
 
@@ -489,7 +751,8 @@ def set_consumer_offsets(
     :param topics: dict {<topic>: {<partition>: <offset>}}
     :param raise_on_error: if False the method does not raise exceptions
       on errors encountered. It may still fail on the request send.
-    :param offset_storage: String, one of {zookeeper, kafka}.
+    :param offset_storage: String, one of {zookeeper, kafka, dual}. With dual
+      the offsets are committed to both the storages concurrently.
     :returns: a list of errors for each partition offset update that failed.
     :rtype: list [OffsetCommitError]
     :raises:
@@ -524,23 +787,22 @@ def set_consumer_offsets(
         for partition, offset in new_partition_offsets.iteritems()
     ]
 
-    if offset_storage == 'zookeeper' or not offset_storage:
-        send_api = kafka_client.send_offset_commit_request
-    elif offset_storage == 'kafka':
-        send_api = kafka_client.send_offset_commit_request_kafka
-    else:
-        raise InvalidOffsetStorageError(offset_storage)
-
-    status = []
-    if group_offset_reqs:
-        status = send_api(
-            kafka_bytestring(group),
-            group_offset_reqs,
-            raise_on_error,
-            callback=_check_commit_response_error
-        )
+    statuses = _send_to_storage(
+        kafka_client,
+        offset_storage,
+        OFFSET_COMMIT_APIS,
+        group,
+        group_offset_reqs,
+        fail_on_error=raise_on_error,
+        callback=_check_commit_response_error,
+    )
 
-    return filter(None, status)
+    return [
+        error
+        for status in statuses
+        for error in status
+        if error is not None
+    ]
 
 
 def _nullify_partition_offsets(partition_offsets):
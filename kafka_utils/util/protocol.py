@@ -16,7 +16,16 @@ import struct
 
 from kafka.protocol import KafkaProtocol
 from kafka.util import group_by_topic_and_partition
-from kafka.util import write_short_string
+
+
+# Size, ApiKey, ApiVersion, CorrelationId and ClientId length
+_REQUEST_HEADER = struct.Struct('>ihhih')
+# ConsumerGroupGenerationId, ConsumerId length, RetentionTime and topics count
+_OFFSET_COMMIT_FIELDS = struct.Struct('>ihqi')
+_SHORT = struct.Struct('>h')
+_INT = struct.Struct('>i')
+# Partition, Offset and Metadata length
+_OFFSET_COMMIT_PARTITION = struct.Struct('>iqh')
 
 
 class KafkaToolProtocol(KafkaProtocol):
@@ -26,32 +35,88 @@ class KafkaToolProtocol(KafkaProtocol):
                                            group, payloads):
         """
         Encode some OffsetCommitRequest structs
+
+        The size of the request is computed first and every field is packed
+        directly into a single preallocated buffer, without intermediate
+        strings. Large commits only allocate the request itself.
+
         Arguments:
             client_id: string
             correlation_id: int
             group: string, the consumer group you are committing offsets for
             payloads: list of OffsetCommitRequest
+
+        Returns:
+            bytearray with the size-prefixed request
         """
         grouped_payloads = group_by_topic_and_partition(payloads)
 
-        message = []
-        message.append(cls._encode_message_header(
-            client_id, correlation_id,
+        header_size = _REQUEST_HEADER.size + len(client_id) + _SHORT.size + len(group)
+        topics_size = sum(
+            _SHORT.size + len(topic) + _INT.size
+            for topic in grouped_payloads
+        )
+        partitions_size = len(payloads) * _OFFSET_COMMIT_PARTITION.size
+        metadata_size = sum(
+            len(payload.metadata) for payload in payloads
+            if payload.metadata is not None
+        )
+        size = header_size + _OFFSET_COMMIT_FIELDS.size + topics_size
+        size += partitions_size + metadata_size
+
+        buf = bytearray(size)
+        _REQUEST_HEADER.pack_into(
+            buf, 0,
+            size - _INT.size,
             KafkaProtocol.OFFSET_COMMIT_KEY,
-            version=2))
-        message.append(write_short_string(group))
-        message.append(struct.pack('>i', -1))   # ConsumerGroupGenerationId
-        message.append(write_short_string(''))  # ConsumerId
-        message.append(struct.pack('>q', -1))   # Retention time
-        message.append(struct.pack('>i', len(grouped_payloads)))
-
-        for topic, topic_payloads in grouped_payloads.items():
-            message.append(write_short_string(topic))
-            message.append(struct.pack('>i', len(topic_payloads)))
-
-            for partition, payload in topic_payloads.items():
-                message.append(struct.pack('>iq', partition, payload.offset))
-                message.append(write_short_string(payload.metadata))
-
-        msg = b''.join(message)
-        return struct.pack('>i%ds' % len(msg), len(msg), msg)
+            2,  # ApiVersion
+            correlation_id,
+            len(client_id),
+        )
+        cur = cls._write_bytes(buf, _REQUEST_HEADER.size, client_id)
+        _SHORT.pack_into(buf, cur, len(group))
+        cur = cls._write_bytes(buf, cur + _SHORT.size, group)
+        _OFFSET_COMMIT_FIELDS.pack_into(
+            buf, cur,
+            -1,  # ConsumerGroupGenerationId
+            0,   # Empty ConsumerId
+            -1,  # RetentionTime
+            len(grouped_payloads),
+        )
+        cur += _OFFSET_COMMIT_FIELDS.size
+
+        # Hot loop, one iteration per partition
+        pack_partition = _OFFSET_COMMIT_PARTITION.pack_into
+        partition_size = _OFFSET_COMMIT_PARTITION.size
+        for topic, topic_payloads in grouped_payloads.iteritems():
+            _SHORT.pack_into(buf, cur, len(topic))
+            cur = cls._write_bytes(buf, cur + _SHORT.size, topic)
+            _INT.pack_into(buf, cur, len(topic_payloads))
+            cur += _INT.size
+
+            for partition, payload in topic_payloads.iteritems():
+                metadata = payload.metadata
+                if metadata is None:
+                    pack_partition(buf, cur, partition, payload.offset, -1)
+                    cur += partition_size
+                else:
+                    pack_partition(
+                        buf, cur, partition, payload.offset, len(metadata),
+                    )
+                    cur = cls._write_bytes(buf, cur + partition_size, metadata)
+
+        return buf
+
+    @classmethod
+    def _write_bytes(cls, buf, cur, data):
+        """Copy data into buf at cur and return the position after it."""
+        if not isinstance(data, bytes):
+            raise TypeError(
+                'Expected "{type}" to be bytes\ndata={data!r}'.format(
+                    type=type(data),
+                    data=data,
+                ),
+            )
+        end = cur + len(data)
+        buf[cur:end] = data
+        return end
@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from kafka_utils.util.validation import plan_to_assignment
+from kafka_utils.util.validation import validate_plan
+
+
+# The zookeeper default jute.maxbuffer is 1MB. Keep some room for the
+# znode overhead.
+MAX_PLAN_SIZE = 900 * 1024
+DEFAULT_POLL_INTERVAL = 10  # seconds
+DEFAULT_MAX_STRAGGLERS = 10
+
+_log = logging.getLogger('kafka-reassignment')
+
+
+def get_movement_count(replicas, new_replicas):
+    """Number of replicas that have to be moved to a new broker."""
+    return len(set(new_replicas) - set(replicas))
+
+
+def split_plan(
+    plan,
+    base_assignment,
+    max_movements=None,
+    max_plan_size=MAX_PLAN_SIZE,
+):
+    """Split a reassignment plan in smaller plans.
+
+    Every plan has at most max_movements replica movements and its json
+    serialization is smaller than max_plan_size bytes. Partitions whose
+    movement count is larger than max_movements get a plan on their own.
+
+    :param plan: reassignment plan
+    :param base_assignment: current cluster assignment, used to count the
+      replica movements of each partition.
+    :param max_movements: maximum number of replica movements per plan, None
+      for no limit.
+    :param max_plan_size: maximum size in bytes of a serialized plan.
+    :returns: list of plans
+    """
+    # Size of the serialized plan without partitions
+    empty_plan_size = len(json.dumps({'version': 1, 'partitions': []}))
+    batches = []
+    batch, batch_movements, batch_size = [], 0, empty_plan_size
+    for p_data in plan['partitions']:
+        movements = get_movement_count(
+            base_assignment.get((p_data['topic'], p_data['partition']), []),
+            p_data['replicas'],
+        )
+        size = len(json.dumps(p_data))
+        too_many_movements = (
+            max_movements is not None and batch_movements + movements > max_movements
+        )
+        # Partitions are separated by ', '
+        too_large = batch_size + size + 2 > max_plan_size
+        if batch and (too_many_movements or too_large):
+            batches.append(batch)
+            batch, batch_movements, batch_size = [], 0, empty_plan_size
+        batch_size += size + 2 if batch else size
+        batch.append(p_data)
+        batch_movements += movements
+    if batch:
+        batches.append(batch)
+    return [{'version': plan['version'], 'partitions': b} for b in batches]
+
+
+def get_broker_traffic(p_data, base_assignment, get_size):
+    """Replication traffic caused on each broker by the reassignment of a
+    partition.
+
+    Every new replica copies the whole partition from the current leader, so
+    both the leader and the new replica broker are charged the partition
+    size for each new replica.
+
+    :param p_data: partition data of a reassignment plan
+    :param base_assignment: current cluster assignment
+    :param get_size: function returning the size of a (topic, partition)
+    :returns: dict broker: traffic
+    """
+    name = (p_data['topic'], p_data['partition'])
+    replicas = base_assignment.get(name, [])
+    new_replicas = set(p_data['replicas']) - set(replicas)
+    traffic = {}
+    if not new_replicas:
+        return traffic
+    size = get_size(name)
+    for broker in new_replicas:
+        traffic[broker] = traffic.get(broker, 0) + size
+    if replicas:
+        traffic[replicas[0]] = traffic.get(replicas[0], 0) + size * len(new_replicas)
+    return traffic
+
+
+def schedule_plan(
+    plan,
+    base_assignment,
+    get_size,
+    max_batch_size,
+    max_broker_size=None,
+):
+    """Split a reassignment plan in batches bounded in the amount of data
+    replicated at once.
+
+    Each replica movement copies the size of its partition. The size of a
+    batch is the total size copied by its movements and it is kept under
+    max_batch_size. If max_broker_size is given, the traffic on every single
+    broker, either as leader or as new replica, is also kept under it so that
+    the movements of a batch are spread across the brokers. Partitions too big
+    for the limits get a batch on their own. Leader-only changes don't copy
+    any data and are part of the first batch.
+
+    Movements are scheduled largest first, filling every batch with the
+    largest movements that fit (first fit decreasing).
+
+    :param plan: reassignment plan
+    :param base_assignment: current cluster assignment
+    :param get_size: function returning the size of a (topic, partition),
+      e.g. PartitionMeasurer.get_size
+    :param max_batch_size: maximum size copied by a batch
+    :param max_broker_size: maximum size copied to or from a broker in a
+      batch, None for no limit.
+    :returns: list of plans
+    """
+    leader_changes = []
+    movements = []
+    for p_data in plan['partitions']:
+        name = (p_data['topic'], p_data['partition'])
+        movement_count = get_movement_count(
+            base_assignment.get(name, []),
+            p_data['replicas'],
+        )
+        if movement_count:
+            movements.append((
+                get_size(name) * movement_count,
+                get_broker_traffic(p_data, base_assignment, get_size),
+                p_data,
+            ))
+        else:
+            leader_changes.append(p_data)
+    movements.sort(key=lambda movement: movement[0], reverse=True)
+
+    batches = []
+    while movements:
+        batch, batch_size, broker_load = [], 0, {}
+        remaining = []
+        for size, traffic, p_data in movements:
+            fits = not batch or (
+                batch_size + size <= max_batch_size and (
+                    max_broker_size is None or all(
+                        broker_load.get(broker, 0) + broker_traffic <= max_broker_size
+                        for broker, broker_traffic in traffic.iteritems()
+                    )
+                )
+            )
+            if fits:
+                batch.append(p_data)
+                batch_size += size
+                for broker, broker_traffic in traffic.iteritems():
+                    broker_load[broker] = broker_load.get(broker, 0) + broker_traffic
+            else:
+                remaining.append((size, traffic, p_data))
+        batches.append(batch)
+        movements = remaining
+
+    if leader_changes:
+        if batches:
+            batches[0] = leader_changes + batches[0]
+        else:
+            batches.append(leader_changes)
+    return [{'version': plan['version'], 'partitions': b} for b in batches]
+
+
+def estimate_duration(batches, base_assignment, get_size, throughput):
+    """Estimate the time needed to execute the given batches.
+
+    A batch completes when its busiest broker has copied all its data, so the
+    duration of a batch is the traffic of the busiest broker divided by the
+    replication throughput of a broker.
+
+    :param batches: list of plans
+    :param base_assignment: current cluster assignment
+    :param get_size: function returning the size of a (topic, partition)
+    :param throughput: replication throughput of a broker in size units per
+      second
+    :returns: estimated duration in seconds
+    """
+    duration = 0.0
+    for batch in batches:
+        broker_load = {}
+        for p_data in batch['partitions']:
+            traffic = get_broker_traffic(p_data, base_assignment, get_size)
+            for broker, broker_traffic in traffic.iteritems():
+                broker_load[broker] = broker_load.get(broker, 0) + broker_traffic
+        if broker_load:
+            duration += max(broker_load.itervalues()) / float(throughput)
+    return duration
+
+
+class ReassignmentCheckpoint(object):
+    """Record of the partitions whose reassignment completed, persisted in a
+    json file so that an interrupted execution can be resumed.
+
+    A partition is considered completed only if it was reassigned to the same
+    replicas, so that a checkpoint can't skip partitions of a different plan.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.completed = set()
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+            self.completed = set(
+                self._key(p_data) for p_data in data['partitions']
+            )
+            _log.info(
+                'Loaded checkpoint {path} with {count} completed partitions.'
+                .format(path=path, count=len(self.completed)),
+            )
+
+    def _key(self, p_data):
+        return (p_data['topic'], p_data['partition'], tuple(p_data['replicas']))
+
+    def is_completed(self, p_data):
+        return self._key(p_data) in self.completed
+
+    def add(self, plan):
+        """Mark all the partitions of the plan as completed."""
+        self.completed.update(self._key(p_data) for p_data in plan['partitions'])
+        if not self.path:
+            return
+        data = {
+            'version': 1,
+            'partitions': [
+                {'topic': topic, 'partition': partition, 'replicas': list(replicas)}
+                for topic, partition, replicas in sorted(self.completed)
+            ],
+        }
+        # Write and rename so that a crash never leaves a truncated file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        os.rename(tmp_path, self.path)
+
+
+class ReassignmentExecutor(object):
+    """Execute a reassignment plan in batches.
+
+    The plan is validated once and split in batches bounded in replica
+    movements and in size, see split_plan. Each batch is submitted to
+    zookeeper only after the previous one completed, so that large plans
+    don't exceed the zookeeper node size and don't overload the controller.
+
+    :param zk: open ZK instance
+    :param max_movements: maximum number of replica movements per batch
+    :param max_plan_size: maximum size in bytes of a batch
+    :param checkpoint_file: path of the file used to record the completed
+      partitions. Partitions already completed are skipped.
+    :param poll_interval: seconds between progress reports while waiting
+      for a batch to complete
+    :param get_size: function returning the size of a (topic, partition),
+      required to schedule the batches by size, see schedule_plan.
+    :param max_batch_size: maximum size copied by a batch
+    :param max_broker_size: maximum size copied to or from a broker in a batch
+    :param throughput: replication throughput of a broker in size units per
+      second, used to report the estimated completion time.
+    """
+
+    def __init__(
+        self,
+        zk,
+        max_movements=None,
+        max_plan_size=MAX_PLAN_SIZE,
+        checkpoint_file=None,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        get_size=None,
+        max_batch_size=None,
+        max_broker_size=None,
+        throughput=None,
+    ):
+        self.zk = zk
+        self.max_movements = max_movements
+        self.max_plan_size = max_plan_size
+        self.checkpoint = ReassignmentCheckpoint(checkpoint_file)
+        self.poll_interval = poll_interval
+        self.get_size = get_size
+        self.max_batch_size = max_batch_size
+        self.max_broker_size = max_broker_size
+        self.throughput = throughput
+
+    def get_batches(self, plan, base_assignment):
+        """Split the partitions of the plan not yet completed in batches."""
+        remaining_plan = {
+            'version': plan['version'],
+            'partitions': [
+                p_data for p_data in plan['partitions']
+                if not self.checkpoint.is_completed(p_data)
+            ],
+        }
+        if self.max_batch_size is None:
+            return split_plan(
+                remaining_plan,
+                base_assignment,
+                self.max_movements,
+                self.max_plan_size,
+            )
+        # Size scheduled batches still honour the movements and size limits
+        return [
+            batch
+            for scheduled_batch in schedule_plan(
+                remaining_plan,
+                base_assignment,
+                self.get_size,
+                self.max_batch_size,
+                self.max_broker_size,
+            )
+            for batch in split_plan(
+                scheduled_batch,
+                base_assignment,
+                self.max_movements,
+                self.max_plan_size,
+            )
+        ]
+
+    def execute(self, plan, allow_rf_change=False):
+        """Validate the plan and execute it batch by batch.
+
+        :returns: True if all the batches were executed successfully
+        """
+        base_plan = self.zk.get_cluster_plan()
+        if not validate_plan(plan, base_plan, allow_rf_change=allow_rf_change):
+            _log.error('Given plan is invalid. ABORTING reassignment...')
+            return False
+        base_assignment = plan_to_assignment(base_plan)
+        batches = self.get_batches(plan, base_assignment)
+        total = len(plan['partitions'])
+        done = total - sum(len(batch['partitions']) for batch in batches)
+        _log.info(
+            'Executing {count} partition(s) reassignment in {batches} batches. '
+            '{done} partition(s) already completed.'
+            .format(count=total, batches=len(batches), done=done),
+        )
+        self.log_estimated_duration(batches, base_assignment)
+
+        # An interrupted execution may have left a batch in progress
+        self.wait_for_batch()
+        for i, batch in enumerate(batches, 1):
+            _log.info(
+                'Submitting batch {i}/{batches} with {count} partition(s).'
+                .format(i=i, batches=len(batches), count=len(batch['partitions'])),
+            )
+            if not self.zk.execute_plan(batch, validate=False):
+                _log.error(
+                    'Batch {i}/{batches} submission failed. ABORTING '
+                    'reassignment...'.format(i=i, batches=len(batches)),
+                )
+                return False
+            self.wait_for_batch()
+            self.checkpoint.add(batch)
+            done += len(batch['partitions'])
+            _log.info(
+                'Batch {i}/{batches} completed. Progress: {done}/{total} '
+                'partition(s) ({percent:.1f}%).'.format(
+                    i=i,
+                    batches=len(batches),
+                    done=done,
+                    total=total,
+                    percent=done * 100.0 / total,
+                ),
+            )
+            self.log_estimated_duration(batches[i:], base_assignment)
+        return True
+
+    def log_estimated_duration(self, batches, base_assignment):
+        if not (self.throughput and self.get_size and batches):
+            return
+        duration = estimate_duration(
+            batches,
+            base_assignment,
+            self.get_size,
+            self.throughput,
+        )
+        _log.info(
+            'Estimated time to complete {batches} batches: {duration}.'
+            .format(
+                batches=len(batches),
+                duration=timedelta(seconds=int(duration)),
+            ),
+        )
+
+    def wait_for_batch(self):
+        """Wait until no reassignment is pending."""
+        while not self.zk.wait_for_reassignment(self.poll_interval):
+            pending_plan = self.zk.get_pending_plan()
+            _log.info(
+                'Waiting for {count} partition(s) reassignment to complete.'
+                .format(count=len(pending_plan.get('partitions', []))),
+            )
+
+
+PartitionProgress = namedtuple(
+    'PartitionProgress',
+    ['topic', 'partition', 'replicas', 'isr', 'missing', 'size'],
+)
+"""Tuple representing the reassignment state of an in-flight partition.
+
+* **topic**\\(``str``): Name of the topic
+* **partition**\\(``int``): Partition number
+* **replicas**\\(``list``): Target replicas of the reassignment
+* **isr**\\(``list``): Current in-sync replicas
+* **missing**\\(``list``): Target replicas not in the ISR yet
+* **size**\\(``float``): Size of the partition
+"""
+
+ReassignmentStatus = namedtuple(
+    'ReassignmentStatus',
+    [
+        'total',
+        'completed',
+        'in_flight',
+        'percent',
+        'elapsed',
+        'throughput',
+        'eta',
+        'stragglers',
+    ],
+)
+"""Tuple representing the progress of a reassignment observed by a
+ReassignmentMonitor.
+
+* **total**\\(``int``): Number of partitions seen in the reassignment
+* **completed**\\(``int``): Number of completed partitions
+* **in_flight**\\(``int``): Number of partitions still being reassigned
+* **percent**\\(``float``): Completed percentage, weighted by partition size
+* **elapsed**\\(``float``): Seconds since the first poll
+* **throughput**\\(``float``): Size of completed partitions per second, None
+  until the first partition completes
+* **eta**\\(``float``): Estimated seconds to completion, None until the first
+  partition completes
+* **stragglers**\\(``list``): :py:class:`PartitionProgress` of the slowest
+  in-flight partitions
+"""
+
+
+def format_progress(status):
+    """Single line summary of a ReassignmentStatus."""
+    return (
+        '{completed}/{total} partition(s) completed ({percent:.1f}%), '
+        '{in_flight} in flight. Elapsed: {elapsed}. Throughput: {throughput}. '
+        'ETA: {eta}.'.format(
+            completed=status.completed,
+            total=status.total,
+            percent=status.percent,
+            in_flight=status.in_flight,
+            elapsed=timedelta(seconds=int(status.elapsed)),
+            throughput='{0:.2f}/s'.format(status.throughput)
+            if status.throughput is not None else 'n/a',
+            eta=timedelta(seconds=int(status.eta))
+            if status.eta is not None else 'n/a',
+        )
+    )
+
+
+class ReassignmentMonitor(object):
+    """Track the progress of the partitions in the reassign_partitions node.
+
+    Every poll reads the pending plan and the state of its partitions, with
+    pipelined zookeeper requests. Partitions seen in the pending plan are
+    tracked until kafka removes them from the node, which happens once all
+    their target replicas joined the ISR and the old replicas were deleted.
+    Partitions that completed before the first poll are not accounted.
+
+    :param zk: open ZK instance
+    :param get_size: function returning the size of a (topic, partition),
+      e.g. PartitionMeasurer.get_size. Every partition has size 1 if None.
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, zk, get_size=None, clock=time.time):
+        self.zk = zk
+        self.get_size = get_size
+        self.clock = clock
+        self.start_time = None
+        self.partitions = {}
+        self.completed = set()
+
+    def _size(self, name):
+        return self.get_size(name) if self.get_size else 1
+
+    def poll(self, max_stragglers=DEFAULT_MAX_STRAGGLERS):
+        """Read the reassignment state and update the progress.
+
+        :param max_stragglers: maximum number of stragglers reported
+        :returns: ReassignmentStatus. The stragglers are the in-flight
+          partitions with most target replicas out of the ISR, biggest first.
+        """
+        now = self.clock()
+        if self.start_time is None:
+            self.start_time = now
+        pending = {
+            (p_data['topic'], p_data['partition']): p_data['replicas']
+            for p_data in self.zk.get_pending_plan().get('partitions', [])
+        }
+        self.partitions.update(pending)
+        self.completed = set(self.partitions) - set(pending)
+        states = self.zk.get_partitions_state(sorted(pending))
+
+        in_flight = []
+        for name, replicas in pending.iteritems():
+            isr = states[name].get('isr', [])
+            in_flight.append(PartitionProgress(
+                topic=name[0],
+                partition=name[1],
+                replicas=replicas,
+                isr=isr,
+                missing=[broker for broker in replicas if broker not in isr],
+                size=self._size(name),
+            ))
+
+        total_size = sum(self._size(name) for name in self.partitions)
+        completed_size = sum(self._size(name) for name in self.completed)
+        elapsed = now - self.start_time
+        throughput = (
+            completed_size / float(elapsed)
+            if elapsed and completed_size else None
+        )
+        return ReassignmentStatus(
+            total=len(self.partitions),
+            completed=len(self.completed),
+            in_flight=len(in_flight),
+            percent=completed_size * 100.0 / total_size if total_size else 100.0,
+            elapsed=elapsed,
+            throughput=throughput,
+            eta=(total_size - completed_size) / throughput if throughput else None,
+            stragglers=sorted(
+                in_flight,
+                key=lambda progress: (len(progress.missing), progress.size),
+                reverse=True,
+            )[:max_stragglers],
+        )
+
+    def watch(
+        self,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        max_stragglers=DEFAULT_MAX_STRAGGLERS,
+    ):
+        """Generator of the reassignment status, polled every poll_interval
+        seconds or as soon as the reassign_partitions node changes, until no
+        partition is in flight.
+        """
+        while True:
+            status = self.poll(max_stragglers)
+            yield status
+            if not status.in_flight:
+                return
+            self.zk.wait_for_reassignment(poll_interval)
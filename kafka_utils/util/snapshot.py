@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Append-only time series of consumer offsets snapshots.
+
+A snapshot file is a sequence of length-prefixed records, one per snapshot:
+
+* header: magic, format version, timestamp in ms, number of rows and size
+  of the body.
+* body: the table of strings, followed by one column per field.
+
+Each group and topic name is stored once in the table of strings. Columns
+are arrays of little-endian integers: group id, topic id, partition,
+current offset, high watermark and low watermark. Appending a snapshot never
+rewrites the file, and readers skip the snapshots they don't need by
+seeking over their body.
+"""
+import logging
+import struct
+from collections import namedtuple
+from itertools import izip
+
+from kafka_utils.util.error import InvalidSnapshotError
+from kafka_utils.util.monitoring import ConsumerPartitionOffsets
+
+
+SNAPSHOT_MAGIC = b'KOSS'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('<4sBqII')
+_COUNT = struct.Struct('<I')
+
+_log = logging.getLogger(__name__)
+
+
+SnapshotHeader = namedtuple(
+    'SnapshotHeader',
+    ['timestamp', 'rows', 'position', 'size'],
+)
+"""Header of a snapshot in a snapshot file.
+
+* **timestamp**\\(``int``): time of the snapshot, in ms since epoch
+* **rows**\\(``int``): number of partitions in the snapshot
+* **position**\\(``int``): position of the body in the file
+* **size**\\(``int``): size of the body, in bytes
+"""
+
+
+OffsetsDiff = namedtuple(
+    'OffsetsDiff',
+    ['group', 'topic', 'partition', 'consumed', 'produced', 'lag', 'lag_change'],
+)
+"""Progress of a group on a topic partition between two snapshots.
+
+* **group**\\(``str``): consumer group id
+* **topic**\\(``str``): name of the topic
+* **partition**\\(``int``): partition number
+* **consumed**\\(``int``): messages consumed, current offset difference
+* **produced**\\(``int``): messages produced, high watermark difference
+* **lag**\\(``int``): lag of the group in the latest snapshot
+* **lag_change**\\(``int``): lag difference
+"""
+
+
+def _pack_column(fmt, values):
+    return struct.pack('<{count}{fmt}'.format(count=len(values), fmt=fmt), *values)
+
+
+def _unpack_column(fmt, count, body, position):
+    column = struct.Struct('<{count}{fmt}'.format(count=count, fmt=fmt))
+    return column.unpack_from(body, position), position + column.size
+
+
+class OffsetsSnapshot(object):
+    """Offsets of many consumer groups at a point in time, stored
+    column-wise.
+
+    Row i holds the offsets of partition partitions[i] of topic
+    strings[topic_ids[i]] for group strings[group_ids[i]].
+
+    :param timestamp: time of the snapshot, in ms since epoch
+    :param strings: list of group and topic names
+    :param group_ids: column of group ids
+    :param topic_ids: column of topic ids
+    :param partitions: column of partitions
+    :param current: column of the group offsets
+    :param highmark: column of the high watermarks
+    :param lowmark: column of the low watermarks
+    """
+
+    def __init__(
+        self,
+        timestamp,
+        strings,
+        group_ids,
+        topic_ids,
+        partitions,
+        current,
+        highmark,
+        lowmark,
+    ):
+        self.timestamp = timestamp
+        self.strings = strings
+        self.group_ids = group_ids
+        self.topic_ids = topic_ids
+        self.partitions = partitions
+        self.current = current
+        self.highmark = highmark
+        self.lowmark = lowmark
+
+    def __len__(self):
+        return len(self.partitions)
+
+    @classmethod
+    def from_groups_offsets(cls, timestamp, groups_offsets):
+        """Build a snapshot from the offsets of many groups.
+
+        :param timestamp: time of the snapshot, in ms since epoch
+        :param groups_offsets: iterable of tuples (group, dict
+          <topic>: [ConsumerPartitionOffsets]), as returned by
+          get_groups_offsets_metadata.
+        """
+        string_ids = {}
+        group_ids = []
+        topic_ids = []
+        partitions = []
+        current = []
+        highmark = []
+        lowmark = []
+        for group, offsets in groups_offsets:
+            group_id = string_ids.setdefault(group, len(string_ids))
+            for topic, partitions_offsets in offsets.iteritems():
+                topic_id = string_ids.setdefault(topic, len(string_ids))
+                for partition_offsets in partitions_offsets:
+                    group_ids.append(group_id)
+                    topic_ids.append(topic_id)
+                    partitions.append(partition_offsets.partition)
+                    current.append(partition_offsets.current)
+                    highmark.append(partition_offsets.highmark)
+                    lowmark.append(partition_offsets.lowmark)
+        strings = sorted(string_ids, key=string_ids.get)
+        return cls(
+            timestamp,
+            strings,
+            group_ids,
+            topic_ids,
+            partitions,
+            current,
+            highmark,
+            lowmark,
+        )
+
+    def to_groups_offsets(self):
+        """:returns: dict group: topic: [ConsumerPartitionOffsets]"""
+        result = {}
+        for group_id, topic_id, partition, current, highmark, lowmark in izip(
+            self.group_ids,
+            self.topic_ids,
+            self.partitions,
+            self.current,
+            self.highmark,
+            self.lowmark,
+        ):
+            topic = self.strings[topic_id]
+            result.setdefault(self.strings[group_id], {}).setdefault(
+                topic, [],
+            ).append(
+                ConsumerPartitionOffsets(
+                    topic=topic,
+                    partition=partition,
+                    current=current,
+                    highmark=highmark,
+                    lowmark=lowmark,
+                ),
+            )
+        return result
+
+    def encode(self):
+        """:returns: the snapshot record, header included"""
+        names = [
+            string.encode('utf-8') if isinstance(string, unicode) else string
+            for string in self.strings
+        ]
+        body = b''.join([
+            _COUNT.pack(len(names)),
+            _pack_column('H', [len(name) for name in names]),
+            b''.join(names),
+            _pack_column('i', self.group_ids),
+            _pack_column('i', self.topic_ids),
+            _pack_column('i', self.partitions),
+            _pack_column('q', self.current),
+            _pack_column('q', self.highmark),
+            _pack_column('q', self.lowmark),
+        ])
+        header = _HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            self.timestamp,
+            len(self),
+            len(body),
+        )
+        return header + body
+
+    @classmethod
+    def decode(cls, header, body):
+        """Decode the body of a snapshot record.
+
+        :param header: SnapshotHeader of the record
+        :param body: bytes of the body
+        """
+        try:
+            strings_count, = _COUNT.unpack_from(body)
+            lengths, position = _unpack_column(
+                'H', strings_count, body, _COUNT.size,
+            )
+            strings = []
+            for length in lengths:
+                strings.append(body[position:position + length].decode('utf-8'))
+                position += length
+            columns = []
+            for fmt in ('i', 'i', 'i', 'q', 'q', 'q'):
+                column, position = _unpack_column(
+                    fmt, header.rows, body, position,
+                )
+                columns.append(column)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise InvalidSnapshotError(
+                'Invalid snapshot at {timestamp}: {error}'.format(
+                    timestamp=header.timestamp,
+                    error=e,
+                ),
+            )
+        return cls(header.timestamp, strings, *columns)
+
+    def get_partitions(self):
+        """:returns: list of tuples (group, topic, partition), one per row"""
+        strings = self.strings
+        return zip(
+            [strings[group_id] for group_id in self.group_ids],
+            [strings[topic_id] for topic_id in self.topic_ids],
+            self.partitions,
+        )
+
+    def is_aligned(self, other):
+        """True if both snapshots have the same partitions in the same rows."""
+        return all(
+            getattr(self, field) == getattr(other, field)
+            for field in ('strings', 'partitions', 'group_ids', 'topic_ids')
+        )
+
+
+def append_snapshot(path, snapshot):
+    """Append a snapshot at the end of a snapshot file. The file is created
+    if it doesn't exist.
+
+    :param path: path of the snapshot file
+    :param snapshot: OffsetsSnapshot
+    """
+    with open(path, 'ab') as f:
+        f.write(snapshot.encode())
+
+
+def read_snapshot_headers(path):
+    """Read the headers of the snapshots in a file, skipping their body.
+
+    A truncated record at the end of the file, left by an interrupted
+    append, is ignored.
+
+    :param path: path of the snapshot file
+    :returns: list of SnapshotHeader, in file order
+    :raises InvalidSnapshotError: if a record has an invalid header
+    """
+    headers = []
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        position = 0
+        while position + _HEADER.size <= file_size:
+            f.seek(position)
+            magic, version, timestamp, rows, size = _HEADER.unpack(
+                f.read(_HEADER.size),
+            )
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise InvalidSnapshotError(
+                    'Invalid snapshot header at position {position}'.format(
+                        position=position,
+                    ),
+                )
+            position += _HEADER.size
+            if position + size > file_size:
+                break
+            headers.append(SnapshotHeader(timestamp, rows, position, size))
+            position += size
+    if position != file_size:
+        _log.warning('Ignoring a truncated snapshot at the end of %s', path)
+    return headers
+
+
+def read_snapshots(path, start=None, end=None):
+    """Read the snapshots of a file taken between start and end. The body
+    of the other snapshots is never read.
+
+    :param path: path of the snapshot file
+    :param start: earliest timestamp in ms, or None
+    :param end: latest timestamp in ms, or None
+    :returns: generator of OffsetsSnapshot, in file order
+    """
+    headers = [
+        header for header in read_snapshot_headers(path)
+        if start is None or header.timestamp >= start
+        if end is None or header.timestamp <= end
+    ]
+    with open(path, 'rb') as f:
+        for header in headers:
+            f.seek(header.position)
+            yield OffsetsSnapshot.decode(header, f.read(header.size))
+
+
+def read_snapshot(path, header):
+    """Read a single snapshot of a file.
+
+    :param path: path of the snapshot file
+    :param header: SnapshotHeader returned by read_snapshot_headers
+    :returns: OffsetsSnapshot
+    """
+    with open(path, 'rb') as f:
+        f.seek(header.position)
+        return OffsetsSnapshot.decode(header, f.read(header.size))
+
+
+def diff_snapshots(old, new):
+    """Compare the offsets of two snapshots. Partitions missing from either
+    snapshot are skipped.
+
+    :param old: OffsetsSnapshot
+    :param new: later OffsetsSnapshot
+    :returns: list of OffsetsDiff, sorted by group, topic and partition
+    """
+    partitions = new.get_partitions()
+    if old.is_aligned(new):
+        # Snapshots of the same groups usually share their layout, compare
+        # them row by row
+        old_offsets = izip(old.current, old.highmark)
+    else:
+        offsets_by_partition = dict(izip(
+            old.get_partitions(),
+            izip(old.current, old.highmark),
+        ))
+        old_offsets = [
+            offsets_by_partition.get(partition) for partition in partitions
+        ]
+
+    result = []
+    for (group, topic, partition), current, highmark, old_offset in izip(
+        partitions,
+        new.current,
+        new.highmark,
+        old_offsets,
+    ):
+        if old_offset is None:
+            continue
+        old_current, old_highmark = old_offset
+        lag = max(highmark - current, 0)
+        result.append(OffsetsDiff(
+            group,
+            topic,
+            partition,
+            current - old_current,
+            highmark - old_highmark,
+            lag,
+            lag - max(old_highmark - old_current, 0),
+        ))
+    result.sort()
+    return result
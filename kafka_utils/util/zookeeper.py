@@ -14,10 +14,14 @@
 # limitations under the License.
 import json
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
 
 from kazoo.client import KazooClient
 from kazoo.exceptions import NodeExistsError
 from kazoo.exceptions import NoNodeError
+from kazoo.exceptions import RolledBackError
 from kazoo.retry import KazooRetry
 
 from kafka_utils.util.validation import validate_plan
@@ -25,34 +29,111 @@ from kafka_utils.util.validation import validate_plan
 
 ADMIN_PATH = "/admin"
 REASSIGNMENT_NODE = "reassign_partitions"
+# Maximum number of asynchronous zookeeper requests in flight at once
+ASYNC_WINDOW_SIZE = 100
+# Maximum number of operations of a zookeeper transaction. Offset nodes are
+# small, this keeps a transaction well within the default 1MB jute.maxbuffer.
+TRANSACTION_BATCH_SIZE = 1000
 _log = logging.getLogger('kafka-zookeeper-manager')
 
 
-class ZK:
-    """Opens a connection to a kafka zookeeper. "
-    "To be used in the 'with' statement."""
-
-    def __init__(self, cluster_config):
-        self.cluster_config = cluster_config
-
-    def __enter__(self):
+class ZKSessionRegistry(object):
+    """Process-wide registry of zookeeper sessions.
+
+    Sessions are keyed by ClusterConfig and reference counted, so that all
+    the ZK instances open at the same time on a cluster share a single
+    KazooClient session. A session is started by the first ZK entering it and
+    stopped when the last one exits, unless the registry is held open with
+    hold().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._holds = 0
+
+    def acquire(self, cluster_config):
+        """Return a started KazooClient for the given cluster, creating the
+        session if there is none."""
+        with self._lock:
+            if cluster_config not in self._sessions:
+                self._sessions[cluster_config] = [
+                    self._start_session(cluster_config),
+                    0,
+                ]
+            session = self._sessions[cluster_config]
+            session[1] += 1
+            return session[0]
+
+    def release(self, cluster_config):
+        """Release a session acquired with acquire. The session is stopped
+        when it is not referenced anymore and the registry is not held."""
+        with self._lock:
+            session = self._sessions[cluster_config]
+            session[1] -= 1
+            if session[1] == 0 and not self._holds:
+                self._stop_session(cluster_config)
+
+    @contextmanager
+    def hold(self):
+        """Keep the sessions open until the end of the with block, even when
+        they are not referenced by any ZK instance. Use it to wrap a whole
+        command invocation so that it opens at most one session per cluster.
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._holds -= 1
+                if not self._holds:
+                    for cluster_config, session in self._sessions.items():
+                        if session[1] == 0:
+                            self._stop_session(cluster_config)
+
+    def _start_session(self, cluster_config):
         kazooRetry = KazooRetry(
             max_tries=5,
         )
-        self.zk = KazooClient(
-            hosts=self.cluster_config.zookeeper,
+        zk = KazooClient(
+            hosts=cluster_config.zookeeper,
             read_only=True,
             connection_retry=kazooRetry,
         )
         _log.debug(
             "ZK: Creating new zookeeper connection: {zookeeper}"
-            .format(zookeeper=self.cluster_config.zookeeper),
+            .format(zookeeper=cluster_config.zookeeper),
         )
-        self.zk.start()
+        zk.start()
+        return zk
+
+    def _stop_session(self, cluster_config):
+        _log.debug(
+            "ZK: Closing zookeeper connection: {zookeeper}"
+            .format(zookeeper=cluster_config.zookeeper),
+        )
+        self._sessions.pop(cluster_config)[0].stop()
+
+
+session_registry = ZKSessionRegistry()
+
+
+class ZK:
+    """Opens a connection to a kafka zookeeper.
+    To be used in the 'with' statement. The session is shared with the other
+    ZK instances open on the same cluster, see ZKSessionRegistry.
+    """
+
+    def __init__(self, cluster_config):
+        self.cluster_config = cluster_config
+
+    def __enter__(self):
+        self.zk = session_registry.acquire(self.cluster_config)
         return self
 
     def __exit__(self, type, value, traceback):
-        self.zk.stop()
+        session_registry.release(self.cluster_config)
 
     def get_children(self, path, watch=None):
         """Returns the children of the specified node."""
@@ -240,10 +321,133 @@ class ZK:
         if names_only:
             return {g_id: None for g_id in group_ids}
 
-        consumer_offsets = {}
+        return dict(self.iter_groups_offsets(group_ids))
+
+    def iter_groups_offsets(self, group_ids=None, window=ASYNC_WINDOW_SIZE):
+        """Generator over the offsets of the given consumer-groups or of all
+        the consumer-groups if no group is given.
+
+        The offsets subtree is walked with asynchronous zookeeper requests,
+        keeping at most window requests in flight. Groups are processed in
+        chunks of window groups, so that results are yielded as soon as their
+        chunk has been fetched instead of building the whole dict in memory.
+
+        :param group_ids: list of consumer-group ids
+        :param window: maximum number of requests in flight
+        :returns: generator of tuples (group-id, offsets) where offsets is in
+          the same format returned by get_group_offsets.
+        """
+        if group_ids is None:
+            group_ids = self.get_children("/consumers")
+        for i in range(0, len(group_ids), window):
+            for group_offsets in self._fetch_groups_offsets(
+                group_ids[i:i + window],
+                window,
+            ):
+                yield group_offsets
+
+    def _fetch_groups_offsets(self, group_ids, window):
+        """Fetch the offsets of all the given groups pipelining the requests."""
+        groups_offsets = dict((g_id, {}) for g_id in group_ids)
+
+        # Fetch the topics of every group
+        topics_paths = [
+            (g_id, "/consumers/{group_id}/offsets".format(group_id=g_id))
+            for g_id in group_ids
+        ]
+        partitions_paths = []
+        for g_id, topics in self._iter_async(
+            self.zk.get_children_async,
+            topics_paths,
+            window,
+        ):
+            if isinstance(topics, NoNodeError):
+                _log.warning(
+                    "No topics subscribed to consumer-group {group}.".format(
+                        group=g_id,
+                    ),
+                )
+                continue
+            for topic in topics:
+                groups_offsets[g_id][topic] = {}
+                partitions_paths.append((
+                    (g_id, topic),
+                    "/consumers/{group_id}/offsets/{topic}".format(
+                        group_id=g_id,
+                        topic=topic,
+                    ),
+                ))
+
+        # Fetch the partitions of every group topic
+        offsets_paths = []
+        for (g_id, topic), partitions in self._iter_async(
+            self.zk.get_children_async,
+            partitions_paths,
+            window,
+        ):
+            if isinstance(partitions, NoNodeError):
+                _log.warning(
+                    "No partition offsets found for topic {topic}. "
+                    "Continuing to next one...".format(topic=topic),
+                )
+                continue
+            for partition in partitions:
+                offsets_paths.append((
+                    (g_id, topic, partition),
+                    "/consumers/{group_id}/offsets/{topic}/{partition}".format(
+                        group_id=g_id,
+                        topic=topic,
+                        partition=partition,
+                    ),
+                ))
+
+        # Fetch the offset of every partition
+        for (g_id, topic, partition), result in self._iter_async(
+            self.zk.get_async,
+            offsets_paths,
+            window,
+        ):
+            if isinstance(result, NoNodeError):
+                _log.error(
+                    "Path {path} not found".format(
+                        path="/consumers/{group_id}/offsets/{topic}/{partition}".format(
+                            group_id=g_id,
+                            topic=topic,
+                            partition=partition,
+                        ),
+                    ),
+                )
+                raise result
+            offset_json, _ = result
+            groups_offsets[g_id][topic][partition] = json.loads(offset_json)
+
         for g_id in group_ids:
-            consumer_offsets[g_id] = self.get_group_offsets(g_id)
-        return consumer_offsets
+            yield g_id, groups_offsets[g_id]
+
+    def _iter_async(self, fetch_async, keyed_paths, window):
+        """Issue fetch_async for every path keeping at most window requests
+        in flight.
+
+        :param fetch_async: kazoo asynchronous method, e.g. get_async
+        :param keyed_paths: list of tuples (key, path)
+        :param window: maximum number of requests in flight
+        :returns: generator of tuples (key, result) in the same order of
+          keyed_paths. If a node does not exist the result is the NoNodeError.
+        """
+        in_flight = deque()
+        for key, path in keyed_paths:
+            _log.debug("ZK: Async request for {path}".format(path=path))
+            in_flight.append((key, fetch_async(path)))
+            if len(in_flight) >= window:
+                yield self._wait_async(*in_flight.popleft())
+        while in_flight:
+            yield self._wait_async(*in_flight.popleft())
+
+    def _wait_async(self, key, async_result):
+        try:
+            return key, async_result.get()
+        except NoNodeError as e:
+            return key, e
 
     def get_group_offsets(self, group, topic=None):
         """Fetch group offsets for given topic and partition otherwise all topics
@@ -322,6 +526,180 @@ class ZK:
         except NoNodeError:
             return {}  # The partition has no data
 
+    def get_partitions_state(self, partitions, window=ASYNC_WINDOW_SIZE):
+        """Fetch the partition-state of the given partitions pipelining the
+        requests.
+
+        :param partitions: list of (topic, partition) tuples
+        :param window: maximum number of requests in flight
+        :returns: dict (topic, partition): partition-state. The state of a
+          partition with no data is an empty dict.
+        """
+        state_path = "/brokers/topics/{topic_id}/partitions/{p_id}/state"
+        states = {}
+        for name, result in self._iter_async(
+            self.zk.get_async,
+            [
+                ((topic, p_id), state_path.format(topic_id=topic, p_id=p_id))
+                for topic, p_id in partitions
+            ],
+            window,
+        ):
+            if isinstance(result, NoNodeError):
+                states[name] = {}
+            else:
+                states[name] = json.loads(result[0])
+        return states
+
+    def get_group_partitions_offsets(
+        self,
+        groupid,
+        topics,
+        window=ASYNC_WINDOW_SIZE,
+    ):
+        """Fetch the offset nodes of the given partitions of a group,
+        pipelining the requests.
+
+        :param groupid: The consumer group ID for the consumer
+        :param topics: dict topic: list of partitions
+        :param window: maximum number of requests in flight
+        :returns: dict topic: partition: value of the offset node
+        :raises: NoNodeError: if a partition has no offset node
+        """
+        offsets = {}
+        for (topic, partition), result in self._iter_async(
+            self.zk.get_async,
+            [
+                (
+                    (topic, partition),
+                    "/consumers/{group_id}/offsets/{topic}/{partition}".format(
+                        group_id=groupid,
+                        topic=topic,
+                        partition=partition,
+                    ),
+                )
+                for topic, partitions in topics.iteritems()
+                for partition in partitions
+            ],
+            window,
+        ):
+            if isinstance(result, NoNodeError):
+                raise result
+            offsets.setdefault(topic, {})[partition] = result[0]
+        return offsets
+
+    def create_group_offsets(
+        self,
+        groupid,
+        offsets,
+        batch_size=TRANSACTION_BATCH_SIZE,
+    ):
+        """Create the offset nodes of a group with multi-op transactions of
+        at most batch_size nodes. A transaction creates all its nodes or
+        none, so groups with up to batch_size partitions are created
+        atomically.
+
+        :param groupid: The consumer group ID for the consumer
+        :param offsets: dict topic: partition: offset
+        :param batch_size: maximum number of nodes created per transaction
+        :raises: NodeExistsError: if an offset node already exists. Its
+          transaction is rolled back, the previous ones are committed.
+        """
+        offsets_path = "/consumers/{group_id}/offsets".format(group_id=groupid)
+        self.zk.ensure_path(offsets_path)
+        existing_topics = set(self.get_children(offsets_path))
+        operations = []
+        for topic, partition_offsets in sorted(offsets.iteritems()):
+            topic_path = "{offsets_path}/{topic}".format(
+                offsets_path=offsets_path,
+                topic=topic,
+            )
+            if topic not in existing_topics:
+                operations.append(('create', topic_path, b''))
+            for partition, offset in sorted(partition_offsets.iteritems()):
+                operations.append((
+                    'create',
+                    "{topic_path}/{partition}".format(
+                        topic_path=topic_path,
+                        partition=partition,
+                    ),
+                    bytes(offset),
+                ))
+        self._commit_transactions(operations, batch_size)
+
+    def delete_tree(
+        self,
+        path,
+        window=ASYNC_WINDOW_SIZE,
+        batch_size=TRANSACTION_BATCH_SIZE,
+    ):
+        """Delete a node and all its children. The tree is walked one level
+        at a time pipelining the requests, then deleted bottom-up with
+        multi-op transactions of at most batch_size nodes.
+
+        :param path: The zookeeper node path
+        :param window: maximum number of requests in flight
+        :param batch_size: maximum number of nodes deleted per transaction
+        """
+        self.delete_trees([path], window, batch_size)
+
+    def delete_trees(
+        self,
+        paths,
+        window=ASYNC_WINDOW_SIZE,
+        batch_size=TRANSACTION_BATCH_SIZE,
+    ):
+        """Delete many nodes and all their children, walking and deleting the
+        trees together like delete_tree. Missing nodes are skipped.
+
+        :param paths: list of zookeeper node paths
+        :param window: maximum number of requests in flight
+        :param batch_size: maximum number of nodes deleted per transaction
+        """
+        nodes = []
+        level = list(paths)
+        while level:
+            children_paths = []
+            for parent, children in self._iter_async(
+                self.zk.get_children_async,
+                [(node, node) for node in level],
+                window,
+            ):
+                if isinstance(children, NoNodeError):
+                    continue
+                nodes.append(parent)
+                children_paths.extend(
+                    "{parent}/{child}".format(parent=parent, child=child)
+                    for child in children
+                )
+            level = children_paths
+        # Children are deleted before their parent
+        self._commit_transactions(
+            [('delete', node) for node in reversed(nodes)],
+            batch_size,
+        )
+
+    def _commit_transactions(self, operations, batch_size):
+        """Run the operations with transactions of at most batch_size
+        operations, one after the other.
+
+        :param operations: list of tuples (method of the kazoo
+          TransactionRequest, arguments...)
+        :param batch_size: maximum number of operations per transaction
+        :raises: the error of the first failed operation
+        """
+        for i in range(0, len(operations), batch_size):
+            transaction = self.zk.transaction()
+            for operation in operations[i:i + batch_size]:
+                getattr(transaction, operation[0])(*operation[1:])
+            _log.debug("ZK: Committing transaction of {count} operations".format(
+                count=len(operations[i:i + batch_size]),
+            ))
+            for result in transaction.commit():
+                if isinstance(result, Exception) and \
+                        not isinstance(result, RolledBackError):
+                    raise result
+
     def get_my_subscribed_topics(self, groupid):
         """Get the list of topics that a consumer is subscribed to
 
@@ -332,6 +710,28 @@ class ZK:
         path = "/consumers/{group_id}/offsets".format(group_id=groupid)
         return self.get_children(path)
 
+    def get_groups_topics(self, group_ids=None, window=ASYNC_WINDOW_SIZE):
+        """Get the topics of many consumer groups pipelining the requests.
+
+        :param group_ids: list of consumer group ids. All the groups if None.
+        :param window: maximum number of requests in flight
+        :returns: dict group-id: list of topics. Groups with no offsets have
+          no topics.
+        """
+        if group_ids is None:
+            group_ids = self.get_children("/consumers")
+        return dict(
+            (g_id, [] if isinstance(topics, NoNodeError) else topics)
+            for g_id, topics in self._iter_async(
+                self.zk.get_children_async,
+                [
+                    (g_id, "/consumers/{group_id}/offsets".format(group_id=g_id))
+                    for g_id in group_ids
+                ],
+                window,
+            )
+        )
+
     def get_my_subscribed_partitions(self, groupid, topic):
         """Get the list of partitions of a topic
         that a consumer is subscribed to
@@ -391,25 +791,48 @@ class ZK:
         _log.debug("ZK: Deleting node " + path)
         return self.zk.delete(path, recursive=recursive)
 
-    def delete_topic_partitions(self, groupid, topic, partitions):
+    def delete_topic_partitions(
+        self,
+        groupid,
+        topic,
+        partitions,
+        batch_size=TRANSACTION_BATCH_SIZE,
+    ):
         """Delete the specified partitions within the topic that the consumer
-        is subscribed to.
+        is subscribed to, with multi-op transactions of at most batch_size
+        nodes.
 
         :param: groupid: The consumer group ID for the consumer.
         :param: topic: Kafka topic.
         :param: partitions: List of partitions within the topic to be deleted.
+        :param: batch_size: maximum number of nodes deleted per transaction
+        :returns: list of the partitions the consumer is not subscribed to.
+          The other partitions are deleted.
         :raises:
           NoNodeError: if the consumer is not subscribed to the topic
 
           ZookeeperError: if there is an error with Zookeeper
         """
-        for partition in partitions:
-            path = "/consumers/{groupid}/offsets/{topic}/{partition}".format(
-                groupid=groupid,
-                topic=topic,
-                partition=partition
-            )
-            self.delete(path)
+        topic_path = "/consumers/{groupid}/offsets/{topic}".format(
+            groupid=groupid,
+            topic=topic,
+        )
+        subscribed = set(self.get_children(topic_path))
+        self._commit_transactions(
+            [
+                (
+                    'delete',
+                    "{topic_path}/{partition}".format(
+                        topic_path=topic_path,
+                        partition=partition,
+                    ),
+                )
+                for partition in partitions
+                if str(partition) in subscribed
+            ],
+            batch_size,
+        )
+        return [p for p in partitions if str(p) not in subscribed]
 
     def delete_topic(self, groupid, topic):
         path = "/consumers/{groupid}/offsets/{topic}".format(
@@ -418,21 +841,44 @@ class ZK:
         )
         self.delete(path, True)
 
+    def delete_topics(self, groupid, topics):
+        """Delete the offsets of many topics of a group at once, see
+        delete_trees. Topics the group is not subscribed to are skipped.
+
+        :param: groupid: The consumer group ID for the consumer.
+        :param: topics: list of topics
+        """
+        self.delete_trees([
+            "/consumers/{groupid}/offsets/{topic}".format(
+                groupid=groupid,
+                topic=topic,
+            )
+            for topic in topics
+        ])
+
     def delete_group(self, groupid):
         path = "/consumers/{groupid}".format(
             groupid=groupid,
         )
         self.delete(path, True)
 
-    def execute_plan(self, plan, allow_rf_change=False):
-        """Submit reassignment plan for execution."""
+    def execute_plan(self, plan, allow_rf_change=False, validate=True):
+        """Submit reassignment plan for execution.
+
+        :param plan: reassignment plan
+        :param allow_rf_change: allow replication-factor changes in the plan
+        :param validate: validate the plan against the current cluster-plan.
+          It can be disabled when the plan has already been validated, e.g.
+          when submitting the batches of a bigger validated plan.
+        """
         reassignment_path = '{admin}/{reassignment_node}'\
             .format(admin=ADMIN_PATH, reassignment_node=REASSIGNMENT_NODE)
         plan_json = json.dumps(plan)
-        base_plan = self.get_cluster_plan()
-        if not validate_plan(plan, base_plan, allow_rf_change=allow_rf_change):
-            _log.error('Given plan is invalid. ABORTING reassignment...')
-            return False
+        if validate:
+            base_plan = self.get_cluster_plan()
+            if not validate_plan(plan, base_plan, allow_rf_change=allow_rf_change):
+                _log.error('Given plan is invalid. ABORTING reassignment...')
+                return False
         # Send proposed-plan to zookeeper
         try:
             _log.info('Sending plan to Zookeeper...')
@@ -498,3 +944,23 @@ class ZK:
             return json.loads(result[0])
         except NoNodeError:
             return {}
+
+    def wait_for_reassignment(self, timeout=None):
+        """Block until the reassign_partitions node is deleted, which means
+        that the reassignment completed, or until timeout seconds elapsed.
+
+        The node is watched, so the method returns as soon as the node changes.
+        Kafka updates the node every time some partitions complete their
+        reassignment.
+
+        :param timeout: maximum number of seconds to wait, None to wait
+          until the node changes.
+        :returns: True if no reassignment is pending
+        """
+        reassignment_path = '{admin}/{reassignment_node}'\
+            .format(admin=ADMIN_PATH, reassignment_node=REASSIGNMENT_NODE)
+        changed = threading.Event()
+        if self.zk.exists(reassignment_path, watch=lambda _: changed.set()) is None:
+            return True
+        changed.wait(timeout)
+        return self.zk.exists(reassignment_path) is None
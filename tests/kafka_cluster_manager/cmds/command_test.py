@@ -339,7 +339,7 @@ class TestClusterManagerCmd(object):
     @mock.patch('kafka_utils.kafka_cluster_manager.cmds.command.ZK')
     def test_exit_on_pending_assignment(self, mock_zk, cmd):
         cluster_config = mock.MagicMock()
-        args = mock.MagicMock()
+        args = mock.MagicMock(checkpoint_file=None)
         mock_zk.return_value.__enter__.return_value = mock.MagicMock(
             get_brokers=lambda: {
                 1: {'host': 'host1'},
@@ -361,3 +361,83 @@ class TestClusterManagerCmd(object):
                 cluster_balancer,
                 args,
             )
+
+    @mock.patch('kafka_utils.kafka_cluster_manager.cmds.command.ZK')
+    def test_resume_on_pending_assignment(
+        self,
+        mock_zk,
+        cmd,
+        new_assignment,
+    ):
+        cluster_config = mock.MagicMock()
+        args = mock.MagicMock(checkpoint_file='checkpoint.json')
+        mock_zk.return_value.__enter__.return_value = mock.MagicMock(
+            get_brokers=lambda: {
+                1: {'host': 'host1'},
+                2: {'host': 'host2'},
+                3: {'host': 'host3'},
+            },
+            get_assignment=lambda: {},
+            get_cluster_assignment=lambda: new_assignment,
+            get_pending_plan=lambda: {'partitions': []},
+        )
+        rg_parser = mock.MagicMock()
+        partition_measurer = UniformPartitionMeasurer
+        cluster_balancer = mock.MagicMock(spec=ClusterBalancer)
+        cmd.run_command = mock.MagicMock()
+
+        cmd.run(
+            cluster_config,
+            rg_parser,
+            partition_measurer,
+            cluster_balancer,
+            args,
+        )
+
+        assert cmd.run_command.call_count == 1
+
+    @mock.patch(
+        'kafka_utils.kafka_cluster_manager.cmds.command.ReassignmentExecutor',
+        autospec=True,
+    )
+    def test_execute_plan_batched(self, mock_executor, cmd):
+        cmd.zk = mock.Mock()
+        cmd.partition_measurer = mock.Mock()
+        cmd.args = mock.Mock(
+            apply=True,
+            no_confirm=True,
+            wait=False,
+            batch_max_movements=None,
+            batch_max_size=1.5,
+            checkpoint_file=None,
+        )
+        plan = {'version': 1, 'partitions': []}
+
+        cmd.execute_plan(plan)
+
+        mock_executor.return_value.execute.assert_called_once_with(
+            plan,
+            allow_rf_change=False,
+        )
+        assert not cmd.zk.execute_plan.called
+
+    @mock.patch(
+        'kafka_utils.kafka_cluster_manager.cmds.command.ReassignmentExecutor',
+        autospec=True,
+    )
+    def test_execute_plan_not_batched(self, mock_executor, cmd):
+        cmd.zk = mock.Mock()
+        cmd.args = mock.Mock(
+            apply=True,
+            no_confirm=True,
+            wait=False,
+            batch_max_movements=None,
+            batch_max_size=None,
+            checkpoint_file=None,
+        )
+        plan = {'version': 1, 'partitions': []}
+
+        cmd.execute_plan(plan)
+
+        cmd.zk.execute_plan.assert_called_once_with(plan, allow_rf_change=False)
+        assert not mock_executor.called
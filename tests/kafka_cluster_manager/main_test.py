@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+
+from kafka_utils.kafka_cluster_manager.main import parse_args
+
+
+def _parse_args(*options):
+    argv = ['kafka-cluster-manager', '--cluster-type', 'test'] + list(options)
+    with mock.patch('sys.argv', argv + ['rebalance', '--replication-groups']):
+        return parse_args()
+
+
+def test_parse_args_replication_throughput_batched():
+    args = _parse_args(
+        '--replication-throughput', '100',
+        '--batch-max-size', '1000',
+    )
+
+    assert args.replication_throughput == 100
+
+
+def test_parse_args_replication_throughput_not_batched(capsys):
+    # The estimate is only reported by a batched execution
+    with pytest.raises(SystemExit):
+        _parse_args('--replication-throughput', '100')
+
+    _, err = capsys.readouterr()
+    assert '--replication-throughput requires' in err
@@ -103,3 +103,27 @@ class TestDeleteGroup(object):
                     offset_storage='kafka',
                 ),
             ]
+
+    def test_run_bulk(self, client, zk):
+        with mock.patch.object(
+                DeleteGroup,
+                'get_groups_topics',
+                return_value={'group1': ['topic1'], 'group2': ['topic2']},
+        ), mock.patch.object(DeleteGroup, 'confirm_bulk'):
+            client.return_value.copy.return_value = client.return_value
+            args = mock.Mock(
+                groupid=None,
+                groups_file=None,
+                groups_regex='group.*',
+                storage='zookeeper',
+                workers=1,
+            )
+            cluster_config = mock.Mock(zookeeper='some_ip')
+
+            DeleteGroup.run(args, cluster_config)
+
+            obj = zk.return_value
+            assert obj.delete_group.call_args_list == [
+                mock.call('group1'),
+                mock.call('group2'),
+            ]
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+
+from kafka_utils.kafka_consumer_manager. \
+    commands.migrate_group import MigrateGroup
+from kafka_utils.util.error import OffsetCommitError
+from kafka_utils.util.error import OffsetTranslationError
+from kafka_utils.util.offsets import PartitionOffsets
+
+
+class TestMigrateGroup(object):
+
+    dest_watermarks = {
+        'topic1': {
+            0: PartitionOffsets('topic1', 0, 1000, 100),
+            1: PartitionOffsets('topic1', 1, 1000, 100),
+        },
+    }
+
+    @pytest.fixture
+    def offset_map(self, tmpdir):
+        path = tmpdir.join('offsets.map')
+        path.write(
+            '# topic,partition,source_offset,dest_offset\n'
+            'topic1,0,500,300\n'
+            'topic1,0,100,150\n'
+            '\n'
+            'topic1,1,50,120\n'
+        )
+        return str(path)
+
+    def test_read_offset_map(self, offset_map):
+        assert MigrateGroup.read_offset_map(offset_map) == {
+            ('topic1', 0): ((100, 500), (150, 300)),
+            ('topic1', 1): ((50,), (120,)),
+        }
+
+    def test_read_offset_map_invalid(self, tmpdir):
+        path = tmpdir.join('offsets.map')
+        path.write('topic1,0,500,300\ntopic1,0,500\n')
+
+        with pytest.raises(ValueError) as e:
+            MigrateGroup.read_offset_map(str(path))
+        assert 'line 2' in str(e.value)
+
+    @pytest.mark.parametrize('source_offset, expected', [
+        (100, (150, None)),
+        (499, (150, None)),
+        (700, (300, None)),
+        (99, (None, 'No offset mapping at or before offset 99')),
+    ])
+    def test_offset_map_translator(self, offset_map, source_offset, expected):
+        translate = MigrateGroup.offset_map_translator(
+            MigrateGroup.read_offset_map(offset_map),
+        )
+
+        assert translate('topic1', 0, source_offset) == expected
+
+    def test_timestamp_translator(self):
+        translate = MigrateGroup.timestamp_translator(
+            {'topic1': {0: 40, 1: 60}},
+            {'topic1': {0: 400}},
+        )
+
+        assert translate('topic1', 0, 50) == (400, None)
+        assert translate('topic1', 0, 30)[1] == (
+            'Offset 30 is older than the timestamp, at offset 40'
+        )
+        assert translate('topic1', 1, 70)[1] == (
+            'Unable to get the offsets at the timestamp'
+        )
+
+    def test_translate_group(self):
+        def translate(topic, partition, source_offset):
+            return source_offset * 2, None
+
+        new_offsets, errors = MigrateGroup.translate_group(
+            {'topic1': [0, 1, 2], 'topic2': [0]},
+            {'topic1': {0: 300, 1: 600, 2: 10}, 'topic2': {}},
+            translate,
+            self.dest_watermarks,
+        )
+
+        assert new_offsets == {'topic1': {0: 600}}
+        assert errors == [
+            OffsetTranslationError(
+                'topic1',
+                1,
+                'Translated offset 1200 out of the destination range '
+                '[100, 1000]',
+            ),
+            OffsetTranslationError(
+                'topic1',
+                2,
+                'Partition not found in the destination cluster',
+            ),
+            OffsetTranslationError(
+                'topic2',
+                0,
+                'No offset in the source cluster',
+            ),
+        ]
+
+    def test_migrate_groups(self):
+        groups_topics = [
+            ('group1', {'topic1': [0, 1]}),
+            ('group2', {'topic1': [0]}),
+        ]
+        source_offsets = {
+            'group1': {'topic1': {0: 200, 1: 300}},
+            'group2': {'topic1': {0: 2000}},
+        }
+
+        def translate(topic, partition, source_offset):
+            return source_offset + 100, None
+
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.get_current_consumer_offsets',
+            side_effect=lambda client, group, topics, **kwargs:
+                source_offsets[group],
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.set_consumer_offsets',
+            return_value=[],
+        ) as mock_set:
+            dest_client = mock.Mock()
+            results = MigrateGroup.migrate_groups(
+                mock.Mock(),
+                dest_client,
+                groups_topics,
+                translate,
+                self.dest_watermarks,
+                'zookeeper',
+                'kafka',
+                2,
+            )
+
+            assert results == [
+                ('group1', {'topic1': {0: (200, 300), 1: (300, 400)}}, []),
+                ('group2', {}, [
+                    OffsetTranslationError(
+                        'topic1',
+                        0,
+                        'Translated offset 2100 out of the destination range '
+                        '[100, 1000]',
+                    ),
+                ]),
+            ]
+            # group2 is not migrated
+            assert mock_set.call_args_list == [
+                mock.call(
+                    dest_client.copy.return_value,
+                    'group1',
+                    {'topic1': {0: 300, 1: 400}},
+                    raise_on_error=False,
+                    offset_storage='kafka',
+                ),
+            ]
+
+    def test_migrate_groups_dry_run(self):
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.get_current_consumer_offsets',
+            return_value={'topic1': {0: 200}},
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.set_consumer_offsets',
+        ) as mock_set:
+            results = MigrateGroup.migrate_groups(
+                mock.Mock(),
+                mock.Mock(),
+                [('group1', {'topic1': [0]})],
+                lambda topic, partition, offset: (offset, None),
+                self.dest_watermarks,
+                'zookeeper',
+                None,
+                2,
+            )
+
+            assert results == [('group1', {'topic1': {0: (200, 200)}}, [])]
+            assert not mock_set.called
+
+    def test_migrate_groups_no_source_offset(self):
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.get_current_consumer_offsets',
+            return_value={'topic1': {0: 200}},
+        ) as mock_get, mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.migrate_group.set_consumer_offsets',
+        ) as mock_set:
+            results = MigrateGroup.migrate_groups(
+                mock.Mock(),
+                mock.Mock(),
+                [('group1', {'topic1': [0, 1]})],
+                lambda topic, partition, offset: (offset, None),
+                self.dest_watermarks,
+                'kafka',
+                'kafka',
+                2,
+            )
+
+            # Partitions never committed are reported, not read as offset 0
+            assert mock_get.call_args[1]['skip_missing']
+            assert results == [('group1', {'topic1': {0: (200, 200)}}, [
+                OffsetTranslationError(
+                    'topic1',
+                    1,
+                    'No offset in the source cluster',
+                ),
+            ])]
+            assert not mock_set.called
+
+    def test_print_results(self, capsys):
+        failed = MigrateGroup.print_results(
+            [
+                ('group1', {'topic1': {0: (200, 300)}}, []),
+                ('group2', {}, [OffsetCommitError('topic1', 0, 'Boom!')]),
+            ],
+            dry_run=False,
+        )
+
+        out, err = capsys.readouterr()
+        assert failed == 1
+        assert 'Consumer group group1: migrated 1 partitions.' in out
+        assert 'Topic: topic1 Partition: 0 Error: Boom!' in err
+
+    @mock.patch(
+        'kafka_utils.kafka_consumer_manager.'
+        'commands.migrate_group.get_cluster_config',
+        autospec=True,
+    )
+    def test_get_dest_cluster_config_same_cluster(self, mock_get_config):
+        cluster_config = mock.Mock()
+        mock_get_config.return_value = cluster_config
+        args = mock.Mock(
+            dest_cluster_type=None,
+            cluster_type='test',
+            dest_cluster_name='cluster1',
+            discovery_base_path=None,
+        )
+
+        with pytest.raises(SystemExit):
+            MigrateGroup.get_dest_cluster_config(args, cluster_config)
+        mock_get_config.assert_called_once_with('test', 'cluster1', None)
@@ -49,8 +49,11 @@ class TestOffsetAdvance(object):
             ordered_args, _ = mock_advance.call_args
             assert ordered_args[1] == args.groupid
             assert ordered_args[2] == self.topics_partitions
-            mock_client.return_value.load_metadata_for_topics. \
-                assert_called_once_with()
+            # The metadata bootstrapped by the client is still fresh
+            assert not mock_client.return_value.load_metadata_for_topics.called
+            _, kwargs = mock_advance.call_args
+            assert kwargs['metadata_token'] == \
+                mock_client.return_value.metadata_token
             mock_client.return_value.close.assert_called_once_with()
 
     def test_run_type_error(self, mock_client):
@@ -28,6 +28,8 @@ class TestOffsetGet(object):
                 'commands.offset_get.KafkaToolClient',
                 autospec=True,
         ) as mock_client:
+            mock_client.hosts = [('localhost', 9092)]
+            mock_client.send_offset_requests_pipelined.return_value = [[], []]
             yield mock_client
 
     def test_get_offsets(self, client):
@@ -46,7 +48,7 @@ class TestOffsetGet(object):
                 'zookeeper',
             )
 
-            assert client.load_metadata_for_topics.call_count == 1
+            assert client.refresh_metadata.call_count == 1
             assert client.send_offset_fetch_request.call_count == 1
             assert client.send_offset_fetch_request_kafka.call_count == 0
 
@@ -66,6 +68,6 @@ class TestOffsetGet(object):
                 'kafka',
             )
 
-            assert client.load_metadata_for_topics.call_count == 1
+            assert client.refresh_metadata.call_count == 1
             assert client.send_offset_fetch_request.call_count == 0
             assert client.send_offset_fetch_request_kafka.call_count == 1
@@ -20,7 +20,10 @@ import pytest
 
 from kafka_utils.kafka_consumer_manager. \
     commands.offset_manager import OffsetManagerBase
+from kafka_utils.kafka_consumer_manager. \
+    commands.offset_manager import OffsetWriter
 from kafka_utils.util.client import KafkaToolClient
+from kafka_utils.util.error import OffsetCommitError
 
 
 class TestOffsetManagerBase(object):
@@ -156,3 +159,191 @@ class TestOffsetManagerBase(object):
                 mock_kafka_client
             )
             assert mock_exit.called
+
+    def test_split_topics_partitions(self):
+        assert list(OffsetManagerBase.split_topics_partitions(
+            self.topics_partitions,
+            4,
+        )) == [
+            {'topic1': [0, 1, 2], 'topic2': [0]},
+            {'topic2': [1, 2, 3], 'topic3': [0]},
+            {'topic3': [1]},
+        ]
+
+    @pytest.mark.parametrize('path, file_format, expected', [
+        ('offsets.json', None, 'json'),
+        ('offsets.jsonl', None, 'jsonl'),
+        ('offsets', 'jsonl', 'jsonl'),
+        ('offsets.jsonl', 'json', 'json'),
+    ])
+    def test_get_offsets_file_format(self, path, file_format, expected):
+        assert OffsetManagerBase.get_offsets_file_format(
+            path,
+            file_format,
+        ) == expected
+
+
+class TestBulkGroups(object):
+    topics_partitions = {
+        "topic1": [0, 1, 2],
+        "topic2": [0, 1],
+    }
+    groups_topics = {
+        "group1": ["topic1"],
+        "group2": ["topic1", "topic2"],
+        "other_group": ["topic2"],
+    }
+
+    @pytest.fixture
+    def mock_kafka_client(self):
+        mock_kafka_client = mock.MagicMock(spec=KafkaToolClient)
+        mock_kafka_client.get_partition_ids_for_topic.side_effect = \
+            lambda topic: self.topics_partitions.get(topic, [])
+        mock_kafka_client.copy.return_value = mock_kafka_client
+        return mock_kafka_client
+
+    @pytest.yield_fixture
+    def mock_get_groups_topics(self):
+        def get_groups_topics(cluster_config, groupids, storage):
+            return dict(
+                (group, topics)
+                for group, topics in self.groups_topics.iteritems()
+                if groupids is None or group in groupids
+            )
+
+        with mock.patch.object(
+            OffsetManagerBase,
+            "get_groups_topics",
+            side_effect=get_groups_topics,
+        ) as mock_get_groups_topics:
+            yield mock_get_groups_topics
+
+    @pytest.fixture
+    def groups_file(self, tmpdir):
+        groups_file = tmpdir.join('groups')
+        groups_file.write("# Groups to recover\ngroup2\n\ngroup1\nmissing\ngroup1\n")
+        return str(groups_file)
+
+    def test_get_bulk_groups_topics_file(
+        self,
+        mock_kafka_client,
+        mock_get_groups_topics,
+        groups_file,
+    ):
+        groups_topics = OffsetManagerBase.get_bulk_groups_topics(
+            mock.Mock(),
+            mock_kafka_client,
+            groups_file,
+            None,
+        )
+
+        # Each storage is scanned once for all the groups
+        mock_get_groups_topics.assert_called_once_with(
+            mock.ANY,
+            ["group2", "group1", "missing", "group1"],
+            'zookeeper',
+        )
+        assert groups_topics == [
+            ("group1", {"topic1": [0, 1, 2]}),
+            ("group2", {"topic1": [0, 1, 2], "topic2": [0, 1]}),
+        ]
+
+    def test_get_bulk_groups_topics_regex(
+        self,
+        mock_kafka_client,
+        mock_get_groups_topics,
+    ):
+        groups_topics = OffsetManagerBase.get_bulk_groups_topics(
+            mock.Mock(),
+            mock_kafka_client,
+            None,
+            "group[0-9]{1}",
+            topic="topic2",
+            partitions=[1],
+            storage='dual',
+        )
+
+        mock_get_groups_topics.assert_called_once_with(mock.ANY, None, 'dual')
+        # group1 is not subscribed to topic2 and other_group doesn't match
+        assert groups_topics == [("group2", {"topic2": [1]})]
+
+    def test_get_bulk_groups_topics_force(
+        self,
+        mock_kafka_client,
+        mock_get_groups_topics,
+        groups_file,
+    ):
+        groups_topics = OffsetManagerBase.get_bulk_groups_topics(
+            mock.Mock(),
+            mock_kafka_client,
+            groups_file,
+            None,
+            topic="topic2",
+            force=True,
+        )
+
+        assert groups_topics == [
+            ("group1", {"topic2": [0, 1]}),
+            ("group2", {"topic2": [0, 1]}),
+            ("missing", {"topic2": [0, 1]}),
+        ]
+
+    def test_get_bulk_groups_topics_invalid_regex(
+        self,
+        mock_kafka_client,
+        mock_get_groups_topics,
+    ):
+        with pytest.raises(SystemExit):
+            OffsetManagerBase.get_bulk_groups_topics(
+                mock.Mock(),
+                mock_kafka_client,
+                None,
+                "group(",
+            )
+
+    def test_run_bulk(self, mock_kafka_client, mock_get_groups_topics):
+        args = mock.Mock(groups_file=None, groups_regex="group.*", workers=2)
+        process_group = mock.Mock(return_value=[])
+
+        with mock.patch(
+            "kafka_utils.kafka_consumer_manager.commands.offset_manager."
+            "prompt_user_input",
+            autospec=True,
+        ) as mock_prompt:
+            OffsetWriter.run_bulk(
+                args,
+                mock.Mock(),
+                mock_kafka_client,
+                process_group,
+            )
+
+        assert mock_prompt.call_count == 1
+        assert sorted(process_group.call_args_list) == [
+            mock.call(mock_kafka_client, "group1", {"topic1": [0, 1, 2]}),
+            mock.call(
+                mock_kafka_client,
+                "group2",
+                {"topic1": [0, 1, 2], "topic2": [0, 1]},
+            ),
+        ]
+        assert mock_kafka_client.close.called
+
+    def test_run_bulk_error(self, mock_kafka_client, mock_get_groups_topics):
+        args = mock.Mock(groups_file=None, groups_regex=".*group.*", workers=2)
+
+        def process_group(client, group, topics):
+            if group == "group1":
+                return [OffsetCommitError("topic1", 0, "Boom!")]
+            if group == "group2":
+                raise OffsetCommitError("topic1", 1, "Boom!")
+            return []
+
+        with pytest.raises(SystemExit):
+            OffsetManagerBase.run_bulk(
+                args,
+                mock.Mock(),
+                mock_kafka_client,
+                process_group,
+            )
+        # The failure of a group doesn't stop the others
+        assert mock_kafka_client.close.called
@@ -17,8 +17,11 @@ import pytest
 
 from kafka_utils.kafka_consumer_manager. \
     commands.offset_restore import OffsetRestore
+from kafka_utils.kafka_consumer_manager. \
+    commands.offset_restore import TopicRestoreSummary
 from kafka_utils.util.client import KafkaToolClient
-from kafka_utils.util.monitoring import ConsumerPartitionOffsets
+from kafka_utils.util.monitoring import watermark_cache
+from kafka_utils.util.offsets import PartitionOffsets
 
 
 class TestOffsetRestore(object):
@@ -28,19 +31,13 @@ class TestOffsetRestore(object):
         "topic2": [0, 1, 2, 3],
         "topic3": [0, 1],
     }
-    consumer_offsets_metadata = {
-        'topic1':
-        [
-            ConsumerPartitionOffsets(topic='topic1', partition=0, current=20, highmark=655, lowmark=655),
-            ConsumerPartitionOffsets(topic='topic1', partition=1, current=10, highmark=655, lowmark=655)
-        ]
-    }
     parsed_consumer_offsets = {'groupid': 'group1', 'offsets': {'topic1': {0: 10, 1: 20}}}
     new_consumer_offsets = {'topic1': {0: 10, 1: 20}}
-    kafka_consumer_offsets = {'topic1': [
-        ConsumerPartitionOffsets(topic='topic1', partition=0, current=30, highmark=40, lowmark=10),
-        ConsumerPartitionOffsets(topic='topic1', partition=1, current=20, highmark=40, lowmark=10),
-    ]}
+    watermarks = {'topic1': {
+        0: PartitionOffsets('topic1', 0, 40, 10),
+        1: PartitionOffsets('topic1', 1, 40, 10),
+        2: PartitionOffsets('topic1', 2, 40, 10),
+    }}
 
     @pytest.fixture
     def mock_kafka_client(self):
@@ -51,23 +48,23 @@ class TestOffsetRestore(object):
             side_effect = self.topics_partitions
         return mock_kafka_client
 
-    def test_restore_offsets_zk(self, mock_kafka_client):
+    @pytest.fixture
+    def mock_get_watermarks(self):
         with mock.patch(
             "kafka_utils.kafka_consumer_manager."
-            "commands.offset_restore.set_consumer_offsets",
-            return_value=[],
+            "commands.offset_restore.get_topics_watermarks",
+            return_value=self.watermarks,
             autospec=True,
-        ) as mock_set_offsets, mock.patch.object(
-            OffsetRestore,
-            "parse_consumer_offsets",
-            spec=OffsetRestore.parse_consumer_offsets,
-            return_value=self.parsed_consumer_offsets,
-        ), mock.patch(
+        ) as mock_get_watermarks:
+            yield mock_get_watermarks
+
+    def test_restore_offsets_zk(self, mock_kafka_client, mock_get_watermarks):
+        with mock.patch(
             "kafka_utils.kafka_consumer_manager."
-            "commands.offset_restore.get_consumer_offsets_metadata",
-            return_value=self.consumer_offsets_metadata,
+            "commands.offset_restore.set_consumer_offsets",
+            return_value=[],
             autospec=True,
-        ):
+        ) as mock_set_offsets:
             OffsetRestore.restore_offsets(
                 mock_kafka_client,
                 self.parsed_consumer_offsets,
@@ -77,13 +74,146 @@ class TestOffsetRestore(object):
             ordered_args, _ = mock_set_offsets.call_args
             assert ordered_args[1] == 'group1'
             assert ordered_args[2] == self.new_consumer_offsets
+            # The watermarks of all the partitions are fetched at once
+            mock_get_watermarks.assert_called_once_with(
+                mock_kafka_client,
+                {'topic1': [0, 1]},
+                raise_on_error=False,
+            )
+
+    def test_validate_offsets(self, mock_kafka_client, mock_get_watermarks):
+        new_offsets, summary, invalid = OffsetRestore.validate_offsets(
+            mock_kafka_client,
+            {'topic1': {0: 5, 1: 20, 2: 50}},
+        )
+
+        # Out of range offsets are restored as is
+        assert new_offsets == {'topic1': {0: 5, 1: 20, 2: 50}}
+        assert summary == {'topic1': TopicRestoreSummary(3, 1, 1, 0)}
+        assert invalid == []
+
+    def test_validate_offsets_clamp(self, mock_kafka_client, mock_get_watermarks):
+        with mock.patch.object(
+            watermark_cache,
+            'get_topics_watermarks',
+            autospec=True,
+        ) as mock_cached_watermarks:
+            new_offsets, summary, _ = OffsetRestore.validate_offsets(
+                mock_kafka_client,
+                {'topic1': {0: 5, 1: 20, 2: 50}},
+                clamp=True,
+            )
+
+            # Offsets are never clamped to cached watermarks
+            assert not mock_cached_watermarks.called
+
+        assert new_offsets == {'topic1': {0: 10, 1: 20, 2: 40}}
+        assert summary == {'topic1': TopicRestoreSummary(3, 1, 1, 0)}
 
-    def test_build_new_offsets(self, mock_kafka_client):
-        new_offsets = OffsetRestore.build_new_offsets(
+    def test_validate_offsets_invalid(self, mock_kafka_client, mock_get_watermarks):
+        new_offsets, summary, invalid = OffsetRestore.validate_offsets(
             mock_kafka_client,
-            {'topic1': {0: 10, 1: 20}},
-            {'topic1': [0, 1]},
-            self.kafka_consumer_offsets,
+            {'topic1': {0: -1, 1: 20, 5: 10}, 'topic4': {0: 10}},
         )
 
-        assert new_offsets == self.new_consumer_offsets
+        assert new_offsets == {'topic1': {1: 20}, 'topic4': {}}
+        assert summary == {
+            'topic1': TopicRestoreSummary(3, 0, 0, 2),
+            'topic4': TopicRestoreSummary(1, 0, 0, 1),
+        }
+        assert sorted(invalid) == [
+            ('topic1', 0, -1),
+            ('topic1', 5, 10),
+            ('topic4', 0, 10),
+        ]
+
+    def test_restore_offsets_invalid(self, mock_kafka_client, mock_get_watermarks):
+        with mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_restore.set_consumer_offsets",
+            autospec=True,
+        ) as mock_set_offsets:
+            with pytest.raises(SystemExit):
+                OffsetRestore.restore_offsets(
+                    mock_kafka_client,
+                    {'groupid': 'group1', 'offsets': {'topic1': {0: -1, 1: 20}}},
+                    'zookeeper',
+                )
+
+            # Nothing is committed
+            assert not mock_set_offsets.called
+
+    def test_parse_jsonl_offsets(self):
+        lines = [
+            '{"topic": "topic1", "partition": 0, "offset": 10}\n',
+            '{"topic": "topic2", "partition": 1, "offset": 5}\n',
+            '\n',
+            '{"topic": "topic1", "partition": 1, "offset": 20}\n',
+        ]
+
+        assert list(OffsetRestore.parse_jsonl_offsets(lines, 2)) == [
+            {'topic1': {0: 10}, 'topic2': {1: 5}},
+            {'topic1': {1: 20}},
+        ]
+
+    def test_restore_offsets_jsonl(self, mock_kafka_client, tmpdir):
+        json_file = tmpdir.join('offsets.jsonl')
+        json_file.write(
+            '{"groupid": "group1"}\n'
+            '{"topic": "topic1", "partition": 0, "offset": 10}\n'
+            '{"topic": "topic1", "partition": 1, "offset": 20}\n'
+            '{"topic": "topic2", "partition": 0, "offset": 30}\n'
+        )
+        with mock.patch.object(
+            OffsetRestore,
+            "commit_offsets",
+            side_effect=lambda client, parsed, storage, clamp: (
+                parsed['offsets'],
+                {'topic1': TopicRestoreSummary(1, 0, 0, 0)},
+            ),
+        ) as mock_commit:
+            OffsetRestore.restore_offsets_jsonl(
+                mock_kafka_client,
+                str(json_file),
+                'kafka',
+                2,
+            )
+
+            assert mock_commit.call_args_list == [
+                mock.call(
+                    mock_kafka_client,
+                    {'groupid': 'group1', 'offsets': {'topic1': {0: 10, 1: 20}}},
+                    'kafka',
+                    False,
+                ),
+                mock.call(
+                    mock_kafka_client,
+                    {'groupid': 'group1', 'offsets': {'topic2': {0: 30}}},
+                    'kafka',
+                    False,
+                ),
+            ]
+
+    def test_restore_offsets_jsonl_invalid(self, mock_kafka_client, tmpdir):
+        json_file = tmpdir.join('offsets.jsonl')
+        json_file.write(
+            '{"groupid": "group1"}\n'
+            '{"topic": "topic1", "partition": 0, "offset": 10}\n'
+            '{"topic": "topic1", "partition": 1\n'
+        )
+        with mock.patch.object(
+            OffsetRestore,
+            "commit_offsets",
+            return_value=({}, {}),
+            autospec=True,
+        ) as mock_commit:
+            with pytest.raises(ValueError):
+                OffsetRestore.restore_offsets_jsonl(
+                    mock_kafka_client,
+                    str(json_file),
+                    'kafka',
+                    1,
+                )
+
+            # The chunks before the invalid line are committed
+            assert mock_commit.call_count == 1
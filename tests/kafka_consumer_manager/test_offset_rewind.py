@@ -49,8 +49,11 @@ class TestOffsetRewind(object):
             ordered_args, _ = mock_rewind.call_args
             assert ordered_args[1] == args.groupid
             assert ordered_args[2] == self.topics_partitions
-            mock_client.return_value.load_metadata_for_topics. \
-                assert_called_once_with()
+            # The metadata bootstrapped by the client is still fresh
+            assert not mock_client.return_value.load_metadata_for_topics.called
+            _, kwargs = mock_rewind.call_args
+            assert kwargs['metadata_token'] == \
+                mock_client.return_value.metadata_token
             mock_client.return_value.close.assert_called_once_with()
 
     @mock.patch('kafka_utils.kafka_consumer_manager'
@@ -12,7 +12,11 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+
 import mock
+import pytest
+from kafka.common import KafkaUnavailableError
 
 from kafka_utils.kafka_consumer_manager. \
     commands.offset_save import OffsetSave
@@ -83,9 +87,148 @@ class TestOffsetSave(object):
             cluster_config = mock.Mock()
             OffsetSave.run(args, cluster_config)
 
-            mock_client.return_value.load_metadata_for_topics. \
-                assert_called_once_with()
+            # The metadata bootstrapped by the client is still fresh
+            assert not mock_client.return_value.load_metadata_for_topics.called
             mock_client.return_value.close.assert_called_once_with()
             ordered_args, _ = mock_write_offsets.call_args
             assert ordered_args[0] == "some_file"
             assert ordered_args[1] == self.offset_data_file
+
+    def test_save_offsets_jsonl(self, tmpdir):
+        json_file = str(tmpdir.join('offsets.jsonl'))
+        with mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_save.get_consumer_offsets_metadata",
+            return_value=self.consumer_offsets_metadata,
+            autospec=True,
+        ) as mock_get_offsets:
+            OffsetSave.save_offsets_jsonl(
+                mock.Mock(),
+                'group1',
+                {'topic1': [0, 1]},
+                json_file,
+                'kafka',
+                10,
+            )
+
+            assert mock_get_offsets.call_args[0][2] == {'topic1': [0, 1]}
+
+        with open(json_file) as f:
+            assert [json.loads(line) for line in f] == [
+                {'groupid': 'group1'},
+                {'topic': 'topic1', 'partition': 0, 'offset': 10},
+                {'topic': 'topic1', 'partition': 1, 'offset': 20},
+            ]
+
+    def test_save_offsets_jsonl_chunks(self, tmpdir):
+        json_file = str(tmpdir.join('offsets.jsonl'))
+        with mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_save.get_consumer_offsets_metadata",
+            return_value={},
+            autospec=True,
+        ) as mock_get_offsets:
+            OffsetSave.save_offsets_jsonl(
+                mock.Mock(),
+                'group1',
+                self.topics_partitions,
+                json_file,
+                'kafka',
+                4,
+            )
+
+            # The offsets are fetched 4 partitions at a time
+            assert [
+                args[2] for args, _ in mock_get_offsets.call_args_list
+            ] == [
+                {'topic1': [0, 1, 2], 'topic2': [0]},
+                {'topic2': [1, 2, 3], 'topic3': [0]},
+                {'topic3': [1]},
+            ]
+
+    def test_save_offsets_jsonl_missing_topic(self, tmpdir, capsys):
+        json_file = str(tmpdir.join('offsets.jsonl'))
+        with mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_save.get_consumer_offsets_metadata",
+            return_value=self.consumer_offsets_metadata,
+            autospec=True,
+        ) as mock_get_offsets:
+            OffsetSave.save_offsets_jsonl(
+                mock.Mock(),
+                'group1',
+                {'topic1': [0, 1], 'topic4': []},
+                json_file,
+                'kafka',
+                10,
+            )
+
+            assert mock_get_offsets.call_args[0][2] == {'topic1': [0, 1]}
+
+        _, err = capsys.readouterr()
+        assert 'Warning: Topic topic4 does not exist in Kafka' in err
+
+    @pytest.mark.parametrize('group, file_name', [
+        ('group1', 'group1.json'),
+        ('my.group', 'my.group.json'),
+        ('../group1', '%2E.%2Fgroup1.json'),
+        ('a/b%2Fc', 'a%2Fb%252Fc.json'),
+    ])
+    def test_get_group_file_name(self, group, file_name):
+        assert OffsetSave.get_group_file_name(group, 'json') == file_name
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_save.KafkaToolClient')
+    def test_run_bulk_group_file_name(self, mock_client, tmpdir):
+        def run_bulk(args, cluster_config, client, save_group, **kwargs):
+            save_group(client, '../group1', self.topics_partitions)
+
+        with mock.patch.object(
+            OffsetSave,
+            "run_bulk",
+            side_effect=run_bulk,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_save.get_consumer_offsets_metadata",
+            return_value=self.consumer_offsets_metadata,
+            autospec=True,
+        ):
+            args = mock.Mock(
+                groupid=None,
+                json_file=str(tmpdir.join('offsets')),
+                format=None,
+            )
+            OffsetSave.run(args, mock.Mock())
+
+        # The file stays in the directory and holds the real group id
+        assert tmpdir.join('offsets').listdir() == [
+            tmpdir.join('offsets', '%2E.%2Fgroup1.json'),
+        ]
+        data = json.loads(tmpdir.join('offsets', '%2E.%2Fgroup1.json').read())
+        assert data['groupid'] == '../group1'
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_save.KafkaToolClient')
+    def test_run_jsonl_kafka_unavailable(self, mock_client, tmpdir, capsys):
+        with mock.patch.object(
+            OffsetSave,
+            "preprocess_args",
+            spec=OffsetSave.preprocess_args,
+            return_value=self.topics_partitions,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_save.get_consumer_offsets_metadata",
+            side_effect=KafkaUnavailableError,
+            autospec=True,
+        ):
+            args = mock.Mock(
+                groupid="group1",
+                json_file=str(tmpdir.join('offsets.jsonl')),
+                format=None,
+                chunk_size=10,
+            )
+            with pytest.raises(KafkaUnavailableError):
+                OffsetSave.run(args, mock.Mock())
+
+        _, err = capsys.readouterr()
+        assert 'Error: Encountered error with Kafka' in err
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+
+import mock
+import pytest
+
+from kafka_utils.kafka_consumer_manager. \
+    commands.offset_set_timestamp import OffsetSetTimestamp
+
+
+class TestOffsetSetTimestamp(object):
+    topics_partitions = {
+        "topic1": [0, 1, 2],
+        "topic2": [0, 1]
+    }
+    new_offsets = {
+        "topic1": {0: 10, 1: 20, 2: 30},
+        "topic2": {0: 5, 1: 0},
+    }
+
+    @pytest.mark.parametrize('string, expected', [
+        ('1500000000000', 1500000000000),
+        ('2017-07-14T02:40:00', 1500000000000),
+        ('1970-01-01T00:00:00', 0),
+    ])
+    def test_timestamp(self, string, expected):
+        assert OffsetSetTimestamp.timestamp(string) == expected
+
+    @pytest.mark.parametrize('string', ['-1', '2017-07-14', 'yesterday'])
+    def test_timestamp_invalid(self, string):
+        with pytest.raises(argparse.ArgumentTypeError):
+            OffsetSetTimestamp.timestamp(string)
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_set_timestamp.KafkaToolClient')
+    def test_run(self, mock_client):
+        with mock.patch.object(
+            OffsetSetTimestamp,
+            "preprocess_args",
+            spec=OffsetSetTimestamp.preprocess_args,
+            return_value=self.topics_partitions,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.get_offsets_for_times",
+            autospec=True,
+            return_value=self.new_offsets,
+        ) as mock_get_offsets, mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.set_consumer_offsets",
+            autospec=True,
+            return_value=[],
+        ) as mock_set:
+            args = mock.Mock(
+                groupid="some_group",
+                timestamp=1500000000000,
+                topic=None,
+                partitions=None,
+                storage='dual',
+            )
+            cluster_config = mock.Mock()
+            OffsetSetTimestamp.run(args, cluster_config)
+
+            mock_get_offsets.assert_called_once_with(
+                mock_client.return_value,
+                self.topics_partitions,
+                1500000000000,
+            )
+            mock_set.assert_called_once_with(
+                mock_client.return_value,
+                "some_group",
+                self.new_offsets,
+                offset_storage='dual',
+            )
+            mock_client.return_value.close.assert_called_once_with()
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_set_timestamp.KafkaToolClient')
+    def test_run_commit_error(self, mock_client):
+        with mock.patch.object(
+            OffsetSetTimestamp,
+            "preprocess_args",
+            spec=OffsetSetTimestamp.preprocess_args,
+            return_value=self.topics_partitions,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.get_offsets_for_times",
+            autospec=True,
+            return_value=self.new_offsets,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.set_consumer_offsets",
+            autospec=True,
+            return_value=[mock.Mock(topic="topic1", partition=0, error="err")],
+        ):
+            args = mock.Mock(
+                groupid="some_group",
+                timestamp=1500000000000,
+                topic=None,
+                partitions=None,
+                storage='kafka',
+            )
+            with pytest.raises(SystemExit):
+                OffsetSetTimestamp.run(args, mock.Mock())
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_set_timestamp.KafkaToolClient')
+    def test_run_kafka_storage(self, mock_client):
+        with mock.patch.object(
+            OffsetSetTimestamp,
+            "get_topics_for_group_from_kafka",
+            return_value=['topic1'],
+        ) as mock_get_topics, mock.patch.object(
+            OffsetSetTimestamp,
+            "get_topics_for_group_from_zookeeper",
+        ) as mock_get_zk_topics, mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_manager.prompt_user_input",
+            autospec=True,
+        ), mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.get_offsets_for_times",
+            autospec=True,
+            return_value={"topic1": {0: 10, 1: 20, 2: 30}},
+        ) as mock_get_offsets, mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.offset_set_timestamp.set_consumer_offsets",
+            autospec=True,
+            return_value=[],
+        ):
+            mock_client.return_value.get_partition_ids_for_topic.return_value = [0, 1, 2]
+            args = mock.Mock(
+                groupid="some_group",
+                timestamp=1500000000000,
+                topic=None,
+                partitions=None,
+                storage='kafka',
+                force=False,
+            )
+            OffsetSetTimestamp.run(args, mock.Mock())
+
+            # The topics of a Kafka-only group are read from Kafka
+            assert mock_get_topics.call_count == 1
+            assert not mock_get_zk_topics.called
+            mock_get_offsets.assert_called_once_with(
+                mock_client.return_value,
+                {"topic1": [0, 1, 2]},
+                1500000000000,
+            )
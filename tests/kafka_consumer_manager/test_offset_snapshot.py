@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+
+from kafka_utils.kafka_consumer_manager. \
+    commands.offset_snapshot import OffsetSnapshot
+from kafka_utils.kafka_consumer_manager. \
+    commands.offset_snapshot_diff import OffsetSnapshotDiff
+from kafka_utils.util.monitoring import ConsumerPartitionOffsets
+from kafka_utils.util.snapshot import read_snapshots
+from kafka_utils.util.snapshot import SnapshotHeader
+
+
+class TestOffsetSnapshot(object):
+
+    @mock.patch('kafka_utils.kafka_consumer_manager.'
+                'commands.offset_snapshot.KafkaToolClient')
+    def test_run(self, mock_client, tmpdir):
+        path = str(tmpdir.join('offsets.snapshots'))
+        groups_offsets = [
+            ('group1', {
+                'topic1': [ConsumerPartitionOffsets('topic1', 0, 10, 30, 0)],
+            }),
+            ('group2', {}),
+        ]
+        with mock.patch.object(
+            OffsetSnapshot,
+            'get_groups_topics',
+            return_value={'group1': ['topic1'], 'group2': ['topic1']},
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.offset_snapshot.get_groups_offsets_metadata',
+            return_value=iter(groups_offsets),
+            autospec=True,
+        ) as mock_get_offsets, mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.offset_snapshot.time.time',
+            return_value=1500000000.0,
+        ):
+            args = mock.Mock(
+                snapshot_file=path,
+                groupids=[],
+                all_groups=True,
+                storage='dual',
+                workers=4,
+            )
+            OffsetSnapshot.run(args, mock.Mock())
+
+            assert mock_get_offsets.call_args[0][1] == [
+                ('group1', ['topic1']),
+                ('group2', ['topic1']),
+            ]
+            assert mock_client.return_value.close.called
+
+        snapshot, = read_snapshots(path)
+        assert snapshot.timestamp == 1500000000000
+        assert snapshot.to_groups_offsets() == dict(groups_offsets[:1])
+
+    def test_run_no_groups(self):
+        args = mock.Mock(groupids=[], all_groups=False)
+
+        with pytest.raises(SystemExit):
+            OffsetSnapshot.run(args, mock.Mock())
+
+
+class TestOffsetSnapshotDiff(object):
+
+    headers = [
+        SnapshotHeader(1000, 1, 21, 10),
+        SnapshotHeader(2000, 1, 52, 10),
+        SnapshotHeader(3000, 1, 83, 10),
+    ]
+
+    @pytest.mark.parametrize('from_time, to_time, expected', [
+        (None, None, (1, 2)),
+        (1000, None, (0, 2)),
+        (None, 2500, (0, 1)),
+        (1500, 2000, (0, 1)),
+    ])
+    def test_select_headers(self, from_time, to_time, expected):
+        old, new = OffsetSnapshotDiff.select_headers(
+            self.headers,
+            from_time,
+            to_time,
+        )
+
+        assert (self.headers.index(old), self.headers.index(new)) == expected
+
+    def test_select_headers_single_snapshot(self):
+        assert OffsetSnapshotDiff.select_headers(
+            self.headers[:1],
+            None,
+            None,
+        ) == (None, self.headers[0])
+        assert OffsetSnapshotDiff.select_headers(
+            self.headers,
+            None,
+            500,
+        ) == (None, None)
@@ -59,53 +59,32 @@ class TestRenameGroup(object):
             obj.get_children.return_value = [
                 'some_topic', 'another_topic'
             ]
-            obj.get.return_value = (0, 0)
+            obj.get_group_partitions_offsets.return_value = {
+                "topic1": {0: b'10', 1: b'20', 2: b'30'},
+                "topic2": {0: b'40', 1: b'50'},
+            }
             cluster_config = mock.Mock(zookeeper='some_ip')
-            args = mock.Mock(old_groupid='old_group', new_groupid='new_group')
-            zk_old_group_get_calls = [
-                mock.call("/consumers/old_group/offsets/topic1/0"),
-                mock.call("/consumers/old_group/offsets/topic1/1"),
-                mock.call("/consumers/old_group/offsets/topic1/2"),
-                mock.call("/consumers/old_group/offsets/topic2/0"),
-                mock.call("/consumers/old_group/offsets/topic2/1"),
-            ]
-            zk_old_group_delete_calls = [
-                mock.call("/consumers/old_group", recursive=True),
-            ]
-            zk_new_group_calls = [
-                mock.call(
-                    "/consumers/new_group/offsets/topic1/0",
-                    value=bytes(0),
-                    makepath=True
-                ),
-                mock.call(
-                    "/consumers/new_group/offsets/topic1/1",
-                    value=bytes(0),
-                    makepath=True
-                ),
-                mock.call(
-                    "/consumers/new_group/offsets/topic1/2",
-                    value=bytes(0),
-                    makepath=True
-                ),
-                mock.call(
-                    "/consumers/new_group/offsets/topic2/0",
-                    value=bytes(0),
-                    makepath=True
-                ),
-                mock.call(
-                    "/consumers/new_group/offsets/topic2/1",
-                    value=bytes(0),
-                    makepath=True
-                ),
-            ]
+            args = mock.Mock(
+                old_groupid='old_group',
+                new_groupid='new_group',
+                storage='zookeeper',
+            )
 
             RenameGroup.run(args, cluster_config)
 
             assert mock_user_confirm.call_count == 1
-            sorted(obj.get.call_args_list) == sorted(zk_old_group_get_calls)
-            sorted(obj.delete.call_args_list) == sorted(zk_old_group_delete_calls)
-            sorted(obj.create.call_args_list) == sorted(zk_new_group_calls)
+            obj.get_group_partitions_offsets.assert_called_once_with(
+                'old_group',
+                topics_partitions,
+            )
+            obj.create_group_offsets.assert_called_once_with(
+                'new_group',
+                {
+                    "topic1": {0: b'10', 1: b'20', 2: b'30'},
+                    "topic2": {0: b'40', 1: b'50'},
+                },
+            )
+            obj.delete_tree.assert_called_once_with("/consumers/old_group")
 
     def test_run_same_groupids(self, mock_client):
         topics_partitions = {}
@@ -161,7 +140,7 @@ class TestRenameGroup(object):
                 'some_topic', 'another_topic'
             ]
             obj.get.return_value = (0, 0)
-            obj.create.side_effect = ZookeeperError("Boom!")
+            obj.create_group_offsets.side_effect = ZookeeperError("Boom!")
 
             with pytest.raises(ZookeeperError):
                 RenameGroup.run(args, cluster_config)
@@ -181,8 +160,56 @@ class TestRenameGroup(object):
             args = mock.Mock(old_groupid='old_group', new_groupid='new_group')
             obj.get_children.return_value = []
             obj.get.return_value = (0, 0)
-            obj.delete.side_effect = ZookeeperError("Boom!")
+            obj.delete_tree.side_effect = ZookeeperError("Boom!")
 
             with pytest.raises(ZookeeperError):
                 RenameGroup.run(args, cluster_config)
             assert mock_user_confirm.call_count == 0
+
+    def test_run_kafka(self, mock_client):
+        topics_partitions = {
+            "topic1": [0, 1, 2],
+            "topic2": [0, 1]
+        }
+        with self.mock_kafka_info(
+            topics_partitions
+        ) as (mock_process_args, mock_user_confirm, mock_ZK), mock.patch.object(
+            RenameGroup,
+            "get_topics_from_consumer_group_id",
+            return_value=set(),
+        ) as mock_get_topics, mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.rename_group.copy_offsets_kafka",
+            autospec=True,
+        ) as mock_copy_offsets, mock.patch(
+            "kafka_utils.kafka_consumer_manager."
+            "commands.rename_group.set_consumer_offsets",
+            autospec=True,
+        ) as mock_set_offsets:
+            cluster_config = mock.Mock(zookeeper='some_ip')
+            args = mock.Mock(
+                old_groupid='old_group',
+                new_groupid='new_group',
+                storage='kafka',
+            )
+
+            RenameGroup.run(args, cluster_config)
+
+            mock_get_topics.assert_called_once_with(
+                cluster_config,
+                'new_group',
+                storage='kafka',
+            )
+            mock_copy_offsets.assert_called_once_with(
+                mock_client.return_value,
+                'old_group',
+                'new_group',
+                topics_partitions,
+            )
+            mock_set_offsets.assert_called_once_with(
+                mock_client.return_value,
+                'old_group',
+                {"topic1": {0: -1, 1: -1, 2: -1}, "topic2": {0: -1, 1: -1}},
+                offset_storage='kafka',
+            )
+            assert not mock_ZK.called
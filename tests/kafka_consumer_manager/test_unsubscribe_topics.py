@@ -184,12 +184,13 @@ class TestUnsubscribeTopics(object):
         )
 
         assert zk_obj.delete_topic_partitions.call_count == 0
-        assert sorted(zk_obj.delete_topic.call_args_list) == sorted(
-            [
-                mock.call('some_group', 'topic1'),
-                mock.call('some_group', 'topic2'),
-            ],
-        )
+        assert not zk_obj.delete_topic.called
+        # All the topics are deleted at once
+        assert zk_obj.delete_topics.call_count == 1
+        assert sorted(zk_obj.delete_topics.call_args[0][1]) == [
+            'topic1',
+            'topic2',
+        ]
 
     def test_unsubscribe_no_node_error(self, zk):
         zk_obj = zk.return_value
@@ -205,6 +206,26 @@ class TestUnsubscribeTopics(object):
 
         assert zk_obj.delete_topic_partitions.called
 
+    def test_unsubscribe_missing_partitions(self, zk, capsys):
+        zk_obj = zk.return_value
+        zk_obj.delete_topic_partitions.return_value = [1]
+        zk_obj.get_my_subscribed_partitions.return_value = []
+
+        unsubscriber = ZookeeperUnsubscriber(zk_obj)
+        unsubscriber.unsubscribe_topic(
+            'some_group',
+            'topic1',
+            [0, 1, 2],
+            self.topics_partitions,
+        )
+
+        _, err = capsys.readouterr()
+        # Only the partitions not found are reported
+        assert "topic topic1, partition [1]" in err
+        assert zk_obj.delete_topic.call_args_list == [
+            mock.call('some_group', 'topic1'),
+        ]
+
     def test_unsubscribe_any_other_exception(self, zk):
         zk_obj = zk.return_value
         zk_obj.delete_topic_partitions.side_effect = ZookeeperError("Boom!")
@@ -245,3 +266,54 @@ class TestUnsubscribeTopics(object):
                     offset_storage='kafka',
                 ),
             ]
+
+    def test_unsubscribe_topics_kafka_storage_chunks(self):
+        client = mock.Mock()
+        offsets = {
+            'topic1': {0: 100, 1: 200, 2: 300},
+            'topic2': {0: 400, 1: 500},
+        }
+
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.unsubscribe_topics.get_current_consumer_offsets',
+            autospec=True,
+            return_value=offsets,
+        ) as mock_get, mock.patch(
+            'kafka_utils.kafka_consumer_manager.'
+            'commands.unsubscribe_topics.set_consumer_offsets',
+            autospec=True,
+        ) as mock_set:
+            unsubscriber = KafkaUnsubscriber(client, chunk_size=2, workers=2)
+            unsubscriber.unsubscribe_topic(
+                'some_group',
+                None,
+                None,
+                self.topics_partitions,
+            )
+
+            # The offsets of all the topics are fetched at once
+            assert mock_get.call_count == 1
+            assert sorted(mock_get.call_args[0][2]) == ['topic1', 'topic2']
+
+            chunks = [c[0][2] for c in mock_set.call_args_list]
+            assert len(chunks) == 3
+            assert all(
+                sum(len(partitions) for partitions in chunk.values()) <= 2
+                for chunk in chunks
+            )
+            committed = {}
+            for chunk in chunks:
+                for topic, partitions in chunk.iteritems():
+                    committed.setdefault(topic, {}).update(partitions)
+            assert committed == {
+                'topic1': {0: -1, 1: -1, 2: -1},
+                'topic2': {0: -1, 1: -1},
+            }
+            # Workers commit with their own copy of the client
+            assert 1 <= client.copy.call_count <= 2
+            assert set(c[0][0] for c in mock_set.call_args_list) == set(
+                [client.copy.return_value],
+            )
+            assert client.copy.return_value.close.call_count == \
+                client.copy.call_count
@@ -2,13 +2,18 @@ import struct
 from collections import namedtuple
 
 import mock
+import pytest
 from kafka.common import ConsumerTimeout
 from kafka.common import KafkaMessage
 from kafka.common import LeaderNotAvailableError
 
+from kafka_utils.kafka_consumer_manager.util import copy_offsets_kafka
 from kafka_utils.kafka_consumer_manager.util import get_group_partition
+from kafka_utils.kafka_consumer_manager.util import get_offsets_topic_partitions_count
+from kafka_utils.kafka_consumer_manager.util import GroupsIndex
 from kafka_utils.kafka_consumer_manager.util import InvalidMessageException
 from kafka_utils.kafka_consumer_manager.util import KafkaGroupReader
+from kafka_utils.util.config import ClusterConfig
 from kafka_utils.util.offsets import PartitionOffsets
 
 Message = namedtuple("Message", ["partition", "offset", "key", "value"])
@@ -64,6 +69,36 @@ class TestKafkaGroupReader(object):
         assert partition == 15
         assert offset is None
 
+    def test_parse_consumer_offset_message_value_v1(self):
+        kafka_group_reader = KafkaGroupReader(mock.Mock())
+        value = b''.join([
+            struct.pack('>h', 1),  # Schema: version 1
+            struct.pack('>q', 456),  # Offset 456
+            struct.pack('>h4s', 4, b'meta'),  # Metadata
+            struct.pack('>qq', 1500000000000, 1500086400000),  # Timestamps
+        ])
+        message = Message(0, '__consumer_offsets', self.key_ok, value)
+        other_message = Message(1, '__consumer_offsets', self.key_ok, value)
+
+        group, topic, partition, offset = kafka_group_reader.parse_consumer_offset_message(message)
+        other_group, other_topic, _, _ = kafka_group_reader.parse_consumer_offset_message(other_message)
+
+        assert (group, topic, partition, offset) == ('group1', 'topic1', 15, 456)
+        # Names are shared across messages
+        assert group is other_group
+        assert topic is other_topic
+
+    @pytest.mark.parametrize('key, value', [
+        (key_wrong, value_ok),
+        (key_ok, value_wrong),
+    ])
+    def test_parse_consumer_offset_message_invalid(self, key, value):
+        kafka_group_reader = KafkaGroupReader(mock.Mock())
+        message = Message(0, '__consumer_offsets', key, value)
+
+        with pytest.raises(InvalidMessageException):
+            kafka_group_reader.parse_consumer_offset_message(message)
+
     @mock.patch.object(KafkaGroupReader, 'parse_consumer_offset_message')
     def test_process_consumer_offset_message_grous(self, parse_mock):
         parse_mock.side_effect = [('test.a', 'topic1', 0, 123),
@@ -168,6 +203,111 @@ class TestKafkaGroupReader(object):
                     assert kafka_group_reader.kafka_groups['test_group'] == {"test_topic"}
                     assert len(kafka_group_reader.finished_partitions) == 1
 
+    def test_read_group_single_partition(self):
+        kafka_group_reader = KafkaGroupReader(mock.Mock())
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaConsumer',
+            autospec=True,
+        ) as mock_consumer, mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaToolClient',
+            autospec=True,
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_offsets_topic_partitions_count',
+            return_value=200,
+            autospec=True,
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_group_partition',
+            return_value=0,
+            autospec=True,
+        ) as mock_get_partition, mock.patch.object(
+            kafka_group_reader,
+            'get_current_watermarks',
+            return_value={},
+            autospec=True,
+        ) as mock_watermarks:
+            # Partition 0 of the topic is empty
+            assert kafka_group_reader.read_group('test_group') == []
+
+            mock_get_partition.assert_called_once_with('test_group', 200)
+            assert mock_consumer.call_args[0] == ({'__consumer_offsets': [0]},)
+            mock_watermarks.assert_called_once_with(0)
+            assert not mock_consumer.return_value.next.called
+
+    def test_read_group_since(self):
+        kafka_group_reader = KafkaGroupReader(mock.Mock())
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaConsumer',
+            autospec=True,
+        ) as mock_consumer, mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaToolClient',
+            autospec=True,
+        ) as mock_client, mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_offsets_topic_partitions_count',
+            return_value=50,
+            autospec=True,
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_group_partition',
+            return_value=3,
+            autospec=True,
+        ), mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_offsets_for_times',
+            return_value={'__consumer_offsets': {3: 40}},
+            autospec=True,
+        ) as mock_get_offsets, mock.patch.object(
+            kafka_group_reader,
+            'get_current_watermarks',
+            return_value={3: PartitionOffsets('__consumer_offsets', 3, 45, 0)},
+            autospec=True,
+        ), mock.patch.object(
+            kafka_group_reader,
+            'parse_consumer_offset_message',
+            return_value=['test_group', 'test_topic', 0, 45],
+            autospec=True,
+        ):
+            mock_consumer.return_value.next.return_value = mock.Mock(
+                partition=3,
+                offset=44,
+            )
+
+            assert kafka_group_reader.read_group(
+                'test_group',
+                since=1500000000000,
+            ) == {'test_topic'}
+
+            mock_get_offsets.assert_called_once_with(
+                mock_client.return_value,
+                {'__consumer_offsets': [3]},
+                1500000000000,
+                raise_on_error=False,
+            )
+            mock_consumer.return_value.set_topic_partitions.assert_called_once_with(
+                {('__consumer_offsets', 3): 40},
+            )
+            assert mock_client.return_value.close.called
+
+    def test_get_current_watermarks(self):
+        kafka_group_reader = KafkaGroupReader(mock.Mock())
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaToolClient',
+            autospec=True,
+        ) as mock_client, mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.get_topics_watermarks',
+            return_value={'__consumer_offsets': {
+                0: PartitionOffsets('__consumer_offsets', 0, 45, 0),
+                1: PartitionOffsets('__consumer_offsets', 1, 0, 0),
+                2: PartitionOffsets('__consumer_offsets', 2, 10, 5),
+            }},
+            autospec=True,
+        ) as mock_get_watermarks:
+            assert kafka_group_reader.get_current_watermarks(2) == {
+                2: PartitionOffsets('__consumer_offsets', 2, 10, 5),
+            }
+            # The watermark requests are pipelined by a KafkaToolClient
+            mock_get_watermarks.assert_called_once_with(
+                mock_client.return_value,
+                ['__consumer_offsets'],
+            )
+
     def test_get_group_partition(self):
         result1 = get_group_partition('815e79b2-be20-11e6-96b6-0697c842cbe5')
         result2 = get_group_partition('83e3f292-be26-11e6-b509-0697c842cbe5')
@@ -177,6 +317,91 @@ class TestKafkaGroupReader(object):
         assert result2 == 44
         assert result3 == 15
 
+    def test_get_group_partition_partitions_count(self):
+        group = '815e79b2-be20-11e6-96b6-0697c842cbe5'
+
+        assert get_group_partition(group, 200) == 160
+        assert get_group_partition(group, 1) == 0
+
+    @mock.patch.dict(
+        'kafka_utils.kafka_consumer_manager.util._offsets_topic_partitions_counts',
+        clear=True,
+    )
+    def test_get_offsets_topic_partitions_count(self):
+        client = mock.Mock(hosts=[('broker2', 9092), ('broker1', 9092)])
+        client.get_partition_ids_for_topic.return_value = range(200)
+
+        assert get_offsets_topic_partitions_count(client) == 200
+        # The count is cached per cluster
+        client.hosts = [('broker1', 9092), ('broker2', 9092)]
+        assert get_offsets_topic_partitions_count(client) == 200
+        client.get_partition_ids_for_topic.assert_called_once_with(
+            '__consumer_offsets',
+        )
+
+    @mock.patch.dict(
+        'kafka_utils.kafka_consumer_manager.util._offsets_topic_partitions_counts',
+        clear=True,
+    )
+    def test_get_offsets_topic_partitions_count_no_topic(self):
+        client = mock.Mock(hosts=[('broker1', 9092)])
+        client.get_partition_ids_for_topic.return_value = []
+
+        assert get_offsets_topic_partitions_count(client) == 50
+        client.get_partition_ids_for_topic.return_value = range(10)
+        assert get_offsets_topic_partitions_count(client) == 10
+
+    @mock.patch(
+        'kafka_utils.kafka_consumer_manager.util.set_consumer_offsets',
+        autospec=True,
+    )
+    @mock.patch(
+        'kafka_utils.kafka_consumer_manager.util.get_current_consumer_offsets',
+        autospec=True,
+        return_value={'topic1': {0: 10}},
+    )
+    def test_copy_offsets_kafka(self, mock_get_offsets, mock_set_offsets):
+        client = mock.Mock()
+
+        assert copy_offsets_kafka(
+            client,
+            'group1',
+            'group2',
+            {'topic1': [0, 1]},
+        ) == {'topic1': {0: 10}}
+        # Partitions with no committed offset are left out
+        mock_get_offsets.assert_called_once_with(
+            client,
+            'group1',
+            {'topic1': [0, 1]},
+            offset_storage='kafka',
+            skip_missing=True,
+        )
+        mock_set_offsets.assert_called_once_with(
+            client,
+            'group2',
+            {'topic1': {0: 10}},
+            offset_storage='kafka',
+        )
+
+    @mock.patch(
+        'kafka_utils.kafka_consumer_manager.util.set_consumer_offsets',
+        autospec=True,
+    )
+    @mock.patch(
+        'kafka_utils.kafka_consumer_manager.util.get_current_consumer_offsets',
+        autospec=True,
+        return_value={},
+    )
+    def test_copy_offsets_kafka_no_offsets(self, mock_get_offsets, mock_set_offsets):
+        assert copy_offsets_kafka(
+            mock.Mock(),
+            'group1',
+            'group2',
+            {'topic1': [0, 1]},
+        ) == {}
+        assert not mock_set_offsets.called
+
     def test_read_groups_with_consumer_timeout(self):
 
         kafka_config = mock.Mock()
@@ -262,3 +487,197 @@ class TestKafkaGroupReader(object):
             kafka_group_reader.watermarks = mock_get_watermarks()
             highmark = kafka_group_reader.get_max_offset(0)
             assert highmark == 45
+
+
+class TestGroupsIndex(object):
+
+    @pytest.fixture
+    def cluster_config(self):
+        return ClusterConfig('test', 'cluster1', 'localhost:9092', 'localhost:2181')
+
+    @pytest.fixture
+    def index(self, tmpdir):
+        return GroupsIndex(str(tmpdir.join('index')))
+
+    def test_load_not_indexed(self, index, cluster_config):
+        assert index.load(cluster_config) == ({}, {})
+
+    def test_save_load(self, index, cluster_config):
+        index.save(
+            cluster_config,
+            {'group1': {'topic1', 'topic2'}, 'group2': set()},
+            {0: 10, 3: 25},
+        )
+
+        assert index.load(cluster_config) == (
+            {'group1': {'topic1', 'topic2'}},
+            {0: 10, 3: 25},
+        )
+        # Every cluster has its own index
+        assert index.load(
+            cluster_config._replace(name='cluster2'),
+        ) == ({}, {})
+
+    @pytest.fixture
+    def reader(self, index, cluster_config):
+        reader = KafkaGroupReader(cluster_config, groups_index=index)
+        reader.consumer = mock.Mock()
+        reader.watermarks = {
+            0: PartitionOffsets('__consumer_offsets', 0, 100, 0),
+            1: PartitionOffsets('__consumer_offsets', 1, 50, 0),
+            2: PartitionOffsets('__consumer_offsets', 2, 30, 10),
+        }
+        return reader
+
+    def test_resume_from_index(self, reader, index, cluster_config):
+        index.save(cluster_config, {'group1': {'topic1'}}, {0: 80, 1: 50})
+
+        reader.resume_from_index()
+
+        assert reader.kafka_groups == {'group1': {'topic1'}}
+        # Partition 1 is fully indexed, partition 2 was never read
+        assert reader.finished_partitions == {1}
+        assert reader.get_start_offsets([0, 2]) == {
+            ('__consumer_offsets', 0): 80,
+            ('__consumer_offsets', 2): 10,
+        }
+
+    def test_resume_from_index_out_of_range(self, reader, index, cluster_config):
+        index.save(cluster_config, {'group1': {'topic1'}}, {0: 80, 2: 5})
+
+        reader.resume_from_index()
+
+        assert reader.kafka_groups == {}
+        assert reader.finished_partitions == set()
+        assert reader.get_start_offsets([0, 1, 2]) == {
+            ('__consumer_offsets', 0): 0,
+            ('__consumer_offsets', 1): 0,
+            ('__consumer_offsets', 2): 10,
+        }
+
+    def test_read_groups_updates_index(self, index, cluster_config):
+        index.save(cluster_config, {'group1': {'topic1'}}, {0: 44})
+        reader = KafkaGroupReader(cluster_config, groups_index=index)
+        with mock.patch(
+            'kafka_utils.kafka_consumer_manager.util.KafkaConsumer',
+            autospec=True,
+        ) as mock_consumer, mock.patch.object(
+            reader,
+            'get_current_watermarks',
+            return_value={0: PartitionOffsets('__consumer_offsets', 0, 45, 0)},
+            autospec=True,
+        ), mock.patch.object(
+            reader,
+            'parse_consumer_offset_message',
+            return_value=['group2', 'topic2', 0, 45],
+            autospec=True,
+        ):
+            mock_consumer.return_value.next.return_value = mock.Mock(
+                partition=0,
+                offset=44,
+            )
+            groups = reader.read_groups()
+
+        assert groups == {'group1': {'topic1'}, 'group2': {'topic2'}}
+        assert mock_consumer.return_value.next.call_count == 1
+        mock_consumer.return_value.set_topic_partitions.assert_called_once_with(
+            {('__consumer_offsets', 0): 44},
+        )
+        assert index.load(cluster_config) == (
+            {'group1': {'topic1'}, 'group2': {'topic2'}},
+            {0: 45},
+        )
+
+
+class TestKafkaGroupReaderShards(object):
+
+    watermarks = {
+        0: PartitionOffsets('__consumer_offsets', 0, 3, 0),
+        1: PartitionOffsets('__consumer_offsets', 1, 2, 0),
+        2: PartitionOffsets('__consumer_offsets', 2, 1, 0),
+    }
+    # partition: [(group, topic, offset)]
+    messages = {
+        0: [('group1', 'topic1', 10), ('group1', 'topic2', 10), ('group1', 'topic2', None)],
+        1: [('group2', 'topic1', 10), ('group3', 'topic3', 10)],
+        2: [('group4', 'topic4', 10)],
+    }
+
+    def make_consumer(self, *topics, **configs):
+        consumer = mock.Mock()
+
+        def set_topic_partitions(offsets):
+            consumer.messages = iter([
+                (Message(partition, offset, None, None), message)
+                for (_, partition), start in sorted(offsets.items())
+                for offset, message in enumerate(self.messages[partition])
+                if offset >= start
+            ])
+
+        def next():
+            try:
+                message, parsed = consumer.messages.next()
+            except StopIteration:
+                raise ConsumerTimeout()
+            consumer.parsed[message] = parsed
+            return message
+
+        consumer.parsed = self.parsed
+        consumer.set_topic_partitions.side_effect = set_topic_partitions
+        consumer.next.side_effect = next
+        return consumer
+
+    @pytest.fixture
+    def reader(self):
+        self.parsed = {}
+        reader = KafkaGroupReader(mock.Mock(), workers=2)
+
+        def parse(message):
+            group, topic, offset = self.parsed[message]
+            return group, topic, 0, offset
+
+        with mock.patch.object(
+            KafkaGroupReader,
+            'create_consumer',
+            side_effect=self.make_consumer,
+        ) as mock_create_consumer, mock.patch.object(
+            KafkaGroupReader,
+            'get_current_watermarks',
+            return_value=self.watermarks,
+        ), mock.patch.object(
+            KafkaGroupReader,
+            'parse_consumer_offset_message',
+            side_effect=parse,
+        ):
+            reader.mock_create_consumer = mock_create_consumer
+            yield reader
+
+    def test_read_groups_sharded(self, reader):
+        groups = reader.read_groups()
+
+        assert groups == {'group2': {'topic1'}, 'group3': {'topic3'}, 'group4': {'topic4'}}
+        assert reader.finished_partitions == {0, 1, 2}
+        # One consumer per shard
+        assert reader.mock_create_consumer.call_args_list == [
+            mock.call(fetch_message_max_bytes=8 * 1024 * 1024),
+        ] * 2
+
+    def test_read_groups_sharded_resume(self, reader):
+        # group1 was indexed before its deletion at offset 2 of partition 0
+        reader.kafka_groups['group1'] = {'topic1', 'topic2'}
+        reader.positions = {0: 2, 1: 1}
+        with mock.patch.object(
+            KafkaGroupReader,
+            'resume_from_index',
+            autospec=True,
+        ):
+            reader.groups_index = mock.Mock()
+            groups = reader.read_groups()
+
+        assert groups == {'group3': {'topic3'}, 'group4': {'topic4'}}
+        assert reader.positions == {0: 3, 1: 2, 2: 1}
+        reader.groups_index.save.assert_called_once_with(
+            reader.kafka_config,
+            groups,
+            {0: 3, 1: 2, 2: 1},
+        )
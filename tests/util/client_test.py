@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+from kafka.client import KafkaClient
+from kafka.common import BrokerMetadata
+from kafka.common import ConnectionError
+from kafka.common import FailedPayloadsError
+from kafka.common import MetadataResponse
+from kafka.common import NotLeaderForPartitionError
+from kafka.common import OffsetRequest
+from kafka.common import OffsetResponse
+from kafka.common import PartitionMetadata
+from kafka.common import TopicMetadata
+from kafka.common import UnknownTopicOrPartitionError
+
+from kafka_utils.util.client import KafkaToolClient
+
+
+class TestKafkaToolClient(object):
+
+    brokers = {
+        1: BrokerMetadata(1, b'host1', 9092),
+        2: BrokerMetadata(2, b'host2', 9092),
+    }
+    leaders = {
+        (b'topic1', 0): 1,
+        (b'topic1', 1): 2,
+    }
+
+    @pytest.fixture
+    def client(self):
+        with mock.patch.object(KafkaToolClient, 'load_metadata_for_topics'):
+            client = KafkaToolClient(['localhost:9092'])
+        client.load_metadata_for_topics = mock.Mock()
+        client._get_leader_for_partition = mock.Mock(
+            side_effect=lambda topic, partition:
+                self.brokers[self.leaders[(topic, partition)]],
+        )
+        return client
+
+    @pytest.fixture
+    def payload_lists(self):
+        return [
+            [
+                OffsetRequest(b'topic1', 0, -1, 1),
+                OffsetRequest(b'topic1', 1, -1, 1),
+            ],
+            [
+                OffsetRequest(b'topic1', 0, -2, 1),
+                OffsetRequest(b'topic1', 1, -2, 1),
+            ],
+        ]
+
+    def _responses(self, errors=None):
+        """Decoded responses returned by each broker, in request order."""
+        errors = errors or {}
+        return {
+            host: [
+                [
+                    OffsetResponse(
+                        b'topic1',
+                        partition,
+                        errors.get((host, partition), 0),
+                        (offset,),
+                    )
+                ]
+                for offset in (100, 10)
+            ]
+            for host, partition in ((b'host1', 0), (b'host2', 1))
+        }
+
+    @pytest.fixture
+    def mock_io(self):
+        with mock.patch.object(
+            KafkaToolClient,
+            '_get_conn',
+            autospec=True,
+        ) as mock_get_conn, mock.patch(
+            'kafka_utils.util.client.select.select',
+            side_effect=lambda rlist, wlist, xlist: (rlist, [], []),
+        ), mock.patch(
+            'kafka_utils.util.client.KafkaProtocol',
+        ) as mock_protocol:
+            conns = {}
+
+            def get_conn(client, host, port):
+                if host not in conns:
+                    conns[host] = mock.Mock()
+                    conns[host].recv.side_effect = lambda _, host=host: host
+                    conns[host].get_connected_socket.return_value = host
+                return conns[host]
+            mock_get_conn.side_effect = get_conn
+            yield conns, mock_protocol
+
+    def test_send_offset_requests_pipelined(self, client, payload_lists, mock_io):
+        conns, mock_protocol = mock_io
+        responses = self._responses()
+        mock_protocol.decode_offset_response.side_effect = \
+            lambda host: responses[host].pop(0)
+
+        high_resps, low_resps = client.send_offset_requests_pipelined(
+            payload_lists,
+        )
+
+        assert [resp.offsets for resp in high_resps] == [(100,), (100,)]
+        assert [resp.offsets for resp in low_resps] == [(10,), (10,)]
+        # Both requests of a leader are sent before reading any response
+        assert conns['host1'].send.call_count == 2
+        assert conns['host2'].send.call_count == 2
+
+    def test_send_offset_requests_pipelined_leader_failure(
+        self,
+        client,
+        payload_lists,
+        mock_io,
+    ):
+        conns, mock_protocol = mock_io
+        responses = self._responses()
+        mock_protocol.decode_offset_response.side_effect = \
+            lambda host: responses[host].pop(0)
+        conns['host2'] = mock.Mock()
+        conns['host2'].send.side_effect = ConnectionError
+
+        high_resps, low_resps = client.send_offset_requests_pipelined(
+            payload_lists,
+            retries=1,
+        )
+
+        # host1 responses are not affected
+        assert high_resps[0].offsets == (100,)
+        assert low_resps[0].offsets == (10,)
+        assert isinstance(high_resps[1], FailedPayloadsError)
+        assert isinstance(low_resps[1], FailedPayloadsError)
+        client.load_metadata_for_topics.assert_called_once_with(b'topic1')
+        assert conns['host2'].send.call_count == 2
+
+    def test_send_offset_requests_pipelined_leader_moved(
+        self,
+        client,
+        payload_lists,
+        mock_io,
+    ):
+        conns, mock_protocol = mock_io
+        responses = self._responses(
+            {(b'host2', 1): NotLeaderForPartitionError.errno},
+        )
+        # The partition moved to host1
+        responses[b'host1'].extend(
+            [[OffsetResponse(b'topic1', 1, 0, (200,))],
+             [OffsetResponse(b'topic1', 1, 0, (20,))]],
+        )
+        mock_protocol.decode_offset_response.side_effect = \
+            lambda host: responses[host].pop(0)
+
+        def load_metadata(*topics):
+            self.leaders[(b'topic1', 1)] = 1
+        client.load_metadata_for_topics.side_effect = load_metadata
+
+        try:
+            high_resps, low_resps = client.send_offset_requests_pipelined(
+                payload_lists,
+            )
+        finally:
+            self.leaders[(b'topic1', 1)] = 2
+
+        assert [resp.offsets for resp in high_resps] == [(100,), (200,)]
+        assert [resp.offsets for resp in low_resps] == [(10,), (20,)]
+
+
+class TestKafkaToolClientMetadata(object):
+
+    topics = (b'topic1', b'topic2')
+
+    def _metadata_response(self, topics):
+        return MetadataResponse(
+            [BrokerMetadata(1, b'host1', 9092)],
+            [
+                TopicMetadata(
+                    topic,
+                    0 if topic in self.topics
+                    else UnknownTopicOrPartitionError.errno,
+                    [PartitionMetadata(topic, 0, 1, [1], [1], 0)]
+                    if topic in self.topics else [],
+                )
+                for topic in topics or self.topics
+            ],
+        )
+
+    @pytest.yield_fixture
+    def client(self):
+        with mock.patch.object(
+            KafkaToolClient,
+            'send_metadata_request',
+            autospec=True,
+            side_effect=lambda client, topics: self._metadata_response(topics),
+        ) as mock_request:
+            client = KafkaToolClient(['localhost:9092'])
+            mock_request.reset_mock()
+            yield client
+
+    def test_storage_worker(self, client):
+        copies = []
+
+        def copy(client):
+            # The storage worker of a client is never copied
+            copies.append(client._storage_worker)
+            return mock.Mock()
+
+        with mock.patch.object(KafkaClient, 'copy', side_effect=copy, autospec=True):
+            storage_client, pool = client.get_storage_worker()
+            # The storage worker is reused
+            assert client.get_storage_worker() == (storage_client, pool)
+            client.copy()
+
+        assert copies == [None, None]
+        storage_client.reinit.assert_called_once_with()
+        with mock.patch.object(KafkaClient, 'close', autospec=True):
+            client.close()
+        storage_client.close.assert_called_once_with()
+        assert client._storage_worker is None
+
+    def test_bootstrap_token(self, client):
+        assert client.metadata_token.topics is None
+        assert client.is_metadata_fresh(client.metadata_token, [b'topic1'])
+        assert client.is_metadata_fresh(client.metadata_token)
+
+    def test_refresh_metadata_targeted(self, client):
+        token = client.refresh_metadata([b'topic1'])
+
+        client.send_metadata_request.assert_called_once_with(
+            client,
+            [b'topic1'],
+        )
+        assert token.topics == frozenset([b'topic1'])
+        assert client.has_metadata_for_topic(b'topic2')
+        assert client.is_metadata_fresh(token, [b'topic1'])
+        assert not client.is_metadata_fresh(token, [b'topic2'])
+        assert not client.is_metadata_fresh(token)
+
+    def test_refresh_metadata_unknown_topic(self, client):
+        client.refresh_metadata([b'topic1', b'topic3'])
+
+        # Unknown topics are never requested explicitly
+        client.send_metadata_request.assert_called_once_with(client, [])
+
+    def test_refresh_metadata_deleted_topic(self, client):
+        self.topics = (b'topic1',)
+
+        client.refresh_metadata([b'topic2'])
+
+        assert client.send_metadata_request.call_args_list == [
+            mock.call(client, [b'topic2']),
+            mock.call(client, []),
+        ]
+        assert not client.has_metadata_for_topic(b'topic2')
+
+    def test_refresh_metadata_fresh_token(self, client):
+        token = client.refresh_metadata([b'topic1', b'topic2'])
+        client.send_metadata_request.reset_mock()
+
+        assert client.refresh_metadata([b'topic2'], token) == token
+        assert client.refresh_metadata([], token) == token
+        assert not client.send_metadata_request.called
+
+    def test_refresh_metadata_after_reset(self, client):
+        token = client.metadata_token
+        client.reset_topic_metadata(b'topic1')
+
+        assert not client.is_metadata_fresh(token, [b'topic2'])
+        client.refresh_metadata(metadata_token=token)
+        client.send_metadata_request.assert_called_once_with(client, [])
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+import mock
+import pytest
+
+from kafka_utils.util.reassignment import estimate_duration
+from kafka_utils.util.reassignment import get_broker_traffic
+from kafka_utils.util.reassignment import ReassignmentCheckpoint
+from kafka_utils.util.reassignment import ReassignmentExecutor
+from kafka_utils.util.reassignment import ReassignmentMonitor
+from kafka_utils.util.reassignment import schedule_plan
+from kafka_utils.util.reassignment import split_plan
+
+
+@pytest.fixture
+def base_plan():
+    return {
+        'version': 1,
+        'partitions': [
+            {'topic': u'T0', 'partition': 0, 'replicas': [0, 1]},
+            {'topic': u'T0', 'partition': 1, 'replicas': [1, 2]},
+            {'topic': u'T1', 'partition': 0, 'replicas': [2, 3]},
+            {'topic': u'T1', 'partition': 1, 'replicas': [3, 0]},
+        ],
+    }
+
+
+@pytest.fixture
+def plan():
+    return {
+        'version': 1,
+        'partitions': [
+            # 2 movements
+            {'topic': u'T0', 'partition': 0, 'replicas': [2, 3]},
+            # 1 movement
+            {'topic': u'T0', 'partition': 1, 'replicas': [1, 3]},
+            # Leader only change
+            {'topic': u'T1', 'partition': 0, 'replicas': [3, 2]},
+            # 1 movement
+            {'topic': u'T1', 'partition': 1, 'replicas': [3, 1]},
+        ],
+    }
+
+
+@pytest.fixture
+def base_assignment(base_plan):
+    return {
+        (p_data['topic'], p_data['partition']): p_data['replicas']
+        for p_data in base_plan['partitions']
+    }
+
+
+def test_split_plan_no_limits(plan, base_assignment):
+    assert split_plan(plan, base_assignment) == [plan]
+
+
+def test_split_plan_max_movements(plan, base_assignment):
+    batches = split_plan(plan, base_assignment, max_movements=2)
+
+    assert [batch['partitions'] for batch in batches] == [
+        plan['partitions'][:1],
+        plan['partitions'][1:],
+    ]
+    assert all(batch['version'] == 1 for batch in batches)
+
+
+def test_split_plan_partition_over_max_movements(plan, base_assignment):
+    batches = split_plan(plan, base_assignment, max_movements=1)
+
+    assert [batch['partitions'] for batch in batches] == [
+        plan['partitions'][:1],
+        plan['partitions'][1:3],
+        plan['partitions'][3:],
+    ]
+
+
+def test_split_plan_max_size(plan, base_assignment):
+    max_size = len(json.dumps({
+        'version': 1,
+        'partitions': plan['partitions'][:2],
+    }))
+
+    batches = split_plan(plan, base_assignment, max_plan_size=max_size)
+
+    assert len(batches) == 2
+    for batch in batches:
+        assert len(json.dumps(batch)) <= max_size
+
+
+@pytest.fixture
+def sizes():
+    return {
+        (u'T0', 0): 10,
+        (u'T0', 1): 4,
+        (u'T1', 0): 100,
+        (u'T1', 1): 5,
+    }
+
+
+def test_get_broker_traffic(plan, base_assignment, sizes):
+    assert get_broker_traffic(
+        plan['partitions'][0],
+        base_assignment,
+        sizes.get,
+    ) == {0: 20, 2: 10, 3: 10}
+    # Leader only change
+    assert get_broker_traffic(
+        plan['partitions'][2],
+        base_assignment,
+        sizes.get,
+    ) == {}
+
+
+def test_schedule_plan(plan, base_assignment, sizes):
+    batches = schedule_plan(plan, base_assignment, sizes.get, max_batch_size=20)
+
+    # T0-0 moves 2 replicas of size 10, it fills the first batch with the
+    # leader only change. T1-1 and T0-1 fit together.
+    assert [batch['partitions'] for batch in batches] == [
+        [plan['partitions'][2], plan['partitions'][0]],
+        [plan['partitions'][3], plan['partitions'][1]],
+    ]
+
+
+def test_schedule_plan_partition_over_max_size(plan, base_assignment, sizes):
+    batches = schedule_plan(plan, base_assignment, sizes.get, max_batch_size=1)
+
+    assert [batch['partitions'] for batch in batches] == [
+        [plan['partitions'][2], plan['partitions'][0]],
+        [plan['partitions'][3]],
+        [plan['partitions'][1]],
+    ]
+
+
+def test_schedule_plan_max_broker_size(plan, base_assignment, sizes):
+    # Broker 3 is charged 10 for T0-0, 5 for T1-1 and 4 for T0-1
+    batches = schedule_plan(
+        plan,
+        base_assignment,
+        sizes.get,
+        max_batch_size=100,
+        max_broker_size=20,
+    )
+
+    assert [batch['partitions'] for batch in batches] == [
+        [
+            plan['partitions'][2],
+            plan['partitions'][0],
+            plan['partitions'][3],
+            plan['partitions'][1],
+        ],
+    ]
+    batches = schedule_plan(
+        plan,
+        base_assignment,
+        sizes.get,
+        max_batch_size=100,
+        max_broker_size=8,
+    )
+
+    assert [batch['partitions'] for batch in batches] == [
+        [plan['partitions'][2], plan['partitions'][0]],
+        [plan['partitions'][3]],
+        [plan['partitions'][1]],
+    ]
+
+
+def test_estimate_duration(plan, base_assignment, sizes):
+    batches = [
+        {'version': 1, 'partitions': plan['partitions'][:1]},
+        {'version': 1, 'partitions': plan['partitions'][1:]},
+    ]
+
+    # Busiest brokers: broker 0 with 20 and broker 3 with 9
+    assert estimate_duration(batches, base_assignment, sizes.get, 2) == 14.5
+
+
+def test_checkpoint(tmpdir, plan):
+    path = str(tmpdir.join('checkpoint.json'))
+    checkpoint = ReassignmentCheckpoint(path)
+    checkpoint.add({'version': 1, 'partitions': plan['partitions'][:2]})
+
+    loaded = ReassignmentCheckpoint(path)
+
+    assert loaded.is_completed(plan['partitions'][0])
+    assert loaded.is_completed(plan['partitions'][1])
+    assert not loaded.is_completed(plan['partitions'][2])
+    # Same partition reassigned to different replicas
+    assert not loaded.is_completed(
+        {'topic': u'T0', 'partition': 0, 'replicas': [0, 1]},
+    )
+
+
+class TestReassignmentExecutor(object):
+
+    @pytest.fixture
+    def zk(self, base_plan):
+        zk = mock.Mock()
+        zk.get_cluster_plan.return_value = base_plan
+        zk.execute_plan.return_value = True
+        zk.wait_for_reassignment.return_value = True
+        return zk
+
+    def test_execute(self, zk, plan):
+        executor = ReassignmentExecutor(zk, max_movements=2)
+
+        assert executor.execute(plan)
+
+        assert zk.execute_plan.call_args_list == [
+            mock.call(
+                {'version': 1, 'partitions': plan['partitions'][:1]},
+                validate=False,
+            ),
+            mock.call(
+                {'version': 1, 'partitions': plan['partitions'][1:]},
+                validate=False,
+            ),
+        ]
+
+    def test_execute_invalid_plan(self, zk, plan):
+        plan['partitions'][0]['replicas'] = [2]
+        executor = ReassignmentExecutor(zk, max_movements=2)
+
+        assert not executor.execute(plan)
+        assert not zk.execute_plan.called
+
+    def test_execute_batch_failure(self, zk, plan):
+        zk.execute_plan.return_value = False
+        executor = ReassignmentExecutor(zk, max_movements=2)
+
+        assert not executor.execute(plan)
+        assert zk.execute_plan.call_count == 1
+
+    def test_execute_waits_for_batch(self, zk, plan):
+        zk.wait_for_reassignment.side_effect = [True, False, False, True]
+        zk.get_pending_plan.return_value = plan
+        executor = ReassignmentExecutor(zk)
+
+        assert executor.execute(plan)
+        assert zk.wait_for_reassignment.call_count == 4
+
+    def test_execute_resume(self, zk, plan, tmpdir):
+        path = str(tmpdir.join('checkpoint.json'))
+        ReassignmentCheckpoint(path).add(
+            {'version': 1, 'partitions': plan['partitions'][:1]},
+        )
+        executor = ReassignmentExecutor(zk, checkpoint_file=path)
+
+        assert executor.execute(plan)
+
+        zk.execute_plan.assert_called_once_with(
+            {'version': 1, 'partitions': plan['partitions'][1:]},
+            validate=False,
+        )
+        assert all(
+            ReassignmentCheckpoint(path).is_completed(p_data)
+            for p_data in plan['partitions']
+        )
+
+    def test_execute_resume_pending_batch(self, zk, plan, tmpdir):
+        path = str(tmpdir.join('checkpoint.json'))
+        ReassignmentCheckpoint(path).add(
+            {'version': 1, 'partitions': plan['partitions'][:1]},
+        )
+        # The interrupted execution left the second batch in progress
+        zk.wait_for_reassignment.side_effect = [False, True, True]
+        zk.get_pending_plan.return_value = {
+            'version': 1,
+            'partitions': plan['partitions'][1:],
+        }
+        executor = ReassignmentExecutor(zk, checkpoint_file=path)
+
+        assert executor.execute(plan)
+
+        # The pending batch completes before the next one is submitted
+        assert [name for name, _, _ in zk.mock_calls[-5:]] == [
+            'wait_for_reassignment',
+            'get_pending_plan',
+            'wait_for_reassignment',
+            'execute_plan',
+            'wait_for_reassignment',
+        ]
+
+    def test_execute_scheduled_by_size(self, zk, plan, sizes):
+        executor = ReassignmentExecutor(
+            zk,
+            get_size=sizes.get,
+            max_batch_size=20,
+            max_movements=1,
+        )
+
+        assert executor.execute(plan)
+
+        # Scheduled batches are split further to honour max_movements
+        assert [
+            args[0]['partitions'] for args, _ in zk.execute_plan.call_args_list
+        ] == [
+            [plan['partitions'][2]],
+            [plan['partitions'][0]],
+            [plan['partitions'][3]],
+            [plan['partitions'][1]],
+        ]
+
+
+class TestReassignmentMonitor(object):
+
+    @pytest.fixture
+    def zk(self, plan):
+        zk = mock.Mock()
+        zk.get_pending_plan.side_effect = [
+            plan,
+            {'version': 1, 'partitions': plan['partitions'][1:2]},
+            {},
+        ]
+        zk.get_partitions_state.side_effect = lambda partitions: {
+            name: {'isr': [1, 2]} for name in partitions
+        }
+        return zk
+
+    def test_poll(self, zk, plan, sizes):
+        clock = mock.Mock(side_effect=[100, 110])
+        monitor = ReassignmentMonitor(zk, sizes.get, clock=clock)
+
+        status = monitor.poll()
+
+        assert (status.total, status.completed, status.in_flight) == (4, 0, 4)
+        assert status.percent == 0
+        assert status.throughput is None
+        assert status.eta is None
+        # Broker 3 is out of the ISR of every partition, biggest first
+        assert [
+            (progress.topic, progress.partition, progress.missing)
+            for progress in status.stragglers
+        ] == [
+            (u'T1', 0, [3]),
+            (u'T0', 0, [3]),
+            (u'T1', 1, [3]),
+            (u'T0', 1, [3]),
+        ]
+
+        status = monitor.poll()
+
+        # Only T0-1 (size 4) is still pending out of a total size of 119
+        assert (status.total, status.completed, status.in_flight) == (4, 3, 1)
+        assert status.percent == 115 * 100.0 / 119
+        assert status.elapsed == 10
+        assert status.throughput == 11.5
+        assert status.eta == 4 / 11.5
+        assert status.stragglers == [(u'T0', 1, [1, 3], [1, 2], [3], 4)]
+
+    def test_poll_max_stragglers(self, zk):
+        monitor = ReassignmentMonitor(zk)
+
+        status = monitor.poll(max_stragglers=1)
+
+        assert len(status.stragglers) == 1
+        assert status.stragglers[0].size == 1
+
+    def test_watch(self, zk):
+        monitor = ReassignmentMonitor(zk)
+
+        statuses = list(monitor.watch(poll_interval=0))
+
+        assert [status.in_flight for status in statuses] == [4, 1, 0]
+        assert statuses[-1].percent == 100
+        assert zk.wait_for_reassignment.call_count == 2
@@ -15,18 +15,24 @@
 import mock
 import pytest
 from kafka.common import ConsumerCoordinatorNotAvailableCode
+from kafka.common import KafkaError
 from kafka.common import KafkaUnavailableError
 from test_offsets import MyKafkaToolClient
 from test_offsets import TestOffsetsBase
 
 from kafka_utils.util.error import UnknownPartitions
 from kafka_utils.util.error import UnknownTopic
+from kafka_utils.util.monitoring import ConsumerOffsetsTable
 from kafka_utils.util.monitoring import ConsumerPartitionOffsets
 from kafka_utils.util.monitoring import get_consumer_offsets_metadata
+from kafka_utils.util.monitoring import get_groups_offsets_metadata
 from kafka_utils.util.monitoring import get_watermark_for_regex
 from kafka_utils.util.monitoring import get_watermark_for_topic
 from kafka_utils.util.monitoring import merge_offsets_metadata
 from kafka_utils.util.monitoring import merge_partition_offsets
+from kafka_utils.util.monitoring import WatermarkCache
+from kafka_utils.util.offsets import advance_consumer_offsets
+from kafka_utils.util.offsets import PartitionOffsets
 
 
 class TestMonitoring(TestOffsetsBase):
@@ -191,6 +197,64 @@ class TestMonitoring(TestOffsetsBase):
         result = merge_partition_offsets(*partition_offsets)
         assert result == expected
 
+    def test_merge_offsets_metadata_missing_partitions(self):
+        zk_offsets = {
+            'topic1': {0: 6, 1: 3},
+            'topic2': {0: 1},
+        }
+        kafka_offsets = {
+            'topic1': {0: 5, 2: 8},
+        }
+        expected = {
+            'topic1': {0: 6, 1: 3, 2: 8},
+            'topic2': {0: 1},
+            'topic3': {},
+        }
+
+        topics = ['topic1', 'topic2', 'topic3']
+        result = merge_offsets_metadata(topics, zk_offsets, kafka_offsets)
+        assert result == expected
+
+    def test_merge_partition_offsets_no_offset(self):
+        result = merge_partition_offsets({0: -1}, {1: 0})
+        assert result == {0: -1, 1: 0}
+
+    def test_consumer_offsets_table(self):
+        zk_table, kafka_table = ConsumerOffsetsTable.from_offsets(
+            ['topic1', 'topic2'],
+            {'topic1': {0: 6, 1: 3}},
+            {'topic1': {1: 4}, 'topic2': {0: 9}},
+        )
+
+        # Both tables have a row for every partition
+        assert zk_table.topic_ids == kafka_table.topic_ids
+        assert zk_table.partitions == kafka_table.partitions
+        assert len(zk_table) == 3
+        assert zk_table.to_offsets() == {
+            'topic1': {0: 6, 1: 3},
+            'topic2': {0: -1},
+        }
+        assert kafka_table.to_offsets() == {
+            'topic1': {0: -1, 1: 4},
+            'topic2': {0: 9},
+        }
+        assert ConsumerOffsetsTable.merge(
+            zk_table,
+            kafka_table,
+        ).to_offsets() == {
+            'topic1': {0: 6, 1: 4},
+            'topic2': {0: 9},
+        }
+
+    def test_merge_offsets_metadata_large_offsets(self):
+        # Offsets beyond 32 bits
+        result = merge_offsets_metadata(
+            ['topic1'],
+            {'topic1': {0: 2 ** 40}},
+            {'topic1': {0: 2 ** 40 + 1, 1: 0}},
+        )
+        assert result == {'topic1': {0: 2 ** 40 + 1, 1: 0}}
+
     def _has_no_partitions(self, offsets_metadata):
         return all(
             not partitions
@@ -302,3 +366,208 @@ class TestMonitoring(TestOffsetsBase):
                 'test_topic*')
             assert result[0]['test_topic_1'][1] == 99
             assert result[1]['test_topic_2'][1] == 100
+
+
+class TestGroupsOffsetsMetadata(TestOffsetsBase):
+
+    def test_get_groups_offsets_metadata(self, kafka_client_mock):
+        with mock.patch.object(
+            kafka_client_mock,
+            'load_metadata_for_topics',
+        ) as mock_load, mock.patch.object(
+            kafka_client_mock,
+            'send_offset_requests_pipelined',
+            wraps=kafka_client_mock.send_offset_requests_pipelined,
+        ) as mock_send:
+            actual = list(get_groups_offsets_metadata(
+                kafka_client_mock,
+                [('group2', ['topic2']), ('group1', ['topic1', 'topic2'])],
+                workers=2,
+            ))
+
+        assert actual == [
+            ('group2', {
+                'topic2': [
+                    ConsumerPartitionOffsets('topic2', 0, 15, 50, 5),
+                    ConsumerPartitionOffsets('topic2', 1, 0, 50, 5),
+                ],
+            }),
+            ('group1', {
+                'topic1': [
+                    ConsumerPartitionOffsets('topic1', 0, 30, 30, 10),
+                    ConsumerPartitionOffsets('topic1', 1, 20, 30, 5),
+                    ConsumerPartitionOffsets('topic1', 2, 10, 30, 3),
+                ],
+                'topic2': [
+                    ConsumerPartitionOffsets('topic2', 0, 15, 50, 5),
+                    ConsumerPartitionOffsets('topic2', 1, 0, 50, 5),
+                ],
+            }),
+        ]
+        # Metadata and watermarks are fetched once for all the groups
+        assert mock_load.call_count == 1
+        assert mock_send.call_count == 1
+
+    def _fail_group(self, failed_group):
+        fetch = MyKafkaToolClient._send_offset_fetch_request_either
+
+        def send_offset_fetch_request(client, group, payloads, **kwargs):
+            if group == failed_group:
+                raise KafkaError('Boom!')
+            return fetch(client, group, payloads, **kwargs)
+        return send_offset_fetch_request
+
+    def test_get_groups_offsets_metadata_error(self, kafka_client_mock):
+        with mock.patch.object(
+            MyKafkaToolClient,
+            'send_offset_fetch_request',
+            side_effect=self._fail_group('group1'),
+            autospec=True,
+        ):
+            actual = list(get_groups_offsets_metadata(
+                kafka_client_mock,
+                [('group1', ['topic2']), ('group2', ['topic2'])],
+            ))
+
+        assert actual == [
+            ('group1', {}),
+            ('group2', {
+                'topic2': [
+                    ConsumerPartitionOffsets('topic2', 0, 15, 50, 5),
+                    ConsumerPartitionOffsets('topic2', 1, 0, 50, 5),
+                ],
+            }),
+        ]
+
+    def test_get_groups_offsets_metadata_raise(self, kafka_client_mock):
+        with mock.patch.object(
+            MyKafkaToolClient,
+            'send_offset_fetch_request',
+            side_effect=self._fail_group('group1'),
+            autospec=True,
+        ):
+            with pytest.raises(KafkaError):
+                list(get_groups_offsets_metadata(
+                    kafka_client_mock,
+                    [('group1', ['topic2']), ('group2', ['topic2'])],
+                    raise_on_error=True,
+                ))
+
+
+class TestWatermarkCache(TestOffsetsBase):
+
+    @pytest.fixture
+    def clock(self):
+        return mock.Mock(return_value=100)
+
+    @pytest.fixture
+    def cache(self, clock):
+        return WatermarkCache(ttl=5, clock=clock)
+
+    @pytest.yield_fixture
+    def mock_send(self, kafka_client_mock):
+        with mock.patch.object(
+            kafka_client_mock,
+            'send_offset_requests_pipelined',
+            wraps=kafka_client_mock.send_offset_requests_pipelined,
+        ) as mock_send:
+            yield mock_send
+
+    def test_get_topics_watermarks(self, kafka_client_mock, cache, mock_send):
+        expected = {'topic1': {
+            0: PartitionOffsets('topic1', 0, 30, 10),
+            1: PartitionOffsets('topic1', 1, 30, 5),
+            2: PartitionOffsets('topic1', 2, 30, 3),
+        }}
+
+        assert cache.get_topics_watermarks(kafka_client_mock, ['topic1']) == expected
+        assert cache.get_topics_watermarks(
+            kafka_client_mock,
+            {'topic1': [0]},
+        ) == {'topic1': {0: expected['topic1'][0]}}
+        assert mock_send.call_count == 1
+
+    def test_get_topics_watermarks_partial(
+        self,
+        kafka_client_mock,
+        cache,
+        mock_send,
+    ):
+        cache.get_topics_watermarks(kafka_client_mock, {'topic1': [0]})
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1', 'topic2'])
+
+        # Only the partitions not in cache are requested
+        payloads = mock_send.call_args_list[1][0][0][0]
+        assert sorted((p.topic, p.partition) for p in payloads) == [
+            ('topic1', 1), ('topic1', 2), ('topic2', 0), ('topic2', 1),
+        ]
+
+    def test_get_topics_watermarks_expired(
+        self,
+        kafka_client_mock,
+        cache,
+        clock,
+        mock_send,
+    ):
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+        clock.return_value = 105
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+
+        assert mock_send.call_count == 2
+
+    def test_get_topics_watermarks_other_cluster(
+        self,
+        kafka_client_mock,
+        cache,
+        mock_send,
+    ):
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+        kafka_client_mock.hosts = [('otherhost', 9092)]
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+
+        assert mock_send.call_count == 2
+
+    def test_get_topics_watermarks_disabled(self, kafka_client_mock, mock_send):
+        cache = WatermarkCache(ttl=0)
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+
+        assert mock_send.call_count == 2
+
+    def test_invalidate(self, kafka_client_mock, cache, mock_send):
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1', 'topic2'])
+        cache.invalidate(kafka_client_mock, ['topic1'])
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1', 'topic2'])
+
+        payloads = mock_send.call_args_list[1][0][0][0]
+        assert set(p.topic for p in payloads) == set(['topic1'])
+
+    def test_invalidate_after_commit(self, kafka_client_mock, cache, mock_send):
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+        advance_consumer_offsets(
+            kafka_client_mock,
+            self.group,
+            ['topic1'],
+            watermark_cache=cache,
+        )
+        cache.get_topics_watermarks(kafka_client_mock, ['topic1'])
+
+        # The commit used the cached watermarks and invalidated them
+        assert mock_send.call_count == 2
+        assert kafka_client_mock.group_offsets['topic1'] == {0: 30, 1: 30, 2: 30}
+
+    def test_offset_metadata_cached(self, kafka_client_mock, cache, mock_send):
+        get_consumer_offsets_metadata(
+            kafka_client_mock,
+            self.group,
+            ['topic1'],
+            watermark_cache=cache,
+        )
+        get_consumer_offsets_metadata(
+            kafka_client_mock,
+            self.group,
+            ['topic1'],
+            watermark_cache=cache,
+        )
+
+        assert mock_send.call_count == 1
@@ -13,9 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import copy
+from multiprocessing.pool import ThreadPool
 
 import mock
 import pytest
+from kafka.common import FailedPayloadsError
 from kafka.common import NotLeaderForPartitionError
 from kafka.common import OffsetCommitResponse
 from kafka.common import OffsetFetchResponse
@@ -28,6 +30,7 @@ from kafka_utils.util.offsets import _nullify_partition_offsets
 from kafka_utils.util.offsets import _verify_commit_offsets_requests
 from kafka_utils.util.offsets import advance_consumer_offsets
 from kafka_utils.util.offsets import get_current_consumer_offsets
+from kafka_utils.util.offsets import get_offsets_for_times
 from kafka_utils.util.offsets import get_topics_watermarks
 from kafka_utils.util.offsets import nullify_offsets
 from kafka_utils.util.offsets import OffsetCommitError
@@ -58,11 +61,33 @@ class MyKafkaToolClient(object):
         self.low_offsets = low_offsets
         self.commit_error = False
         self.offset_request_error = False
+        self.unavailable_topics = set()
+        # topic: partition: offset at the requested time
+        self.time_offsets = {}
         self.topic_partitions = {}
+        self.hosts = [('localhost', 9092)]
+        self.storage_pool = None
 
     def load_metadata_for_topics(self):
         pass
 
+    def refresh_metadata(self, topics=None, metadata_token=None):
+        self.load_metadata_for_topics()
+
+    def copy(self):
+        return self
+
+    def reinit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_storage_worker(self):
+        if self.storage_pool is None:
+            self.storage_pool = ThreadPool(1)
+        return self, self.storage_pool
+
     def send_offset_request(
         self,
         payloads=None,
@@ -75,9 +100,14 @@ class MyKafkaToolClient(object):
         resps = []
         for req in payloads:
             if req.time == -1:
-                offset = self.high_offsets[req.topic].get(req.partition, -1)
+                offsets = (self.high_offsets[req.topic].get(req.partition, -1),)
+            elif req.time == -2:
+                offsets = (self.low_offsets[req.topic].get(req.partition, -1),)
+            elif req.partition in self.time_offsets.get(req.topic, {}):
+                offsets = (self.time_offsets[req.topic][req.partition],)
             else:
-                offset = self.low_offsets[req.topic].get(req.partition, -1)
+                # No log segment older than the requested time
+                offsets = ()
             if self.offset_request_error:
                 error_code = NotLeaderForPartitionError.errno
             elif req.partition not in self.topics[req.topic]:
@@ -88,11 +118,25 @@ class MyKafkaToolClient(object):
                 req.topic,
                 req.partition,
                 error_code,
-                (offset,)
+                offsets
             ))
 
         return [resp if not callback else callback(resp) for resp in resps]
 
+    def send_offset_requests_pipelined(self, payload_lists):
+        return [
+            [
+                FailedPayloadsError(payload)
+                if payload.topic in self.unavailable_topics
+                else resp
+                for payload, resp in zip(
+                    payloads,
+                    self.send_offset_request(payloads, fail_on_error=False),
+                )
+            ]
+            for payloads in payload_lists
+        ]
+
     def set_commit_error(self):
         self.commit_error = True
 
@@ -334,6 +378,16 @@ class TestOffsets(TestOffsetsBase):
         )
         assert actual == {'topic1': {0: 30, 1: 20, 2: 10}}
 
+    def test_get_current_consumer_offsets_skip_missing(self, kafka_client_mock):
+        actual = get_current_consumer_offsets(
+            kafka_client_mock,
+            self.group,
+            ['topic2'],
+            skip_missing=True,
+        )
+        # Partition 1 has no committed offset
+        assert actual == {'topic2': {0: 15}}
+
     def test_get_current_consumer_offsets_from_zookeeper(
         self,
         topics,
@@ -454,6 +508,82 @@ class TestOffsets(TestOffsetsBase):
             0: PartitionOffsets('topic1', 0, -1, -1),
         }}
 
+    def test_get_topics_watermarks_leader_not_available(self, kafka_client_mock):
+        kafka_client_mock.unavailable_topics.add('topic1')
+        with pytest.raises(FailedPayloadsError):
+            get_topics_watermarks(
+                kafka_client_mock,
+                ['topic1', 'topic2'],
+            )
+
+    def test_get_topics_watermarks_leader_not_available_no_fail(
+        self,
+        kafka_client_mock,
+    ):
+        kafka_client_mock.unavailable_topics.add('topic1')
+        actual = get_topics_watermarks(
+            kafka_client_mock,
+            ['topic1', 'topic2'],
+            raise_on_error=False,
+        )
+        assert actual == {'topic2': {
+            0: PartitionOffsets('topic2', 0, 50, 5),
+            1: PartitionOffsets('topic2', 1, 50, 5),
+        }}
+
+    def test_get_offsets_for_times(self, kafka_client_mock):
+        kafka_client_mock.time_offsets = {
+            'topic1': {0: 20, 1: 2},
+            'topic2': {0: 40, 1: 45},
+        }
+        actual = get_offsets_for_times(
+            kafka_client_mock,
+            {'topic1': [0, 1, 2], 'topic2': [0]},
+            1500000000000,
+        )
+        # topic1 partition 1 offset is older than the low watermark and
+        # partition 2 has no segment older than the requested time
+        assert actual == {
+            'topic1': {0: 20, 1: 5, 2: 3},
+            'topic2': {0: 40},
+        }
+
+    def test_get_offsets_for_times_negative_timestamp(self, kafka_client_mock):
+        with pytest.raises(ValueError):
+            get_offsets_for_times(kafka_client_mock, ['topic1'], -1)
+
+    def test_get_offsets_for_times_error(self, kafka_client_mock):
+        kafka_client_mock.set_offset_request_error()
+        actual = get_offsets_for_times(
+            kafka_client_mock,
+            ['topic1'],
+            1500000000000,
+        )
+        assert actual == {}
+
+    def test_get_offsets_for_times_leader_not_available(self, kafka_client_mock):
+        kafka_client_mock.unavailable_topics.add('topic1')
+        with pytest.raises(FailedPayloadsError):
+            get_offsets_for_times(
+                kafka_client_mock,
+                ['topic1', 'topic2'],
+                1500000000000,
+            )
+
+    def test_get_offsets_for_times_leader_not_available_no_fail(
+        self,
+        kafka_client_mock,
+    ):
+        kafka_client_mock.unavailable_topics.add('topic1')
+        kafka_client_mock.time_offsets = {'topic2': {0: 40, 1: 45}}
+        actual = get_offsets_for_times(
+            kafka_client_mock,
+            ['topic1', 'topic2'],
+            1500000000000,
+            raise_on_error=False,
+        )
+        assert actual == {'topic2': {0: 40, 1: 45}}
+
     def test__verify_commit_offsets_requests(self, kafka_client_mock):
         new_offsets = {
             'topic1': {
@@ -802,6 +932,137 @@ class TestOffsets(TestOffsetsBase):
         assert kafka_client_mock.send_offset_commit_request.call_count == 0
         assert kafka_client_mock.send_offset_commit_request_kafka.call_count == 0
 
+    @pytest.yield_fixture
+    def mock_commit_apis(self, kafka_client_mock):
+        with mock.patch.object(
+            kafka_client_mock,
+            'send_offset_commit_request',
+            wraps=kafka_client_mock.send_offset_commit_request,
+        ) as mock_zk, mock.patch.object(
+            kafka_client_mock,
+            'send_offset_commit_request_kafka',
+            wraps=kafka_client_mock.send_offset_commit_request_kafka,
+        ) as mock_kafka:
+            yield mock_zk, mock_kafka
+
+    def test_set_consumer_offsets_dual(self, kafka_client_mock, mock_commit_apis):
+        mock_zk, mock_kafka = mock_commit_apis
+        new_offsets = {
+            'topic1': {
+                0: 100,
+                1: 200,
+            },
+        }
+
+        status = set_consumer_offsets(
+            kafka_client_mock,
+            "group",
+            new_offsets,
+            offset_storage='dual',
+        )
+
+        assert status == []
+        assert mock_zk.call_count == 1
+        assert mock_kafka.call_count == 1
+        assert kafka_client_mock.group_offsets['topic1'] == {
+            0: 100,
+            1: 200,
+            2: 10,
+        }
+
+    def test_set_consumer_offsets_dual_fail(self, kafka_client_mock):
+        kafka_client_mock.set_commit_error()
+        new_offsets = {
+            'topic1': {
+                0: 100,
+            },
+        }
+
+        status = set_consumer_offsets(
+            kafka_client_mock,
+            "group",
+            new_offsets,
+            raise_on_error=True,
+            offset_storage='dual',
+        )
+
+        # Errors of both the storages are reported
+        assert status == [
+            OffsetCommitError("topic1", 0, RequestTimedOutError.message),
+            OffsetCommitError("topic1", 0, RequestTimedOutError.message),
+        ]
+
+    def test_set_consumer_offsets_chunked(
+        self,
+        kafka_client_mock,
+        mock_commit_apis,
+    ):
+        mock_zk = mock_commit_apis[0]
+        new_offsets = {
+            'topic1': {
+                0: 100,
+                1: 200,
+                2: 300,
+            },
+            'topic2': {
+                0: 150,
+                1: 300,
+            },
+        }
+
+        with mock.patch(
+            'kafka_utils.util.offsets.MAX_PAYLOADS_PER_REQUEST',
+            2,
+        ):
+            status = set_consumer_offsets(
+                kafka_client_mock,
+                "group",
+                new_offsets,
+            )
+
+        assert status == []
+        assert [
+            len(kwargs['payloads']) for _, kwargs in mock_zk.call_args_list
+        ] == [2, 2, 1]
+        assert kafka_client_mock.group_offsets == new_offsets
+
+    def test_advance_consumer_offsets_dual(
+        self,
+        kafka_client_mock,
+        mock_commit_apis,
+    ):
+        mock_zk, mock_kafka = mock_commit_apis
+
+        status = advance_consumer_offsets(
+            kafka_client_mock,
+            "group",
+            ["topic2"],
+            offset_storage='dual',
+        )
+
+        assert status == []
+        assert mock_zk.call_count == 1
+        assert mock_kafka.call_count == 1
+        assert kafka_client_mock.group_offsets['topic2'] == {0: 50, 1: 50}
+
+    def test_get_current_consumer_offsets_chunked(self, kafka_client_mock):
+        with mock.patch(
+            'kafka_utils.util.offsets.MAX_PAYLOADS_PER_REQUEST',
+            2,
+        ), mock.patch.object(
+            kafka_client_mock,
+            'send_offset_fetch_request',
+            wraps=kafka_client_mock.send_offset_fetch_request,
+        ) as mock_fetch:
+            actual = get_current_consumer_offsets(
+                kafka_client_mock,
+                self.group,
+                ['topic1'],
+            )
+
+        assert actual == {'topic1': {0: 30, 1: 20, 2: 10}}
+        assert mock_fetch.call_count == 2
+
     def test_nullify_partition_offsets(self):
         partition_offsets = {
             0: 11,
@@ -14,11 +14,37 @@
 # limitations under the License.
 import struct
 
+import pytest
 from kafka.common import OffsetCommitRequest
+from kafka.util import read_short_string
+from kafka.util import relative_unpack
 
 from kafka_utils.util.protocol import KafkaToolProtocol
 
 
+def decode_offset_commit_request_kafka(data):
+    ((size, api_key, version, correlation_id), cur) = \
+        relative_unpack('>ihhi', data, 0)
+    assert size == len(data) - 4
+    (client_id, cur) = read_short_string(data, cur)
+    (group, cur) = read_short_string(data, cur)
+    ((generation_id,), cur) = relative_unpack('>i', data, cur)
+    (consumer_id, cur) = read_short_string(data, cur)
+    ((retention_time, num_topics), cur) = relative_unpack('>qi', data, cur)
+    payloads = []
+    for _ in range(num_topics):
+        (topic, cur) = read_short_string(data, cur)
+        ((num_partitions,), cur) = relative_unpack('>i', data, cur)
+        for _ in range(num_partitions):
+            ((partition, offset), cur) = relative_unpack('>iq', data, cur)
+            (metadata, cur) = read_short_string(data, cur)
+            payloads.append(
+                OffsetCommitRequest(topic, partition, offset, metadata),
+            )
+    assert cur == len(data)
+    return (api_key, version, correlation_id, client_id, group, payloads)
+
+
 class TestProtocol(object):
 
     def test_encode_offset_commit_request_kafka(self):
@@ -66,3 +92,32 @@ class TestProtocol(object):
         ])
 
         assert encoded in [expected1, expected2]
+
+    def test_encode_offset_commit_request_kafka_round_trip(self):
+        payloads = [
+            OffsetCommitRequest(
+                b"topic%d" % (i % 7),
+                i // 7,
+                i * 1000,
+                b"meta%d" % i if i % 2 else None,
+            )
+            for i in range(100)
+        ]
+
+        encoded = KafkaToolProtocol.encode_offset_commit_request_kafka(
+            b"client_id", 42, b"group_id", payloads,
+        )
+        api_key, version, correlation_id, client_id, group, decoded = \
+            decode_offset_commit_request_kafka(bytes(encoded))
+
+        assert (api_key, version, correlation_id) == (8, 2, 42)
+        assert (client_id, group) == (b"client_id", b"group_id")
+        assert sorted(decoded) == sorted(payloads)
+
+    def test_encode_offset_commit_request_kafka_not_bytes(self):
+        with pytest.raises(TypeError):
+            KafkaToolProtocol.encode_offset_commit_request_kafka(
+                b"client_id", 42, b"group_id", [
+                    OffsetCommitRequest(u"topic1", 0, 123, None),
+                ],
+            )
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Yelp Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from kafka_utils.util.error import InvalidSnapshotError
+from kafka_utils.util.monitoring import ConsumerPartitionOffsets
+from kafka_utils.util.snapshot import append_snapshot
+from kafka_utils.util.snapshot import diff_snapshots
+from kafka_utils.util.snapshot import OffsetsDiff
+from kafka_utils.util.snapshot import OffsetsSnapshot
+from kafka_utils.util.snapshot import read_snapshot
+from kafka_utils.util.snapshot import read_snapshot_headers
+from kafka_utils.util.snapshot import read_snapshots
+
+
+def make_snapshot(timestamp, group1_offset, highmark):
+    return OffsetsSnapshot.from_groups_offsets(timestamp, [
+        ('group1', {
+            'topic1': [
+                ConsumerPartitionOffsets('topic1', 0, group1_offset, highmark, 0),
+                ConsumerPartitionOffsets('topic1', 1, 5, 10, 2),
+            ],
+        }),
+        (u'groupé', {
+            'topic1': [ConsumerPartitionOffsets('topic1', 0, 7, highmark, 0)],
+        }),
+    ])
+
+
+class TestOffsetsSnapshot(object):
+
+    def test_from_groups_offsets(self):
+        snapshot = make_snapshot(1000, 20, 30)
+
+        assert len(snapshot) == 3
+        # Topic names are shared by the groups
+        assert snapshot.strings == ['group1', 'topic1', u'groupé']
+        assert snapshot.group_ids == [0, 0, 2]
+        assert snapshot.topic_ids == [1, 1, 1]
+
+    def test_encode_decode(self, tmpdir):
+        path = str(tmpdir.join('offsets.snapshots'))
+        snapshot = make_snapshot(1000, 20, 30)
+        append_snapshot(path, snapshot)
+
+        header, = read_snapshot_headers(path)
+        decoded = read_snapshot(path, header)
+
+        assert header.timestamp == 1000
+        assert header.rows == 3
+        assert decoded.timestamp == 1000
+        assert decoded.to_groups_offsets() == snapshot.to_groups_offsets()
+        assert decoded.to_groups_offsets()[u'groupé'] == {
+            'topic1': [ConsumerPartitionOffsets('topic1', 0, 7, 30, 0)],
+        }
+
+    def test_empty_snapshot(self, tmpdir):
+        path = str(tmpdir.join('offsets.snapshots'))
+        append_snapshot(path, OffsetsSnapshot.from_groups_offsets(1000, []))
+
+        snapshot, = read_snapshots(path)
+
+        assert len(snapshot) == 0
+        assert snapshot.to_groups_offsets() == {}
+
+
+class TestSnapshotFile(object):
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        path = str(tmpdir.join('offsets.snapshots'))
+        for timestamp, offset, highmark in [
+            (1000, 10, 30),
+            (2000, 20, 40),
+            (3000, 25, 60),
+        ]:
+            append_snapshot(path, make_snapshot(timestamp, offset, highmark))
+        return path
+
+    def test_read_snapshots(self, path):
+        assert [
+            snapshot.timestamp for snapshot in read_snapshots(path)
+        ] == [1000, 2000, 3000]
+        assert [
+            snapshot.timestamp
+            for snapshot in read_snapshots(path, start=1500, end=3000)
+        ] == [2000, 3000]
+
+    def test_read_snapshot_headers_truncated(self, path):
+        with open(path, 'rb+') as f:
+            f.seek(-1, 2)
+            f.truncate()
+
+        # The interrupted append is ignored
+        assert [
+            header.timestamp for header in read_snapshot_headers(path)
+        ] == [1000, 2000]
+
+    def test_read_snapshot_headers_invalid(self, tmpdir):
+        path = str(tmpdir.join('offsets.json'))
+        with open(path, 'w') as f:
+            f.write('{"groupid": "group1", "offsets": {}}')
+
+        with pytest.raises(InvalidSnapshotError):
+            read_snapshot_headers(path)
+
+    def test_diff_snapshots(self, path):
+        old, new = list(read_snapshots(path, start=2000))
+
+        assert diff_snapshots(old, new) == [
+            OffsetsDiff('group1', 'topic1', 0, 5, 20, 35, 15),
+            OffsetsDiff('group1', 'topic1', 1, 0, 0, 5, 0),
+            OffsetsDiff(u'groupé', 'topic1', 0, 0, 20, 53, 20),
+        ]
+
+    def test_diff_snapshots_missing_partition(self):
+        old = make_snapshot(1000, 10, 30)
+        new = OffsetsSnapshot.from_groups_offsets(2000, [
+            ('group1', {
+                'topic1': [ConsumerPartitionOffsets('topic1', 0, 30, 30, 0)],
+                'topic2': [ConsumerPartitionOffsets('topic2', 0, 1, 1, 0)],
+            }),
+        ])
+
+        assert diff_snapshots(old, new) == [
+            OffsetsDiff('group1', 'topic1', 0, 20, 0, 0, -20),
+        ]
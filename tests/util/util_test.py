@@ -18,6 +18,7 @@ import pytest
 
 from kafka_utils.util import positive_float
 from kafka_utils.util import positive_int
+from kafka_utils.util import positive_nonzero_float
 from kafka_utils.util import positive_nonzero_int
 from kafka_utils.util import tuple_alter
 from kafka_utils.util import tuple_remove
@@ -90,3 +91,12 @@ def test_positive_float_not_float():
 def test_positive_float_negative_float():
     with pytest.raises(ArgumentTypeError):
         positive_float('-1.45')
+
+
+def test_positive_nonzero_float_valid():
+    assert positive_nonzero_float('0.5') == 0.5
+
+
+def test_positive_nonzero_float_zero():
+    with pytest.raises(ArgumentTypeError):
+        positive_nonzero_float('0')
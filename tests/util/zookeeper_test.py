@@ -15,9 +15,14 @@
 import json
 
 import mock
+import pytest
+from kazoo.exceptions import NodeExistsError
+from kazoo.exceptions import NoNodeError
+from kazoo.exceptions import RolledBackError
 
 from kafka_utils.util.config import ClusterConfig
 from kafka_utils.util.zookeeper import ZK
+from kafka_utils.util.zookeeper import ZKSessionRegistry
 
 
 @mock.patch(
@@ -112,32 +117,43 @@ class TestZK(object):
             assert mock_client.return_value.delete.call_args_list == call_list
 
     def test_delete_topic_partitions(self, mock_client):
-        with mock.patch.object(
-            ZK,
-            'delete',
-            autospec=True
-        ) as mock_delete:
-            with ZK(self.cluster_config) as zk:
-                zk.delete_topic_partitions(
-                    'some_group',
-                    'some_topic',
-                    [0, 1, 2]
-                )
-                call_list = [
-                    mock.call(
-                        zk,
-                        '/consumers/some_group/offsets/some_topic/0'
-                    ),
-                    mock.call(
-                        zk,
-                        '/consumers/some_group/offsets/some_topic/1'
-                    ),
-                    mock.call(
-                        zk,
-                        '/consumers/some_group/offsets/some_topic/2'
-                    ),
-                ]
-                assert mock_delete.call_args_list == call_list
+        transactions = self._mock_transactions(mock_client)
+        mock_client.return_value.get_children.return_value = ['0', '1', '2', '3']
+
+        with ZK(self.cluster_config) as zk:
+            zk.delete_topic_partitions(
+                'some_group',
+                'some_topic',
+                [0, 1, 2]
+            )
+
+        transaction, = transactions
+        assert transaction.delete.call_args_list == [
+            mock.call('/consumers/some_group/offsets/some_topic/0'),
+            mock.call('/consumers/some_group/offsets/some_topic/1'),
+            mock.call('/consumers/some_group/offsets/some_topic/2'),
+        ]
+        assert transaction.commit.called
+
+    def test_delete_topic_partitions_missing(self, mock_client):
+        transactions = self._mock_transactions(mock_client)
+        mock_client.return_value.get_children.return_value = ['0', '2']
+
+        with ZK(self.cluster_config) as zk:
+            missing = zk.delete_topic_partitions(
+                'some_group',
+                'some_topic',
+                [0, 1, 2]
+            )
+
+        assert missing == [1]
+        # The subscribed partitions are still deleted
+        transaction, = transactions
+        assert transaction.delete.call_args_list == [
+            mock.call('/consumers/some_group/offsets/some_topic/0'),
+            mock.call('/consumers/some_group/offsets/some_topic/2'),
+        ]
+        assert transaction.commit.called
 
     def test_delete_topic(self, _):
         with mock.patch.object(
@@ -210,3 +226,288 @@ class TestZK(object):
                     False
                 )
                 assert mock_client.return_value.create.call_args_list == [expected_create_call]
+
+    def _async_result(self, tree, path):
+        result = mock.Mock()
+        if path in tree:
+            result.get.return_value = tree[path]
+        else:
+            result.get.side_effect = NoNodeError()
+        return result
+
+    def test_iter_groups_offsets(self, mock_client):
+        tree = {
+            '/consumers/group1/offsets': ['topic1', 'topic2'],
+            '/consumers/group1/offsets/topic1': ['0', '1'],
+            '/consumers/group1/offsets/topic1/0': ('10', None),
+            '/consumers/group1/offsets/topic1/1': ('20', None),
+            '/consumers/group2/offsets': ['topic1'],
+            '/consumers/group2/offsets/topic1': ['0'],
+            '/consumers/group2/offsets/topic1/0': ('30', None),
+        }
+        mock_client.return_value.get_children_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+        mock_client.return_value.get_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+
+        with ZK(self.cluster_config) as zk:
+            actual = list(zk.iter_groups_offsets(
+                ['group1', 'group2', 'group3'],
+                window=2,
+            ))
+
+        assert actual == [
+            ('group1', {'topic1': {'0': 10, '1': 20}, 'topic2': {}}),
+            ('group2', {'topic1': {'0': 30}}),
+            ('group3', {}),
+        ]
+
+    def test_iter_groups_offsets_missing_offset(self, mock_client):
+        tree = {
+            '/consumers/group1/offsets': ['topic1'],
+            '/consumers/group1/offsets/topic1': ['0'],
+        }
+        mock_client.return_value.get_children_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+        mock_client.return_value.get_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+
+        with ZK(self.cluster_config) as zk:
+            with pytest.raises(NoNodeError):
+                list(zk.iter_groups_offsets(['group1']))
+
+    def test_get_consumer_groups(self, mock_client):
+        with mock.patch.object(
+            ZK,
+            'iter_groups_offsets',
+            autospec=True,
+            return_value=iter([('group1', {'topic1': {'0': 10}})]),
+        ) as mock_iter:
+            with ZK(self.cluster_config) as zk:
+                actual = zk.get_consumer_groups('group1')
+                mock_iter.assert_called_once_with(zk, ['group1'])
+        assert actual == {'group1': {'topic1': {'0': 10}}}
+
+    def test_get_groups_topics(self, mock_client):
+        tree = {
+            '/consumers': ['group1', 'group2'],
+            '/consumers/group1/offsets': ['topic1', 'topic2'],
+        }
+        mock_client.return_value.get_children.side_effect = \
+            lambda path, watch=None: tree[path]
+        mock_client.return_value.get_children_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+
+        with ZK(self.cluster_config) as zk:
+            assert zk.get_groups_topics() == {
+                'group1': ['topic1', 'topic2'],
+                'group2': [],
+            }
+            assert zk.get_groups_topics(['group1']) == {
+                'group1': ['topic1', 'topic2'],
+            }
+
+    def test_get_partitions_state(self, mock_client):
+        tree = {
+            '/brokers/topics/topic1/partitions/0/state':
+                ('{"leader": 1, "isr": [1, 2]}', None),
+        }
+        mock_client.return_value.get_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+
+        with ZK(self.cluster_config) as zk:
+            actual = zk.get_partitions_state([('topic1', 0), ('topic1', 1)])
+
+        assert actual == {
+            ('topic1', 0): {'leader': 1, 'isr': [1, 2]},
+            ('topic1', 1): {},
+        }
+
+    def test_get_group_partitions_offsets(self, mock_client):
+        tree = {
+            '/consumers/group1/offsets/topic1/0': ('10', None),
+            '/consumers/group1/offsets/topic1/1': ('20', None),
+            '/consumers/group1/offsets/topic2/0': ('30', None),
+        }
+        mock_client.return_value.get_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+
+        with ZK(self.cluster_config) as zk:
+            assert zk.get_group_partitions_offsets(
+                'group1',
+                {'topic1': [0, 1], 'topic2': [0]},
+                window=2,
+            ) == {'topic1': {0: '10', 1: '20'}, 'topic2': {0: '30'}}
+
+            with pytest.raises(NoNodeError):
+                zk.get_group_partitions_offsets('group1', {'topic1': [2]})
+
+    def _mock_transactions(self, mock_client, results=None):
+        transactions = []
+
+        def transaction():
+            transactions.append(mock.Mock())
+            transactions[-1].commit.return_value = results or []
+            return transactions[-1]
+        mock_client.return_value.transaction.side_effect = transaction
+        return transactions
+
+    def test_create_group_offsets(self, mock_client):
+        transactions = self._mock_transactions(mock_client)
+        mock_client.return_value.get_children.return_value = ['topic1']
+
+        with ZK(self.cluster_config) as zk:
+            zk.create_group_offsets(
+                'group1',
+                {'topic1': {0: '10', 1: '20'}, 'topic2': {0: '30'}},
+                batch_size=3,
+            )
+
+        mock_client.return_value.ensure_path.assert_called_once_with(
+            '/consumers/group1/offsets',
+        )
+        # The existing topic node is not created again
+        assert [t.create.call_args_list for t in transactions] == [
+            [
+                mock.call('/consumers/group1/offsets/topic1/0', b'10'),
+                mock.call('/consumers/group1/offsets/topic1/1', b'20'),
+                mock.call('/consumers/group1/offsets/topic2', b''),
+            ],
+            [mock.call('/consumers/group1/offsets/topic2/0', b'30')],
+        ]
+        assert all(t.commit.called for t in transactions)
+
+    def test_create_group_offsets_node_exists(self, mock_client):
+        self._mock_transactions(
+            mock_client,
+            [NodeExistsError(), RolledBackError()],
+        )
+        mock_client.return_value.get_children.return_value = ['topic1']
+
+        with ZK(self.cluster_config) as zk:
+            with pytest.raises(NodeExistsError):
+                zk.create_group_offsets('group1', {'topic1': {0: '10', 1: '20'}})
+
+    def test_delete_tree(self, mock_client):
+        tree = {
+            '/consumers/group1': ['offsets', 'owners'],
+            '/consumers/group1/offsets': ['topic1'],
+            '/consumers/group1/offsets/topic1': ['0', '1'],
+            '/consumers/group1/offsets/topic1/0': [],
+            '/consumers/group1/offsets/topic1/1': [],
+            '/consumers/group1/owners': [],
+        }
+        mock_client.return_value.get_children_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+        transactions = self._mock_transactions(mock_client)
+
+        with ZK(self.cluster_config) as zk:
+            zk.delete_tree('/consumers/group1', batch_size=4)
+
+        deleted = [
+            args[0]
+            for transaction in transactions
+            for args, _ in transaction.delete.call_args_list
+        ]
+        assert len(transactions) == 2
+        assert sorted(deleted) == sorted(tree)
+        # Children are deleted before their parent
+        for path in tree:
+            for child in tree[path]:
+                assert deleted.index(path + '/' + child) < deleted.index(path)
+
+    def test_delete_topics(self, mock_client):
+        tree = {
+            '/consumers/group1/offsets/topic1': ['0'],
+            '/consumers/group1/offsets/topic1/0': [],
+            '/consumers/group1/offsets/topic2': ['0', '1'],
+            '/consumers/group1/offsets/topic2/0': [],
+            '/consumers/group1/offsets/topic2/1': [],
+        }
+        mock_client.return_value.get_children_async.side_effect = \
+            lambda path: self._async_result(tree, path)
+        transactions = self._mock_transactions(mock_client)
+
+        with ZK(self.cluster_config) as zk:
+            # topic3 is not subscribed and skipped
+            zk.delete_topics('group1', ['topic1', 'topic2', 'topic3'])
+
+        transaction, = transactions
+        deleted = [args[0] for args, _ in transaction.delete.call_args_list]
+        assert sorted(deleted) == sorted(tree)
+        assert deleted.index('/consumers/group1/offsets/topic2/1') < \
+            deleted.index('/consumers/group1/offsets/topic2')
+
+    def test_wait_for_reassignment_no_pending(self, mock_client):
+        mock_client.return_value.exists.return_value = None
+        with ZK(self.cluster_config) as zk:
+            assert zk.wait_for_reassignment(timeout=0)
+
+    def test_wait_for_reassignment_pending(self, mock_client):
+        mock_client.return_value.exists.return_value = mock.sentinel.stat
+        with ZK(self.cluster_config) as zk:
+            assert not zk.wait_for_reassignment(timeout=0)
+            args, kwargs = mock_client.return_value.exists.call_args_list[0]
+            assert args == ('/admin/reassign_partitions',)
+            assert kwargs['watch'] is not None
+
+
+@mock.patch(
+    'kafka_utils.util.zookeeper.KazooClient',
+    autospec=True
+)
+class TestZKSessionRegistry(object):
+    cluster_config = ClusterConfig(
+        type='mytype',
+        name='some_cluster',
+        broker_list='some_list',
+        zookeeper='some_ip'
+    )
+    other_cluster_config = ClusterConfig(
+        type='mytype',
+        name='other_cluster',
+        broker_list='other_list',
+        zookeeper='other_ip'
+    )
+
+    def test_nested_zk_share_session(self, mock_client):
+        registry = ZKSessionRegistry()
+        with mock.patch(
+            'kafka_utils.util.zookeeper.session_registry',
+            registry,
+        ):
+            with ZK(self.cluster_config) as zk1:
+                with ZK(self.cluster_config) as zk2:
+                    assert zk1.zk is zk2.zk
+                assert not mock_client.return_value.stop.called
+            assert mock_client.call_count == 1
+            assert mock_client.return_value.start.call_count == 1
+            assert mock_client.return_value.stop.call_count == 1
+
+    def test_sessions_per_cluster(self, mock_client):
+        registry = ZKSessionRegistry()
+        registry.acquire(self.cluster_config)
+        registry.acquire(self.other_cluster_config)
+        assert mock_client.call_count == 2
+        registry.release(self.cluster_config)
+        registry.release(self.other_cluster_config)
+        assert mock_client.return_value.stop.call_count == 2
+
+    def test_hold_keeps_idle_sessions(self, mock_client):
+        registry = ZKSessionRegistry()
+        with registry.hold():
+            registry.acquire(self.cluster_config)
+            registry.release(self.cluster_config)
+            registry.acquire(self.cluster_config)
+            registry.release(self.cluster_config)
+            assert mock_client.call_count == 1
+            assert not mock_client.return_value.stop.called
+        assert mock_client.return_value.stop.call_count == 1
+
+    def test_hold_does_not_stop_referenced_sessions(self, mock_client):
+        registry = ZKSessionRegistry()
+        with registry.hold():
+            registry.acquire(self.cluster_config)
+        assert not mock_client.return_value.stop.called
+        registry.release(self.cluster_config)
+        assert mock_client.return_value.stop.call_count == 1